@@ -1,7 +1,6 @@
 import os
 import sys
 import json
-import xmltodict
 import sqlite3
 
 # 1. 环境初始化
@@ -17,6 +16,7 @@ try:
     # 🔥 引入 wxManager 的 SNS 核心模块 🔥
     import wxManager.db_v3.sns as sns_module 
     from wxManager.db_v3.sns import Sns
+    from wxManager.parser.sns_parser import parse_sns_xml
     
 except ImportError as e:
     print(json.dumps({"status": "error", "message": f"依赖缺失: {str(e)}"}))
@@ -25,47 +25,7 @@ except Exception as e:
     print(json.dumps({"status": "error", "message": f"初始化异常: {str(e)}"}))
     sys.exit(1)
 
-# 2. XML 解析 (用于处理正文里的图片/视频/文字)
-# wxManager 返回的只是 XML 字符串，我们需要转成前端能用的 JSON
-def parse_sns_xml(xml_str):
-    if not xml_str: return {"text": "", "media": []}
-    try:
-        # 清洗非法字符
-        clean_xml = "".join([c for c in xml_str if c == '\t' or c == '\n' or c == '\r' or c >= ' '])
-        
-        # 截取 TimelineObject
-        start = clean_xml.find("<TimelineObject")
-        if start != -1: clean_xml = clean_xml[start:]
-            
-        data = xmltodict.parse(clean_xml)
-        timeline = data.get('TimelineObject', {})
-        
-        text = timeline.get('ContentDesc', '') or timeline.get('contentDesc', '')
-        media_list = []
-        content_obj = timeline.get('ContentObject', {}) or timeline.get('contentObject', {})
-        
-        if content_obj and 'MediaList' in content_obj:
-            media_wrapper = content_obj['MediaList'].get('Media', [])
-            if isinstance(media_wrapper, dict): medias = [media_wrapper]
-            else: medias = media_wrapper
-            
-            for m in medias:
-                url_obj = m.get('Url', '')
-                url = url_obj.get('#text', '') if isinstance(url_obj, dict) else url_obj
-                thumb = m.get('Thumb', {}).get('#text', '') if isinstance(m.get('Thumb'), dict) else m.get('Thumb', '')
-                
-                type_code = m.get('Type', '0')
-                src = url if url else thumb
-                
-                if src:
-                    media_list.append({"type": "video" if type_code == '6' else "image", "src": src})
-                    
-        return {"text": text, "media": media_list}
-    except:
-        # 解析失败降级
-        return {"text": "", "media": []}
-
-# 3. 核心逻辑
+# 2. 核心逻辑
 def main():
     try:
         # --- A. 获取微信 Key ---
@@ -121,14 +81,9 @@ def main():
             # 2. 初始化 Sns 对象
             sns_driver = Sns()
             
-            # 3. 获取所有朋友圈 (get_feeds 内部会处理 Protobuf)
-            # 假设返回结构: [FeedId, CreateTime, StrTime, Type, UserName, Status, StringId, Content]
-            raw_feeds = sns_driver.get_feeds()
-            
-            # 限制数量，防止前端爆炸 (取最新的 500 条)
-            # 注意: get_feeds 返回的通常是按时间倒序的，直接切片即可
-            if raw_feeds and len(raw_feeds) > 500:
-                raw_feeds = raw_feeds[:500]
+            # 3. 获取最新的 500 条朋友圈，限制数量，防止前端爆炸
+            # 返回结构: [FeedId, CreateTime, StrTime, Type, UserName, Status, StringId, Content]，按时间倒序
+            raw_feeds = sns_driver.get_latest_feeds(num=500)
                 
             for item in raw_feeds:
                 try:
@@ -140,6 +95,10 @@ def main():
                     
                     # A. 解析正文
                     parsed_content = parse_sns_xml(xml_content)
+                    parsed_content = {
+                        "text": parsed_content["text"],
+                        "media": [{"type": m["type"], "src": m["url"]} for m in parsed_content["media"]]
+                    }
                     
                     # B. 解析互动 (调用 wxManager 的 get_comment)
                     # get_comment 会自动处理 Buffer 解析
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# 导入耗时基准：每个入口在全新的解释器里导入，模拟 sidecar 冷启动
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+TARGETS = {
+    # auto_bridge 实际用到的模块
+    "bridge": "from wxManager.decrypt import get_wx_info\n"
+              "from wxManager.decrypt.decrypt_v3 import decrypt_db_file_v3\n"
+              "from wxManager.db_v3.sns import Sns\n"
+              "from wxManager.parser.sns_parser import parse_sns_xml",
+    "package": "import wxManager",
+    "manager_v3": "from wxManager import DataBaseV3",
+    "manager_v4": "from wxManager import DataBaseV4",
+}
+
+
+def run_once(code):
+    # -X importtime 的输出在 stderr，最后一行是累计耗时最大的顶层导入
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=current_dir, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()
+        return None, error[-1] if error else "unknown error"
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            modules.append((int(parts[1]), parts[2].strip()))
+        except ValueError:
+            continue
+    return elapsed, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="wxManager 导入耗时基准")
+    parser.add_argument("targets", nargs="*", default=list(TARGETS), help="要测试的入口")
+    parser.add_argument("-n", "--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="列出累计耗时最多的模块数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args()
+
+    report = {}
+    for name in args.targets:
+        code = TARGETS.get(name, name)
+        times = []
+        modules = []
+        error = None
+        for _ in range(args.repeat):
+            elapsed, result = run_once(code)
+            if elapsed is None:
+                error = result
+                break
+            times.append(elapsed)
+            modules = result
+        if error:
+            report[name] = {"error": error}
+            continue
+        modules.sort(reverse=True)
+        report[name] = {
+            "median_ms": round(statistics.median(times) * 1000, 1),
+            "min_ms": round(min(times) * 1000, 1),
+            "modules": len(modules),
+            "top": [{"module": m, "cumulative_us": us} for us, m in modules[:args.top]],
+        }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    for name, item in report.items():
+        if "error" in item:
+            print(f"{name:<12} 导入失败: {item['error']}")
+            continue
+        print(f"{name:<12} 中位数 {item['median_ms']:>8.1f} ms  最小 {item['min_ms']:>8.1f} ms  模块数 {item['modules']}")
+        for top in item["top"]:
+            print(f"    {top['cumulative_us'] / 1000:>8.1f} ms  {top['module']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import tracemalloc
+
+import lz4.block
+
+# v3 CompressContent 解压基准：原来的 1024 倍缓冲区 vs lz4_block 按压缩比估计缓冲区
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+from wxManager.parser.util.lz4_block import decompress, decompress_rows  # noqa: E402
+
+APPMSG = (
+    '<?xml version="1.0"?>\n<msg><appmsg appid="" sdkver="0"><title>{title}</title>'
+    '<des>{des}</des><type>5</type><url>https://mp.weixin.qq.com/s/{token}</url>'
+    '<thumburl>https://mmbiz.qpic.cn/{token}/0</thumburl></appmsg>'
+    '<fromusername>wxid_{token}</fromusername><scene>0</scene><appinfo><version>1</version>'
+    '<appname></appname></appinfo><commenturl></commenturl></msg>'
+)
+
+
+def legacy_decompress(data):
+    # 原来 parser/wechat_v3.py 中的实现
+    if data is None:
+        return ""
+    if isinstance(data, str):
+        return data
+    if not isinstance(data, bytes):
+        return ""
+    try:
+        dst = lz4.block.decompress(data, uncompressed_size=len(data) << 10)
+        decoded_string = dst.decode().replace("\x00", "")
+    except:
+        return ""
+    return decoded_string
+
+
+def make_rows(num, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(num):
+        token = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(24))
+        xml = APPMSG.format(
+            title='链接标题' * rng.randint(1, 8),
+            des='摘要内容' * rng.randint(0, 40),
+            token=token,
+        )
+        data = lz4.block.compress(xml.encode() + b'\x00', store_size=False)
+        rows.append((i, None, 49, 5, 0, 0, 0, '', '', i, b'', data, ''))
+    return rows
+
+
+def requested_bytes(func, rows):
+    # 统计传给 lz4 的缓冲区大小总和，即实际申请的内存量
+    original = lz4.block.decompress
+    total = [0]
+
+    def counting(data, uncompressed_size=-1, **kwargs):
+        total[0] += uncompressed_size
+        return original(data, uncompressed_size=uncompressed_size, **kwargs)
+
+    lz4.block.decompress = counting
+    try:
+        func(rows)
+    finally:
+        lz4.block.decompress = original
+    return total[0]
+
+
+def measure(func, rows, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 1),
+        "min_ms": round(min(times) * 1000, 1),
+        "peak_kib": round(peak / 1024, 1),
+        "requested_mib": round(requested_bytes(func, rows) / 1024 / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CompressContent 解压基准")
+    parser.add_argument("-r", "--rows", type=int, default=20000)
+    parser.add_argument("-n", "--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    legacy = [legacy_decompress(row[11]) for row in rows]
+    if decompress_rows(rows) != legacy:
+        print("解压结果与原实现不一致")
+        sys.exit(1)
+    report = {
+        "legacy": measure(lambda items: [legacy_decompress(row[11]) for row in items], rows, args.repeat),
+        "lz4_block": measure(lambda items: [decompress(row[11]) for row in items], rows, args.repeat),
+        "lz4_block_rows": measure(decompress_rows, rows, args.repeat),
+    }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"{args.rows} 行 appmsg")
+    for name, item in report.items():
+        print(f"{name:<16} 中位数 {item['median_ms']:>8.1f} ms  最小 {item['min_ms']:>8.1f} ms  "
+              f"峰值内存 {item['peak_kib']:>10.1f} KiB  申请缓冲区 {item['requested_mib']:>10.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
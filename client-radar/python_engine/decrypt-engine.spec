@@ -6,7 +6,8 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('wxManager/decrypt/version_list.json', 'wxManager/decrypt')],
-    hiddenimports=[],
+    # audio_transcoder 在 try 中导入 lameenc，显式列出保证打包进去，语音不必为每条消息启动 ffmpeg
+    hiddenimports=['lameenc'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+
+# 同步本机所有登录的微信账号：key 校验 → 解密 → 建索引 → 导出，各账号共用一个进程池并行执行
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from wxManager.sync_scheduler import (collect_accounts, export_sessions, SyncScheduler, DEFAULT_INFLIGHT_BYTES,
+                                      DEFAULT_PER_ACCOUNT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多账号并行同步")
+    parser.add_argument("-o", "--output", default=os.path.join(os.path.expanduser("~"), ".client-radar", "decrypted"),
+                        help="输出目录，每个账号在 <output>/<wxid> 下")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="进程池大小，默认为 cpu 核数")
+    parser.add_argument("--inflight-mb", type=int, default=DEFAULT_INFLIGHT_BYTES // (1024 * 1024),
+                        help="同时解密的源文件总大小上限 (MiB)")
+    parser.add_argument("--per-account", type=int, default=DEFAULT_PER_ACCOUNT, help="每个账号同时运行的任务数")
+    parser.add_argument("--no-export", action="store_true", help="跳过导出会话列表")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    parser.add_argument("--in-memory", action="store_true", help="联系人、会话数据库只解密到内存，不在磁盘上留下明文")
+    args = parser.parse_args()
+
+    json_path = os.path.join(current_dir, "wxManager", "decrypt", "version_list.json")
+    with open(json_path, "r", encoding="utf-8") as f:
+        version_list = json.load(f)
+    accounts = collect_accounts(version_list)
+    if not accounts:
+        if args.json:
+            print(json.dumps({"status": "error", "message": "未登录微信"}, ensure_ascii=False))
+        else:
+            print("未检测到登录的微信")
+        return
+
+    def on_status(status):
+        if not args.json:
+            print(f"{status.wxid or '-':<24} {status.stage:<8} {status.state:<8} "
+                  f"{status.files_done}/{status.files_total} {status.error}")
+
+    scheduler = SyncScheduler(
+        args.output,
+        max_workers=args.workers,
+        max_inflight_bytes=args.inflight_mb * 1024 * 1024,
+        per_account=args.per_account,
+        exporter=None if args.no_export else export_sessions,
+        on_status=on_status,
+        in_memory=args.in_memory,
+    )
+    for info in accounts:
+        scheduler.add_account(info)
+    statuses = scheduler.run()
+
+    if args.json:
+        print(json.dumps({"status": "success", "accounts": statuses}, ensure_ascii=False))
+        return
+    for item in statuses:
+        seconds = sum(item["stage_seconds"].values())
+        print(f"{item['wxid'] or '-':<24} {item['state']:<8} 用时 {seconds:.1f} s  "
+              f"失败文件 {len(item['files_failed'])}  {item['error']}")
+
+
+if __name__ == "__main__":
+    # 进程池和 key 校验会启动子进程，打包后的程序需要 freeze_support，否则子进程会重新执行整个程序
+    multiprocessing.freeze_support()
+    main()
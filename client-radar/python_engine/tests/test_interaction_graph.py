@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/20 5:50
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-test_interaction_graph.py
+@Description : 互动关系图的增量合并和按水位线同步
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wxManager.interaction_graph import COMMENT_TYPE_COMMENT, COMMENT_TYPE_LIKE, InteractionGraph
+
+
+class FakeSns:
+    """按 Sns.get_interactions 的语义过滤内存中的互动"""
+
+    def __init__(self):
+        self.rows = []
+
+    def get_interactions(self, start_time=0, end_time=None):
+        return [row for row in self.rows
+                if row[2] >= start_time and (end_time is None or row[2] <= end_time)]
+
+
+def test_compact_matches_rebuild():
+    rng = random.Random(1)
+    incremental = InteractionGraph(epoch=0)
+    edges = []
+    for batch in range(20):
+        for _ in range(30):
+            src, dst = f'wxid_{rng.randrange(40 + batch)}', f'wxid_{rng.randrange(40 + batch)}'
+            weight = rng.choice([1.0, 2.0, 3.0])
+            edges.append((src, dst, weight))
+            incremental.add_interaction(src, dst, weight, 0)
+        incremental.compact()
+    full = InteractionGraph(epoch=0)
+    for src, dst, weight in edges:
+        full.add_interaction(src, dst, weight, 0)
+    assert incremental.nodes == full.nodes
+    for wxid in full.nodes:
+        for direction in ('in', 'out'):
+            assert (sorted(incremental.top_interactors(wxid, 100, direction)) ==
+                    sorted(full.top_interactors(wxid, 100, direction)))
+        assert incremental.mutual_interactions(wxid) == full.mutual_interactions(wxid)
+        for other in full.nodes:
+            assert incremental.weight(wxid, other) == full.weight(wxid, other)
+
+
+def test_top_interactors_order():
+    graph = InteractionGraph(epoch=0)
+    graph.add_interaction('a', 'me', 1.0, 0)
+    graph.add_interaction('b', 'me', 3.0, 0)
+    graph.compact()
+    graph.add_interaction('c', 'me', 2.0, 0)
+    assert graph.top_interactors('me', 2) == [('b', 3.0), ('c', 2.0)]
+
+
+def test_sync_sns_same_second():
+    sns = FakeSns()
+    graph = InteractionGraph(epoch=0)
+    sns.rows.append((1, 'author', 100, COMMENT_TYPE_LIKE, 'a', ''))
+    graph.sync_sns(sns)
+    # 同一秒稍后写入的互动
+    sns.rows.append((1, 'author', 100, COMMENT_TYPE_COMMENT, 'b', ''))
+    sns.rows.append((1, 'author', 100, COMMENT_TYPE_LIKE, 'c', ''))
+    graph.sync_sns(sns)
+    graph.sync_sns(sns)
+    assert graph.weight('a', 'author') == 1.0
+    assert graph.weight('b', 'author') == 3.0
+    assert graph.weight('c', 'author') == 1.0
+    sns.rows.append((2, 'author', 101, COMMENT_TYPE_LIKE, 'a', ''))
+    graph.sync_sns(sns)
+    assert graph.weight('a', 'author') == 2.0
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/20 5:30
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-test_key_verifier.py
+@Description : 找到 key 后立即返回，不等内存扫描产生下一个候选
+"""
+import hashlib
+import hmac
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wxManager.decrypt.key_verifier import (KEY_SIZE, PAGE_SIZE, ROUND_COUNT_V3, SALT_SIZE, KeyVerifier, check_key_v3,
+                                            clear_cache)
+
+SCAN_STALL = 3
+
+
+def make_first_page(key: bytes) -> bytes:
+    """按 v3 的格式给第一页算上 HMAC"""
+    salt = os.urandom(SALT_SIZE)
+    byte_key = hashlib.pbkdf2_hmac('sha1', key, salt, ROUND_COUNT_V3, KEY_SIZE)
+    mac_key = hashlib.pbkdf2_hmac('sha1', byte_key, bytes(x ^ 0x3a for x in salt), 2, KEY_SIZE)
+    first = bytearray(os.urandom(PAGE_SIZE - SALT_SIZE))
+    mac = hmac.new(mac_key, first[:-32], hashlib.sha1)
+    mac.update(b'\x01\x00\x00\x00')
+    first[-32:-12] = mac.digest()
+    return salt + bytes(first)
+
+
+@pytest.fixture
+def key():
+    clear_cache()
+    yield os.urandom(KEY_SIZE)
+    clear_cache()
+
+
+def stalled_scan(key):
+    """前面几个候选里就有 key，之后扫描很久才产生下一个"""
+    yield os.urandom(KEY_SIZE), 1
+    yield key, 0
+    yield os.urandom(KEY_SIZE), 2
+    time.sleep(SCAN_STALL)
+    yield os.urandom(KEY_SIZE), 3
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_returns_without_waiting_for_scan(key, processes):
+    buf = make_first_page(key)
+    start = time.time()
+    assert KeyVerifier(check_key_v3, processes).verify(stalled_scan(key), buf) == key
+    assert time.time() - start < SCAN_STALL / 2
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_exhausted_scan(key, processes):
+    buf = make_first_page(key)
+    candidates = [(os.urandom(KEY_SIZE), i) for i in range(5)]
+    verifier = KeyVerifier(check_key_v3, processes)
+    assert verifier.verify(iter(candidates), buf) is None
+    assert verifier.checked == len(candidates)
+    # 已经校验失败的候选不再校验
+    assert verifier.verify(iter(candidates + [(key, 9)]), buf) == key
+    assert verifier.checked == len(candidates) + 1
+
+
+def test_lowest_score_first(key):
+    buf = make_first_page(key)
+    candidates = [(os.urandom(KEY_SIZE), 5) for _ in range(10)] + [(key, 0)]
+    verifier = KeyVerifier(check_key_v3, processes=1)
+    assert verifier.verify(iter(candidates), buf) == key
+    assert verifier.checked == 1
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/20 4:20
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-test_query_builder.py
+@Description : 按时间范围查询聊天记录、朋友圈时 EXPLAIN QUERY PLAN 中不能有全表扫描
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wxManager.db_v3.msg import Msg
+from wxManager.db_v3.sns import Sns
+from wxManager.query_builder import Query, ensure_index, full_scans
+
+TIME_RANGE = ('2024-01-01 00:00:00', '2024-12-31 23:59:59')
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        create table MSG(localId INTEGER PRIMARY KEY AUTOINCREMENT, TalkerId INT, MsgSvrID INT, Type INT, SubType INT,
+                         IsSender INT, CreateTime INT, Sequence INT, StatusEx INT, FlagEx INT, Status INT,
+                         MsgServerSeq INT, MsgSequence INT, StrTalker TEXT, StrContent TEXT, DisplayContent TEXT,
+                         Reserved0 INT, Reserved1 INT, Reserved2 INT, Reserved3 INT, Reserved4 TEXT, Reserved5 TEXT,
+                         Reserved6 TEXT, CompressContent BLOB, BytesExtra BLOB, BytesTrans BLOB)
+    ''')
+    conn.execute('''
+        create table FeedsV20(FeedId INTEGER PRIMARY KEY, CreateTime INT, FaultId INT, Type INT, UserName TEXT,
+                              Status INT, ExtFlag INT, PrivFlag INT, StringId TEXT, Content TEXT)
+    ''')
+    conn.executemany(
+        'insert into MSG(StrTalker, CreateTime, StrContent) values(?, ?, ?)',
+        [(f'wxid_{i % 50}', 1700000000 + i * 60, 'hi') for i in range(5000)]
+    )
+    conn.executemany(
+        'insert into FeedsV20(CreateTime, UserName, Content) values(?, ?, ?)',
+        [(1700000000 + i * 3600, f'wxid_{i % 50}', '') for i in range(2000)]
+    )
+    assert ensure_index(conn, 'MSG', ('StrTalker', 'CreateTime'))
+    assert ensure_index(conn, 'FeedsV20', ('UserName', 'CreateTime'))
+    assert ensure_index(conn, 'FeedsV20', ('CreateTime',))
+    conn.execute('ANALYZE')
+    yield conn
+    conn.close()
+
+
+def test_ensure_index_reuses_existing(conn):
+    count = conn.execute("select count(*) from sqlite_master where type='index' and tbl_name='MSG'").fetchone()[0]
+    assert ensure_index(conn, 'MSG', ('StrTalker', 'CreateTime'))
+    assert ensure_index(conn, 'MSG', ('StrTalker',))
+    assert conn.execute("select count(*) from sqlite_master where type='index' and tbl_name='MSG'").fetchone()[0] == count
+
+
+def test_messages_by_username_time_range(conn):
+    sql, params = (Query(Msg.columns, 'MSG')
+                   .where('StrTalker = ?', 'wxid_1')
+                   .time_range('CreateTime', TIME_RANGE)
+                   .order_by('CreateTime')
+                   .build())
+    assert full_scans(conn, sql, params) == []
+
+
+def test_feeds_time_range(conn):
+    sql, params = (Query(Sns.columns, 'FeedsV20')
+                   .time_range('CreateTime', TIME_RANGE)
+                   .order_by('CreateTime')
+                   .build())
+    assert full_scans(conn, sql, params) == []
+
+
+def test_feeds_by_username_time_range(conn):
+    sql, params = (Query(Sns.columns, 'FeedsV20')
+                   .where('UserName = ?', 'wxid_1')
+                   .time_range('CreateTime', TIME_RANGE)
+                   .order_by('CreateTime')
+                   .build())
+    assert full_scans(conn, sql, params) == []
+
+
+def test_full_scans_reports_unindexed_query(conn):
+    sql, params = Query(Msg.columns, 'MSG').where('StrContent = ?', 'hi').build()
+    assert full_scans(conn, sql, params)
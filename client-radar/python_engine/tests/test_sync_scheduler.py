@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/20 5:10
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-test_sync_scheduler.py
+@Description : 同一个账号的多个数据库文件要在进程池中并行解密
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wxManager import sync_scheduler
+from wxManager.sync_scheduler import STATE_DONE, SyncScheduler
+
+FILES = 8
+DECRYPT_SECONDS = 0.3
+
+
+class Concurrency:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def decrypt_file(self, db_version, key, src_path, dest_path):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(DECRYPT_SECONDS)
+        with self.lock:
+            self.running -= 1
+        return True
+
+
+@pytest.fixture
+def concurrency(monkeypatch):
+    # 任务函数替换成桩，线程池代替进程池，桩函数不需要能被 pickle
+    concurrency = Concurrency()
+    monkeypatch.setattr(sync_scheduler, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(sync_scheduler, 'check_key', lambda db_version, key, db_path: True)
+    monkeypatch.setattr(sync_scheduler, 'build_indexes', lambda db_version, db_dir: None)
+    monkeypatch.setattr(sync_scheduler, 'decrypt_file', concurrency.decrypt_file)
+    return concurrency
+
+
+def add_account(scheduler, tmp_path, wxid):
+    src_dir = tmp_path / wxid / 'Msg'
+    os.makedirs(src_dir)
+    for i in range(FILES):
+        (src_dir / f'MSG{i}.db').write_bytes(bytes(4096))
+    scheduler.add_account({'wxid': wxid, 'key': '11' * 32, 'wx_dir': str(tmp_path / wxid), 'db_version': 3,
+                           'errcode': 200})
+
+
+def test_one_account_decrypts_in_parallel(tmp_path, concurrency):
+    scheduler = SyncScheduler(str(tmp_path / 'out'), max_workers=8, per_account=4, exporter=None)
+    add_account(scheduler, tmp_path, 'wxid_a')
+    start = time.time()
+    statuses = scheduler.run()
+    assert statuses[0]['state'] == STATE_DONE
+    assert statuses[0]['files_done'] == FILES
+    assert concurrency.peak == 4
+    assert time.time() - start < FILES * DECRYPT_SECONDS / 2
+
+
+def test_accounts_share_pool(tmp_path, concurrency):
+    scheduler = SyncScheduler(str(tmp_path / 'out'), max_workers=6, per_account=4, exporter=None)
+    add_account(scheduler, tmp_path, 'wxid_a')
+    add_account(scheduler, tmp_path, 'wxid_b')
+    statuses = scheduler.run()
+    assert [status['state'] for status in statuses] == [STATE_DONE, STATE_DONE]
+    assert concurrency.peak == 6
+
+
+def test_inflight_bytes_limit(tmp_path, concurrency):
+    scheduler = SyncScheduler(str(tmp_path / 'out'), max_workers=8, per_account=8, exporter=None,
+                              max_inflight_bytes=2 * 4096)
+    add_account(scheduler, tmp_path, 'wxid_a')
+    statuses = scheduler.run()
+    assert statuses[0]['state'] == STATE_DONE
+    assert concurrency.peak == 2
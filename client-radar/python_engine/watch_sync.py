@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+
+# 持续同步：监控所有登录账号的数据库目录，有写入就增量解密、合并、更新索引，每次同步输出一行 JSON
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from wxManager.sync_scheduler import collect_accounts
+from wxManager.sync_watcher import SyncDaemon, DEFAULT_QUIET, DEFAULT_MAX_DELAY, DEFAULT_INTERVAL
+
+
+# 标准输出只用来输出同步结果，每行一个 JSON；其他 print 改到标准错误，免得混进结果里
+report_stream = sys.stdout
+
+
+def print_report(report):
+    report_stream.write(json.dumps(report, ensure_ascii=False) + '\n')
+    report_stream.flush()
+
+
+def watch_account(info, output_dir, args):
+    # 每个账号一个进程，Me() 等全局状态互不影响
+    sys.stdout = sys.stderr
+    daemon = SyncDaemon(info, output_dir, quiet=args.quiet, max_delay=args.max_delay, interval=args.interval,
+                        polling=args.polling, on_sync=print_report, in_memory=args.in_memory)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="监控微信数据库并持续增量同步")
+    parser.add_argument("-o", "--output", default=os.path.join(os.path.expanduser("~"), ".client-radar", "decrypted"),
+                        help="输出目录，每个账号在 <output>/<wxid> 下")
+    parser.add_argument("--quiet", type=float, default=DEFAULT_QUIET, help="最后一次写入后等待的秒数")
+    parser.add_argument("--max-delay", type=float, default=DEFAULT_MAX_DELAY, help="持续写入时最多等待的秒数")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="轮询间隔（不能使用 inotify 时）")
+    parser.add_argument("--polling", action="store_true", help="强制使用轮询")
+    parser.add_argument("--in-memory", action="store_true", help="联系人、会话数据库只解密到内存，不在磁盘上留下明文")
+    args = parser.parse_args()
+
+    json_path = os.path.join(current_dir, "wxManager", "decrypt", "version_list.json")
+    with open(json_path, "r", encoding="utf-8") as f:
+        version_list = json.load(f)
+    accounts = [info for info in collect_accounts(version_list)
+                if info.get('errcode') == 200 and info.get('wxid') and info.get('key') not in ('', 'None', None)]
+    if not accounts:
+        print(json.dumps({"status": "error", "message": "未登录微信"}, ensure_ascii=False))
+        return
+
+    processes = [
+        multiprocessing.Process(target=watch_account, args=(info, os.path.join(args.output, info['wxid']), args))
+        for info in accounts
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -7,14 +7,38 @@
 @Version : Python3.10
 @comment : ···
 """
+from typing import TYPE_CHECKING
+
 from .log import logger
 from .model import Me, MessageType, Message, Person, Contact, TextMessage, ImageMessage
-from .db_main import DataBaseInterface
-from .manager_v4 import DataBaseV4
-from .manager_v3 import DataBaseV3
+
+if TYPE_CHECKING:
+    from .db_main import DataBaseInterface
 
 __version__ = '3.0.0'
 
+# manager_v3/manager_v4 会连带导入 zstandard、protobuf、全部数据库模块和消息解析器，
+# 只用到解密或朋友圈的入口（如 auto_bridge）不需要这些，改为首次访问时再导入
+_LAZY_ATTRS = ('DataBaseInterface', 'DataBaseV4', 'DataBaseV3')
+
+
+def __getattr__(name):
+    # 显式写出 import 语句而不是 importlib，PyInstaller 才能分析到依赖
+    if name == 'DataBaseInterface':
+        from .db_main import DataBaseInterface as value
+    elif name == 'DataBaseV4':
+        from .manager_v4 import DataBaseV4 as value
+    elif name == 'DataBaseV3':
+        from .manager_v3 import DataBaseV3 as value
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRS))
+
 
 class DatabaseConnection:
     def __init__(self, db_dir, db_version=4):
@@ -22,10 +46,12 @@ class DatabaseConnection:
         self.db_version = db_version
         self.database_interface = self._initialize_database()
 
-    def _initialize_database(self) -> DataBaseInterface:
+    def _initialize_database(self) -> 'DataBaseInterface':
         if self.db_version == 4:
+            from .manager_v4 import DataBaseV4
             database0 = DataBaseV4()
         else:
+            from .manager_v3 import DataBaseV3
             database0 = DataBaseV3()
         if database0.init_database(self.db_dir):
             return database0
@@ -33,7 +59,7 @@ class DatabaseConnection:
             logger.error(f'数据库初始化失败, 请检查路径或数据库版本是否正确, db_dir:{self.db_dir},db_version:{self.db_version}')
             return None
 
-    def get_interface(self) -> DataBaseInterface:
+    def get_interface(self) -> 'DataBaseInterface':
         return self._initialize_database()
 
 
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 22:05
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-audio_transcoder.py
+@Description : 语音 silk -> mp3 批量转码
+
+    - silk 在内存中解码成 pcm，不再写 .silk/.pcm 临时文件
+    - 安装了 lameenc 时在进程内编码 mp3；否则通过管道把 pcm 交给 ffmpeg，不经过 shell
+    - 转码结果按 server_id 缓存在 cache_dir 中，同一条语音再次导出时直接复制
+    - 批量转码使用进程池，解码和编码都在子进程中完成
+"""
+import os
+import shutil
+import subprocess
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Tuple
+
+from wxManager.log import logger
+
+try:
+    import pysilk
+except ImportError:
+    pysilk = None
+
+try:
+    import lameenc
+except ImportError:
+    lameenc = None
+
+SAMPLE_RATE = 44100
+BIT_RATE = 128  # 与 ffmpeg libmp3lame 的默认码率一致
+MAX_WORKERS = min(os.cpu_count() or 1, 8)
+
+
+def get_ffmpeg_path() -> str:
+    """
+    依次查找打包后的资源目录、源码运行目录下的 ffmpeg.exe，以及 PATH 中的 ffmpeg
+    @return: 找不到时返回空字符串
+    """
+    resource_dir = getattr(sys, '_MEIPASS', os.path.abspath(os.path.dirname(__file__)))
+    for path in [
+        os.path.join(resource_dir, 'app', 'resources', 'data', 'ffmpeg.exe'),
+        os.path.join(os.getcwd(), 'app', 'resources', 'data', 'ffmpeg.exe'),
+    ]:
+        if os.path.exists(path):
+            return path
+    return shutil.which('ffmpeg') or ''
+
+
+def silk_to_pcm(silk_data: bytes, sample_rate=SAMPLE_RATE) -> bytes:
+    """
+    @param silk_data: 数据库中的语音数据
+    @param sample_rate:
+    @return: 16 位单声道 pcm
+    """
+    if pysilk is None:
+        raise RuntimeError('未安装 pysilk-mod')
+    return pysilk.decode(silk_data, sample_rate=sample_rate)
+
+
+def pcm_to_mp3(pcm: bytes, mp3_path, sample_rate=SAMPLE_RATE) -> bool:
+    """
+    先写到临时文件再改名，中途失败不会留下半个 mp3
+    @param pcm: 16 位单声道 pcm
+    @param mp3_path:
+    @param sample_rate:
+    @return: 是否成功
+    """
+    tmp_path = mp3_path + '.tmp'
+    if lameenc is not None:
+        encoder = lameenc.Encoder()
+        encoder.set_bit_rate(BIT_RATE)
+        encoder.set_in_sample_rate(sample_rate)
+        encoder.set_channels(1)
+        encoder.set_quality(2)
+        data = encoder.encode(pcm) + encoder.flush()
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+    else:
+        ffmpeg_path = get_ffmpeg_path()
+        if not ffmpeg_path:
+            logger.error('找不到 ffmpeg，无法转换语音')
+            return False
+        cmd = [ffmpeg_path, '-loglevel', 'quiet', '-y', '-f', 's16le', '-ar', str(sample_rate), '-ac', '1',
+               '-i', 'pipe:0', '-f', 'mp3', tmp_path]
+        result = subprocess.run(cmd, input=pcm, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if result.returncode != 0 or not os.path.exists(tmp_path):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+    os.replace(tmp_path, mp3_path)
+    return True
+
+
+def transcode(silk_data: bytes, mp3_path, sample_rate=SAMPLE_RATE) -> str:
+    """
+    单条语音转码，进程池的工作函数
+    @return: 成功时返回 mp3_path，否则返回空字符串
+    """
+    try:
+        if pcm_to_mp3(silk_to_pcm(silk_data, sample_rate), mp3_path, sample_rate):
+            return mp3_path
+    except Exception:
+        logger.error(f'语音转换错误 {mp3_path}\n{traceback.format_exc()}')
+    return ''
+
+
+def _copy(src, dst):
+    """缓存与导出目录在同一个磁盘时用硬链接，否则复制"""
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class AudioTranscoder:
+    """
+    使用示例：
+    transcoder = AudioTranscoder(cache_dir)
+    results = transcoder.transcode_batch(items, media_db.get_media_buffers)
+    """
+
+    def __init__(self, cache_dir='', max_workers=MAX_WORKERS):
+        """
+        @param cache_dir: 按 server_id 保存转码结果的目录，为空时不缓存
+        @param max_workers: 进程数
+        """
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+
+    def cache_path(self, server_id) -> str:
+        if not self.cache_dir:
+            return ''
+        return os.path.join(self.cache_dir, f'{server_id}.mp3')
+
+    def _from_cache(self, server_id, mp3_path) -> bool:
+        cache_path = self.cache_path(server_id)
+        if not cache_path or not os.path.exists(cache_path):
+            return False
+        try:
+            _copy(cache_path, mp3_path)
+            return True
+        except OSError:
+            logger.error(f'语音缓存复制失败: {cache_path}')
+            return False
+
+    def _to_cache(self, server_id, mp3_path):
+        cache_path = self.cache_path(server_id)
+        if not cache_path or os.path.exists(cache_path):
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            _copy(mp3_path, cache_path)
+        except OSError:
+            logger.error(f'语音缓存写入失败: {cache_path}')
+
+    def transcode(self, server_id, silk_data: bytes, mp3_path) -> str:
+        """
+        在当前进程中转码一条语音
+        @param server_id: 缓存键
+        @param silk_data: 为空时只查缓存
+        @param mp3_path:
+        @return: mp3 路径，失败时返回空字符串
+        """
+        if os.path.exists(mp3_path) or self._from_cache(server_id, mp3_path):
+            return mp3_path
+        if not silk_data:
+            return ''
+        if transcode(silk_data, mp3_path):
+            self._to_cache(server_id, mp3_path)
+            return mp3_path
+        return ''
+
+    def transcode_batch(self, items: Iterable[Tuple[object, str]], get_buffers) -> Dict[object, str]:
+        """
+        批量转码，已导出或已缓存的语音不会读取语音数据
+        @param items: (server_id, mp3_path)
+        @param get_buffers: 函数，参数为 server_id 列表，返回 {server_id: silk_data}
+        @return: {server_id: mp3 路径}，失败的为空字符串
+        """
+        results = {}
+        pending = {}
+        for server_id, mp3_path in items:
+            if os.path.exists(mp3_path) or self._from_cache(server_id, mp3_path):
+                results[server_id] = mp3_path
+            else:
+                pending[server_id] = mp3_path
+        if not pending:
+            return results
+        buffers = get_buffers(list(pending))
+        for server_id in pending:
+            if not buffers.get(server_id):
+                results[server_id] = ''
+        jobs = [(server_id, mp3_path) for server_id, mp3_path in pending.items() if buffers.get(server_id)]
+        if len(jobs) <= 1 or self.max_workers <= 1:
+            for server_id, mp3_path in jobs:
+                results[server_id] = self.transcode(server_id, buffers[server_id], mp3_path)
+            return results
+        with ProcessPoolExecutor(max_workers=min(len(jobs), self.max_workers)) as executor:
+            futures = {
+                executor.submit(transcode, buffers.pop(server_id), mp3_path): server_id
+                for server_id, mp3_path in jobs
+            }
+            for future in as_completed(futures):
+                server_id = futures[future]
+                try:
+                    mp3_path = future.result()
+                except Exception:
+                    logger.error(f'语音转换进程异常\n{traceback.format_exc()}')
+                    mp3_path = ''
+                if mp3_path:
+                    self._to_cache(server_id, mp3_path)
+                results[server_id] = mp3_path
+        return results
+
+
+if __name__ == '__main__':
+    pass
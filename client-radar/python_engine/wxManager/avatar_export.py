@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 23:40
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-avatar_export.py
+@Description : 批量导出联系人头像
+
+    - 头像表（v4 head_image、v3 ContactHeadImg1）只顺序扫描一遍，分批读取，不必每个联系人查询一次
+    - 按 md5 去重，相同的头像只写一个文件 <md5>.<ext>，文件已存在时跳过
+    - 文件由线程池写入
+    - 可选：用 Pillow 在进程池中把头像拼成若干张精灵图，前端一次请求即可显示几百个头像
+
+输出目录：
+    avatars/<md5>.<ext>
+    avatars.json                        {username: 'avatars/<md5>.<ext>'}
+    sprites/sprite_<n>.jpg              可选
+    sprites.json                        {'tile': 64, 'sheets': [...], 'avatars': {username: [sheet, x, y]}}
+"""
+import hashlib
+import json
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+from wxManager.log import logger
+from wxManager.parser.file_parser import get_image_type
+
+AVATAR_DIR = 'avatars'
+SPRITE_DIR = 'sprites'
+INDEX_FILE = 'avatars.json'
+SPRITE_INDEX_FILE = 'sprites.json'
+
+TILE_SIZE = 64
+SPRITE_COLUMNS = 16
+SPRITE_ROWS = 16
+
+
+def _write_file(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def build_sprite(sprite_path, image_paths: List[str], tile=TILE_SIZE, columns=SPRITE_COLUMNS) -> List[int]:
+    """
+    把若干张头像按行拼成一张图，进程池的工作函数
+    @param sprite_path: 输出路径
+    @param image_paths: 头像文件，第 i 张放在 (i % columns, i // columns) 格
+    @param tile: 每格的边长
+    @param columns: 每行的格数
+    @return: 成功放入的头像序号，损坏的图片留空
+    """
+    from PIL import Image
+
+    rows = (len(image_paths) + columns - 1) // columns
+    sheet = Image.new('RGB', (tile * min(columns, len(image_paths)), tile * rows), (255, 255, 255))
+    placed = []
+    for i, image_path in enumerate(image_paths):
+        try:
+            with Image.open(image_path) as img:
+                img = img.convert('RGB').resize((tile, tile))
+                sheet.paste(img, ((i % columns) * tile, (i // columns) * tile))
+            placed.append(i)
+        except Exception:
+            logger.error(f'头像无法解析: {image_path}')
+    sheet.save(sprite_path + '.tmp', format='JPEG', quality=85)
+    os.replace(sprite_path + '.tmp', sprite_path)
+    return placed
+
+
+class AvatarExporter:
+    """
+    使用示例：
+    exporter = AvatarExporter(output_dir)
+    index = exporter.export(head_image_db.iter_avatars())
+    exporter.build_sprites(index)
+    """
+
+    def __init__(self, output_dir, max_workers=8):
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+
+    def export(self, avatars: Iterable[Tuple[str, str, bytes]]) -> Dict[str, str]:
+        """
+        @param avatars: (username, md5, image_buffer)，md5 为空时按内容计算
+        @return: {username: 相对 output_dir 的文件路径}，同时写入 avatars.json
+        """
+        avatar_dir = os.path.join(self.output_dir, AVATAR_DIR)
+        os.makedirs(avatar_dir, exist_ok=True)
+        index = {}
+        files = {}  # md5 -> 相对路径
+        written = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = []
+            for username, md5, buf in avatars:
+                if not buf:
+                    continue
+                md5 = md5 or hashlib.md5(buf).hexdigest()
+                file_name = files.get(md5)
+                if file_name is None:
+                    file_name = f'{AVATAR_DIR}/{md5}.{get_image_type(buf[:12])}'
+                    files[md5] = file_name
+                    path = os.path.join(self.output_dir, file_name)
+                    if not os.path.exists(path):
+                        futures.append(executor.submit(_write_file, path, buf))
+                        written += 1
+                index[username] = file_name
+            for future in futures:
+                try:
+                    future.result()
+                except OSError:
+                    logger.error(f'头像写入失败\n{traceback.format_exc()}')
+        _write_json(os.path.join(self.output_dir, INDEX_FILE), index)
+        logger.info(f'导出头像 {len(index)} 个，去重后 {len(files)} 个文件，新写入 {written} 个')
+        return index
+
+    def build_sprites(self, index: Dict[str, str], tile=TILE_SIZE, columns=SPRITE_COLUMNS,
+                      rows=SPRITE_ROWS) -> dict:
+        """
+        把 export 导出的头像拼成精灵图，每张最多 columns * rows 个头像，多张图在进程池中并行生成
+        @param index: export 的返回值
+        @return: 精灵图索引，同时写入 sprites.json
+        """
+        sprite_dir = os.path.join(self.output_dir, SPRITE_DIR)
+        os.makedirs(sprite_dir, exist_ok=True)
+        file_names = sorted(set(index.values()))
+        per_sheet = columns * rows
+        chunks = [file_names[i:i + per_sheet] for i in range(0, len(file_names), per_sheet)]
+        sheets = [f'{SPRITE_DIR}/sprite_{n}.jpg' for n in range(len(chunks))]
+        positions = {}  # 相对路径 -> [sheet, x, y]
+        if chunks:
+            with ProcessPoolExecutor(max_workers=min(len(chunks), self.max_workers)) as executor:
+                futures = [
+                    executor.submit(build_sprite, os.path.join(self.output_dir, sheet),
+                                    [os.path.join(self.output_dir, name) for name in chunk], tile, columns)
+                    for sheet, chunk in zip(sheets, chunks)
+                ]
+                for n, (future, chunk) in enumerate(zip(futures, chunks)):
+                    try:
+                        placed = future.result()
+                    except Exception:
+                        logger.error(f'精灵图生成失败: {sheets[n]}\n{traceback.format_exc()}')
+                        continue
+                    for i in placed:
+                        positions[chunk[i]] = [n, (i % columns) * tile, (i // columns) * tile]
+        sprite_index = {
+            'tile': tile,
+            'sheets': sheets,
+            'avatars': {username: positions[name] for username, name in index.items() if name in positions},
+        }
+        _write_json(os.path.join(self.output_dir, SPRITE_INDEX_FILE), sprite_index)
+        return sprite_index
+
+
+def export_avatars(avatars: Iterable[Tuple[str, str, bytes]], output_dir, sprite=False) -> dict:
+    """
+    @param avatars: HeadImageDB.iter_avatars() / Misc.iter_avatars()
+    @param output_dir:
+    @param sprite: 是否生成精灵图
+    @return: {'avatars': {username: 文件}, 'sprites': 精灵图索引或 None}
+    """
+    exporter = AvatarExporter(output_dir)
+    index = exporter.export(avatars)
+    return {
+        'avatars': index,
+        'sprites': exporter.build_sprites(index) if sprite else None,
+    }
+
+
+if __name__ == '__main__':
+    pass
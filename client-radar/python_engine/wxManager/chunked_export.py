@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 13:40
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-chunked_export.py
+@Description : 分块、zstd 压缩的 JSONL 导出格式
+
+导出目录结构：
+    manifest.json             清单，包含每个分块的文件名、条数、时间范围，以及导出是否完整
+    part-00000.jsonl.zst      每行一条 JSON 记录
+    part-00001.jsonl.zst
+    ...
+读取方只需先加载 manifest.json，再按时间范围挑选需要的分块解压即可
+"""
+import json
+import os
+from typing import Iterator
+
+import zstandard as zstd
+
+MANIFEST_NAME = 'manifest.json'
+FORMAT_VERSION = 1
+
+
+class ChunkedJsonlWriter:
+    """
+    流式写入，内存中只保留当前一条记录和 zstd 的压缩缓冲区
+
+    使用示例：
+    with ChunkedJsonlWriter(output_dir, time_field='timestamp') as writer:
+        for record in records:
+            writer.write(record)
+    """
+
+    def __init__(self, output_dir, time_field='timestamp', chunk_size=5000, level=3):
+        """
+        @param output_dir: 导出目录
+        @param time_field: 记录中用于建立时间索引的字段
+        @param chunk_size: 每个分块的最大记录数
+        @param level: zstd 压缩等级
+        """
+        self.output_dir = output_dir
+        self.time_field = time_field
+        self.chunk_size = chunk_size
+        self.compressor = zstd.ZstdCompressor(level=level)
+        self.chunks = []
+        self.count = 0
+        self._file = None
+        self._stream = None
+        self._chunk = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _open_chunk(self):
+        file_name = f'part-{len(self.chunks):05d}.jsonl.zst'
+        self._file = open(os.path.join(self.output_dir, file_name), 'wb')
+        self._stream = self.compressor.stream_writer(self._file, closefd=False)
+        self._chunk = {
+            'file': file_name,
+            'count': 0,
+            'min_time': None,
+            'max_time': None,
+        }
+
+    def _close_chunk(self):
+        if self._stream is None:
+            return
+        self._stream.close()
+        self._chunk['size'] = self._file.tell()
+        self._file.close()
+        self.chunks.append(self._chunk)
+        self._file = None
+        self._stream = None
+        self._chunk = None
+
+    def write(self, record: dict):
+        if self._stream is None:
+            self._open_chunk()
+        self._stream.write(json.dumps(record, ensure_ascii=False).encode('utf-8'))
+        self._stream.write(b'\n')
+        chunk = self._chunk
+        timestamp = record.get(self.time_field)
+        if timestamp is not None:
+            if chunk['min_time'] is None or timestamp < chunk['min_time']:
+                chunk['min_time'] = timestamp
+            if chunk['max_time'] is None or timestamp > chunk['max_time']:
+                chunk['max_time'] = timestamp
+        chunk['count'] += 1
+        self.count += 1
+        if chunk['count'] >= self.chunk_size:
+            self._close_chunk()
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+
+    def close(self, complete=True):
+        """
+        关闭当前分块并写入清单
+        @param complete: 导出是否完整，中途出错时为 False，读取方据此判断数据是否缺失
+        @return: 清单路径
+        """
+        self._close_chunk()
+        manifest = {
+            'version': FORMAT_VERSION,
+            'compression': 'zstd',
+            'format': 'jsonl',
+            'time_field': self.time_field,
+            'complete': complete,
+            'count': self.count,
+            'chunks': self.chunks,
+        }
+        # 先写临时文件再替换，读取方不会看到写了一半的清单
+        manifest_path = os.path.join(self.output_dir, MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        return manifest_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(complete=exc_type is None)
+
+
+class ChunkedJsonlReader:
+    def __init__(self, input_dir):
+        self.input_dir = input_dir
+        with open(os.path.join(input_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.time_field = self.manifest.get('time_field', 'timestamp')
+
+    def __len__(self):
+        return self.manifest.get('count', 0)
+
+    @property
+    def complete(self) -> bool:
+        """导出中途出错时为 False，旧版本的清单没有这个字段"""
+        return self.manifest.get('complete', True)
+
+    def _iter_chunk(self, chunk) -> Iterator[dict]:
+        decompressor = zstd.ZstdDecompressor()
+        with open(os.path.join(self.input_dir, chunk['file']), 'rb') as f:
+            with decompressor.stream_reader(f) as reader:
+                buffer = b''
+                while True:
+                    data = reader.read(1 << 20)
+                    if not data:
+                        break
+                    buffer += data
+                    lines = buffer.split(b'\n')
+                    buffer = lines.pop()
+                    for line in lines:
+                        if line:
+                            yield json.loads(line)
+                if buffer:
+                    yield json.loads(buffer)
+
+    def chunks_in_range(self, start_time=None, end_time=None) -> list:
+        """
+        根据清单中的时间索引挑出与[start_time, end_time]有交集的分块
+        """
+        result = []
+        for chunk in self.manifest.get('chunks', []):
+            if chunk['min_time'] is None:
+                result.append(chunk)
+                continue
+            if start_time is not None and chunk['max_time'] < start_time:
+                continue
+            if end_time is not None and chunk['min_time'] > end_time:
+                continue
+            result.append(chunk)
+        return result
+
+    def read(self, start_time=None, end_time=None) -> Iterator[dict]:
+        """
+        读取时间在[start_time, end_time]内的记录，不传时间范围时读取全部
+        """
+        for chunk in self.chunks_in_range(start_time, end_time):
+            for record in self._iter_chunk(chunk):
+                timestamp = record.get(self.time_field)
+                if timestamp is not None:
+                    if start_time is not None and timestamp < start_time:
+                        continue
+                    if end_time is not None and timestamp > end_time:
+                        continue
+                yield record
+
+    def __iter__(self):
+        return self.read()
+
+
+if __name__ == '__main__':
+    pass
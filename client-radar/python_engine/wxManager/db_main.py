@@ -37,6 +37,18 @@ class DataBaseInterface(ABC):
         """
         raise ValueError("子类必须实现该方法")
 
+    def get_sessions_enriched(self, limit=-1, offset=0, with_avatar=False) -> List[dict]:
+        """
+        侧边栏会话列表，分页返回，每个会话已带上显示名、头像url、头像md5
+        @param limit: 每页数量，-1 表示不分页
+        @param offset:
+        @param with_avatar: 是否返回头像数据
+        @return: [{'username', 'display_name', 'remark', 'nickname', 'alias', 'type', 'unread_count',
+                   'last_timestamp', 'str_time', 'summary', 'last_msg_type', 'small_head_url', 'big_head_url',
+                   'avatar_md5', 'avatar'}]
+        """
+        raise ValueError("子类必须实现该方法")
+
     def get_messages(
             self,
             username_: str,
@@ -180,6 +192,16 @@ class DataBaseInterface(ABC):
     def get_audio(self, reserved0, output_path, open_im=False, filename=''):
         raise ValueError("子类必须实现该方法")
 
+    def get_audios(self, items, output_path, open_im=False):
+        """
+        批量导出语音，已导出或已缓存的语音不会重复转码
+        @param items: [(reserved0, filename)]
+        @param output_path:
+        @param open_im:
+        @return: {reserved0: mp3 路径}
+        """
+        raise ValueError("子类必须实现该方法")
+
     def get_media_buffer(self, server_id, is_open_im=False) -> bytes:
         pass
 
@@ -203,9 +225,26 @@ class DataBaseInterface(ABC):
     def get_contacts(self) -> List[Contact]:
         raise ValueError("子类必须实现该方法")
 
+    def get_contacts_with_labels(self, label_names=None) -> List[Contact]:
+        """
+        获取联系人，label_list 为标签名；标签表只读取一次，不再每个标签查询一次数据库
+        @param label_names: 不为空时只返回带有其中任意一个标签的联系人
+        @return:
+        """
+        raise ValueError("子类必须实现该方法")
+
     def set_remark(self, username: str, remark) -> bool:
         raise ValueError("子类必须实现该方法")
 
+    def export_avatars(self, output_dir, sprite=False) -> dict:
+        """
+        一次导出所有联系人头像，按 md5 去重，见 wxManager.avatar_export
+        @param output_dir:
+        @param sprite: 是否同时生成精灵图
+        @return: {'avatars': {username: 文件}, 'sprites': 精灵图索引或 None}
+        """
+        raise ValueError("子类必须实现该方法")
+
     def set_avatar_buffer(self, username, avatar_path):
         raise ValueError("子类必须实现该方法")
 
@@ -221,10 +260,11 @@ class DataBaseInterface(ABC):
         raise ValueError("子类必须实现该方法")
 
     # 联系人结束
-    def merge(self, db_paths):
+    def merge(self, db_paths, changed=None):
         """
         增量将db_path中的数据合入到数据库中，若存在冲突则以db_path中的数据为准
         @param db_paths:
+        @param changed: 只合并这些新数据库文件，None 表示全部
         @return:
         """
         raise ValueError("子类必须实现该方法")
@@ -2,7 +2,9 @@ import os.path
 import sqlite3
 import threading
 import traceback
+from collections import OrderedDict
 
+from wxManager.log import logger
 from wxManager.merge import increase_data
 from wxManager.model import DataBaseBase
 
@@ -22,101 +24,142 @@ def singleton(cls):
     return inner
 
 
+# EmotionItem 中表情原图、缩略图缓存的总字节数
+BLOB_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class BlobCache:
+    """按字节数限制大小的 LRU 缓存"""
+
+    def __init__(self, max_bytes=BLOB_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value: bytes):
+        if value is None or len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
 # 一定要保证只有一个实例对象
 
 class Emotion(DataBaseBase):
+    def self_init(self):
+        # CustomEmotion、EmotionDes1 第一次查询时整张表读进来，键统一为小写 md5
+        self.url_catalog = None  # md5 -> (缩略图url, CDNUrl)
+        self.desc_catalog = None  # md5 -> 描述
+        self.catalog_lock = threading.Lock()
+        self.blob_cache = BlobCache()
+
+    def preload(self):
+        """
+        一次读取 CustomEmotion 和 EmotionDes1，之后每条表情消息只查一次 dict
+        """
+        with self.catalog_lock:
+            if self.url_catalog is not None:
+                return
+            url_catalog, desc_catalog = {}, {}
+            cursor = self.reader().cursor()
+            try:
+                cursor.execute('''
+                    select MD5,thumburl,CDNUrl
+                    from CustomEmotion
+                ''')
+                for md5, thumb_url, cdn_url in cursor.fetchall():
+                    if md5:
+                        url_catalog[md5.lower()] = (thumb_url or cdn_url, cdn_url)
+            except sqlite3.Error:
+                logger.error(f'CustomEmotion 读取失败\n{traceback.format_exc()}')
+            try:
+                cursor.execute('''
+                    select MD5,Des
+                    from EmotionDes1
+                ''')
+                for md5, des in cursor.fetchall():
+                    if md5 and des and md5.lower() not in desc_catalog:
+                        desc_catalog[md5.lower()] = des[6:].decode('utf-8', errors='ignore')
+            except sqlite3.Error:
+                logger.error(f'EmotionDes1 读取失败\n{traceback.format_exc()}')
+            finally:
+                cursor.close()
+            self.desc_catalog = desc_catalog
+            self.url_catalog = url_catalog
+
+    def _catalog(self) -> dict:
+        if self.url_catalog is None:
+            self.preload()
+        return self.url_catalog
 
     def get_emoji_url(self, md5: str, thumb: bool) -> str | bytes:
         """供下载用，返回可能是url可能是bytes"""
-        if thumb:
-            sql = """
-                select
-                    case
-                        when thumburl is NULL or thumburl = '' then cdnurl
-                        else thumburl
-                    end as selected_url
-                from CustomEmotion
-                where md5 = ?
-            """
-        else:
-            sql = """
-                select CDNUrl
-                from CustomEmotion
-                where md5 = ?
-            """
-        cursor = self.DB.cursor()
-        try:
-            cursor.execute(sql, [md5])
-            return cursor.fetchone()[0]
-        except:
-            md5 = md5.upper()
-            sql = f"""
-                select {"Thumb" if thumb else "Data"}
-                from EmotionItem
-                where md5 = ?
-            """
-            cursor.execute(sql, [md5])
-            res = cursor.fetchone()
-            return res[0] if res else ""
-        finally:
-            lock.release()
+        if not self.open_flag or not md5:
+            return ""
+        urls = self._catalog().get(md5.lower())
+        if urls:
+            return urls[0] if thumb else urls[1]
+        return self.get_emoji_data(md5, thumb) or ""
 
     def get_emoji_URL(self, md5: str, thumb: bool):
         """只管url，另外的不管"""
-        if thumb:
-            sql = """
-                select
-                    case
-                        when thumburl is NULL or thumburl = '' then cdnurl
-                        else thumburl
-                    end as selected_url
-                from CustomEmotion
-                where md5 = ?
-            """
-        else:
-            sql = """
-                select CDNUrl
-                from CustomEmotion
-                where md5 = ?
-            """
-        cursor = self.DB.cursor()
-        try:
-            cursor.execute(sql, [md5])
-            return cursor.fetchone()[0]
-        except:
+        if not self.open_flag or not md5:
             return ""
+        urls = self._catalog().get(md5.lower())
+        if urls:
+            return urls[0] if thumb else urls[1]
+        return ""
 
     def get_emoji_desc(self, md5: str):
-        sql = '''
-        select Des
-        from EmotionDes1
-        where MD5=? or MD5=?
-        '''
-        cursor = self.DB.cursor()
-        try:
-            cursor.execute(sql, [md5, md5.upper()])
-            result = cursor.fetchone()
-            if result:
-                return result[0][6:].decode('utf-8')
-            return ""
-        except:
+        if not self.open_flag or not md5:
             return ""
+        if self.desc_catalog is None:
+            self.preload()
+        return self.desc_catalog.get(md5.lower(), "")
 
     def get_emoji_data(self, md5: str, thumb=False):
+        if not self.open_flag or not md5:
+            return b""
+        key = (md5.lower(), thumb)
+        data = self.blob_cache.get(key)
+        if data is not None:
+            return data
         sql = f'''
                 select {'Thumb' if thumb else 'Data'}
                 from EmotionItem
                 where MD5=? or MD5=?
                 '''
-        cursor = self.DB.cursor()
+        cursor = self.reader().cursor()
         try:
             cursor.execute(sql, [md5, md5.upper()])
             result = cursor.fetchone()
-            if result:
-                return result[0]
-            return b""
-        except:
+            data = result[0] if result and result[0] else b""
+        except sqlite3.Error:
             return b""
+        finally:
+            cursor.close()
+        self.blob_cache.put(key, data)
+        return data
 
     def merge(self, db_path):
         if not (os.path.exists(db_path) or os.path.isfile(db_path)):
@@ -130,6 +173,9 @@ class Emotion(DataBaseBase):
             increase_data(db_path, cursor, self.DB, 'EmotionItem', 'MD5', 1, 'localId')
             increase_data(db_path, cursor, self.DB, 'EmotionPackageItem', 'ProductId', 0, 'localId')
             increase_data(db_path, cursor, self.DB, 'EmotionOrderInfo', 'MD5', 0, 'localId')
+            self.url_catalog = None
+            self.desc_catalog = None
+            self.blob_cache.clear()
         except:
             print(f"数据库操作错误: {traceback.format_exc()}")
             self.DB.rollback()
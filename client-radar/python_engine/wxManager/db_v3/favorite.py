@@ -4,7 +4,7 @@ import threading
 from datetime import date
 from typing import Tuple
 
-from wxManager.db_v3.msg import convert_to_timestamp
+from wxManager.query_builder import Query
 
 lock = threading.Lock()
 DB = None
@@ -15,20 +15,13 @@ db_path = '.'
 class Favorite:
 
     def get_items(self, time_range: Tuple[int | float | str | date, int | float | str | date] = None, ):
-        if time_range:
-            start_time, end_time = convert_to_timestamp(time_range)
-        sql = f'''
-            select FavLocalID, Type, FromUser, RealChatName, SearchKey, UpdateTime, XmlBuf
-            from FavItems
-            where StrTalker=?
-            {'AND UpdateTime>' + str(start_time) + ' AND UpdateTime<' + str(end_time) if time_range else ''}
-            order by UpdateTime
-        '''
+        query = (Query('FavLocalID, Type, FromUser, RealChatName, SearchKey, UpdateTime, XmlBuf', 'FavItems')
+                 .time_range('UpdateTime', time_range)
+                 .order_by('UpdateTime'))
         res = []
         try:
             lock.acquire(True)
-            self.cursor.execute(sql)
-            res = self.cursor.fechall()
+            res = query.fetchall(self.cursor)
             self.DB.commit()
         except:
             res = []
@@ -1,38 +1,31 @@
 import os.path
-import shutil
-import subprocess
-import sys
 import traceback
 import sqlite3
 import base64
+from typing import Dict, Iterable, Tuple
 
 import xml.etree.ElementTree as ET
 
-from wxManager.merge import increase_data
+from wxManager.audio_transcoder import AudioTranscoder, silk_to_pcm
+from wxManager.merge_coordinator import MergeCoordinator, MergeTable, series_tasks
 from wxManager.log import logger
 from wxManager.model import DataBaseBase
 
 
-def get_ffmpeg_path():
-    # 获取打包后的资源目录
-    resource_dir = getattr(sys, '_MEIPASS', os.path.abspath(os.path.dirname(__file__)))
-
-    # 构建 FFmpeg 可执行文件的路径
-    ffmpeg_path = os.path.join(resource_dir, 'app', 'resources', 'data', 'ffmpeg.exe')
-
-    return ffmpeg_path
-
-
 class MediaMsg(DataBaseBase):
     voice_visited = {}
 
+    def self_init(self):
+        # 转码结果按 Reserved0 缓存，同一条语音多次导出只转码一次
+        self.transcoder = AudioTranscoder(os.path.join(self.db_dir, 'audio_cache'))
+
     def get_media_buffer(self, reserved0):
         sql = '''
             select Buf
             from Media
             where Reserved0 = ?
         '''
-        for db in self.DB:
+        for db in self.readers():
             cursor = db.cursor()
             cursor.execute(sql, [reserved0])
             result = cursor.fetchone()
@@ -40,51 +33,48 @@ class MediaMsg(DataBaseBase):
                 return result[0]
         return None
 
+    def get_media_buffers(self, reserved0s) -> Dict[int, bytes]:
+        """
+        批量读取语音数据，每个分片每 500 个 Reserved0 查询一次
+        @param reserved0s:
+        @return: {reserved0: Buf}，找不到的不在结果中
+        """
+        keys = {int(reserved0): reserved0 for reserved0 in reserved0s}
+        results = {}
+        for db in self.readers():
+            remaining = [key for key in keys if keys[key] not in results]
+            cursor = db.cursor()
+            for i in range(0, len(remaining), 500):
+                chunk = remaining[i:i + 500]
+                sql = f'select Reserved0, Buf from Media where Reserved0 in ({",".join("?" * len(chunk))})'
+                cursor.execute(sql, chunk)
+                for key, buf in cursor.fetchall():
+                    if key in keys:
+                        results[keys[key]] = buf
+            cursor.close()
+            if len(results) == len(keys):
+                break
+        return results
+
     def get_audio(self, reserved0, output_path, filename=''):
+        if not self.open_flag:
+            return ''
         if not filename:
             filename = reserved0
-        silk_path = f"{output_path}/{filename}.silk"
-        pcm_path = f"{output_path}/{filename}.pcm"
         mp3_path = f"{output_path}/{filename}.mp3"
-        if os.path.exists(mp3_path):
-            return mp3_path
-        buf = self.get_media_buffer(reserved0)
-        if not buf:
-            return ''
-        with open(silk_path, "wb") as f:
-            f.write(buf)
-        # open(silk_path, "wb").write()
-        try:
-            decode(silk_path, pcm_path, 44100)
-            # 调用系统上的 ffmpeg 可执行文件
-            # 获取 FFmpeg 可执行文件的路径
-            ffmpeg_path = get_ffmpeg_path()
-            # # 调用 FFmpeg
-            if os.path.exists(ffmpeg_path):
-                cmd = f'''"{ffmpeg_path}" -loglevel quiet -y -f s16le -i "{pcm_path}" -ar 44100 -ac 1 "{mp3_path}"'''
-                # system(cmd)
-                # 使用subprocess.run()执行命令
-                subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            else:
-                # 源码运行的时候下面的有效
-                # 这里不知道怎么捕捉异常
-                cmd = f'''"{os.path.join(os.getcwd(), 'app', 'resources', 'data', 'ffmpeg.exe')}" -loglevel quiet -y -f s16le -i "{pcm_path}" -ar 44100 -ac 1 "{mp3_path}"'''
-                # system(cmd)
-                # 使用subprocess.run()执行命令
-                subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if os.path.exists(silk_path):
-                os.remove(silk_path)
-            if os.path.exists(pcm_path):
-                os.remove(pcm_path)
-        except Exception as e:
-            print(f"Error: {e}")
-            logger.error(f'语音发送错误\n{traceback.format_exc()}')
-            cmd = f'''"{os.path.join(os.getcwd(), 'app', 'resources', 'data', 'ffmpeg.exe')}" -loglevel quiet -y -f s16le -i "{pcm_path}" -ar 44100 -ac 1 "{mp3_path}"'''
-            # system(cmd)
-            # 使用subprocess.run()执行命令
-            subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        finally:
-            return mp3_path
+        return self.transcoder.transcode_batch([(reserved0, mp3_path)], self.get_media_buffers).get(reserved0, '')
+
+    def get_audios(self, items: Iterable[Tuple[int, str]], output_path) -> Dict[int, str]:
+        """
+        批量导出语音
+        @param items: (reserved0, filename)，filename 为空时使用 reserved0
+        @param output_path:
+        @return: {reserved0: mp3 路径}，失败的为空字符串
+        """
+        if not self.open_flag:
+            return {}
+        jobs = [(reserved0, f"{output_path}/{filename or reserved0}.mp3") for reserved0, filename in items]
+        return self.transcoder.transcode_batch(jobs, self.get_media_buffers)
 
     def get_audio_path(self, reserved0, output_path, filename=''):
         if not filename:
@@ -105,20 +95,10 @@ class MediaMsg(DataBaseBase):
         buf = self.get_media_buffer(reserved0, open_im)
         if not buf:
             return ''
-        if not filename:
-            filename = reserved0
-        silk_path = f"{output_path}/{filename}.silk"
-        pcm_path = f"{output_path}/{filename}.pcm"
-        with open(silk_path, "wb") as f:
-            f.write(buf)
-        decode(silk_path, pcm_path, 16000)
-        speech_data = []
-        with open(pcm_path, 'rb') as speech_file:
-            speech_data = speech_file.read()
+        speech_data = silk_to_pcm(buf, 16000)
         length = len(speech_data)
         if length == 0:
-            logger.error('file %s length read 0 bytes' % pcm_path)
-            pass
+            logger.error(f'语音 {reserved0} 解码后长度为 0')
         speech = base64.b64encode(speech_data).decode('utf-8')
         params = {'dev_pid': DEV_PID,
                   'format': 'pcm',
@@ -130,8 +110,6 @@ class MediaMsg(DataBaseBase):
                   'len': length
                   }
         try:
-            os.remove(silk_path)
-            os.remove(pcm_path)
             resp = requests.post(ASR_URL, json=params)
             if resp.status_code == 200:
                 result_dict = resp.json()
@@ -146,33 +124,13 @@ class MediaMsg(DataBaseBase):
             logger.error(traceback.format_exc())
             return ""
 
-    def merge(self, db_file_name):
-        def task_(db_path, cursor, db):
-            """
-            每个线程执行的任务，获取某个数据库实例中的查询结果。
-            """
-            increase_data(db_path, cursor, db, 'Media', 'Reserved0', 1)
+    def merge_tasks(self, db_file_name):
+        return series_tasks(self, db_file_name, 'Multi', [
+            MergeTable('Media', 'Reserved0', col_index=1),
+        ])
 
-        tasks = []
-        for i in range(100):
-            db_path = db_file_name.replace('0', f'{i}')
-            if os.path.exists(db_path):
-                # print('初始化数据库：', db_path)
-                file_name = os.path.basename(db_path)
-                if file_name in self.db_file_name:
-                    index = self.db_file_name.index(file_name)
-                    db = self.DB[index]
-                    cursor = db.cursor()
-                    task_(db_path, cursor, db)
-                    tasks.append([db_path, cursor, db])
-                else:
-                    shutil.copy(db_path, os.path.join(self.db_dir, 'Multi', file_name))
-        # print(tasks)
-        # 使用线程池 (没有加快合并速度)
-        # with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
-        #     executor.map(lambda args: task_(*args), tasks)
-        self.commit()
-        print(len(tasks))
+    def merge(self, db_file_name):
+        MergeCoordinator().add_tasks(self.merge_tasks(db_file_name)).run()
 
 
 class Audio2TextDB:
@@ -7,6 +7,7 @@ import traceback
 from wxManager.merge import increase_update_data
 from wxManager.log import logger
 from wxManager.model import DataBaseBase
+from wxManager.model.db_model import attach
 from wxManager.model.contact import Contact
 
 lock = threading.Lock()
@@ -31,26 +32,48 @@ def is_database_exist():
 
 class MicroMsg(DataBaseBase):
 
+    def self_init(self):
+        # 标签表很小，每次打开数据库时整张读进来，之后按 id 查名称不再查询数据库
+        self.label_catalog = None
+
+    def get_label_catalog(self) -> dict:
+        """
+        @return: {LabelId(str): LabelName}
+        """
+        if self.label_catalog is None:
+            sql = '''
+                select LabelId, LabelName from ContactLabel
+            '''
+            try:
+                cursor = self.DB.cursor()
+                cursor.execute(sql)
+                self.label_catalog = {str(label_id): name for label_id, name in cursor.fetchall()}
+            except sqlite3.Error:
+                # 旧版本没有ContactLabel表
+                self.label_catalog = {}
+        return self.label_catalog
+
     def get_label_by_id(self, label_id) -> str:
-        sql = '''
-            select LabelName from ContactLabel
-            where LabelId = ?
-        '''
-        try:
-            cursor = self.DB.cursor()
-            cursor.execute(sql, [label_id])
-            result = cursor.fetchone()
-            if result:
-                return result[0]
-            else:
-                return ''
-        except:
+        if not self.open_flag:
             return ''
+        return self.get_label_catalog().get(str(label_id), '')
+
+    def get_label_names(self, label_id_lists) -> list:
+        """
+        批量把标签 id 列表转换成标签名
+        @param label_id_lists: ['1,2,', '3', ...]
+        @return: [['同事', '朋友'], ['家人'], ...]，与输入一一对应
+        """
+        catalog = self.get_label_catalog() if self.open_flag else {}
+        return [
+            [catalog.get(label_id, '') for label_id in label_id_list.strip(',').split(',')] if label_id_list else []
+            for label_id_list in label_id_lists
+        ]
 
     def get_labels(self, label_id_list) -> str:
         if not label_id_list:
             return ''
-        return ','.join(map(self.get_label_by_id, label_id_list.strip(',').split(',')))
+        return ','.join(self.get_label_names([label_id_list])[0])
 
     def get_contact(self) -> list:
         if not self.open_flag:
@@ -80,6 +103,14 @@ class MicroMsg(DataBaseBase):
             result = self.cursor.fetchall()
         return result
 
+    def get_contacts_with_labels(self) -> list:
+        """
+        与 get_contact 相同，最后一列 LabelIDList 换成以逗号分隔的标签名
+        """
+        result = self.get_contact()
+        label_names = self.get_label_names(row[-1] if row[-1] != 'None' else '' for row in result)
+        return [[*row[:-1], ','.join(names)] for row, names in zip(result, label_names)]
+
     def get_contact_by_username(self, username) -> list:
         if not self.open_flag:
             return []
@@ -175,6 +206,52 @@ class MicroMsg(DataBaseBase):
             result.reverse()
         return result
 
+    def get_sessions_enriched(self, misc_db_path='', limit=-1, offset=0, with_avatar=False):
+        """
+        会话列表，一次 JOIN 联系人、头像url，并 ATTACH Misc.db 取头像
+        @param misc_db_path: Misc.db，为空时头像列为 NULL
+        @param limit: 每页数量，-1 表示不分页
+        @param offset:
+        @param with_avatar: 是否同时返回头像数据
+        @return: List[
+            a[0]~a[8]: 同 get_session
+            a[9]:Remark
+            a[10]:NickName
+            a[11]:Alias
+            a[12]:Type
+            a[13]:smallHeadImgUrl
+            a[14]:bigHeadImgUrl
+            a[15]:头像md5
+            a[16]:头像数据
+        ]
+        """
+        if not self.open_flag:
+            return []
+        conn = self.reader()
+        head_columns = 'NULL, NULL'
+        has_misc = attach(conn, 'misc_db', misc_db_path)
+        if has_misc:
+            columns = {row[1] for row in conn.execute('PRAGMA misc_db.table_info(ContactHeadImg1)').fetchall()}
+            head_columns = f'{"h.m_headImgMD5" if "m_headImgMD5" in columns else "NULL"}, ' \
+                           f'{"h.smallHeadBuf" if with_avatar else "NULL"}'
+        sql = f'''
+            SELECT s.strUsrName, s.nOrder, s.nUnreadCount, s.strNickName, s.nIsSend, s.strContent, s.nMsgType, s.nTime,
+                strftime('%Y/%m/%d', s.nTime, 'unixepoch','localtime') AS strTime,
+                c.Remark, c.NickName, c.Alias, c.Type, u.smallHeadImgUrl, u.bigHeadImgUrl, {head_columns}
+            FROM Session AS s
+            LEFT JOIN Contact AS c ON c.UserName = s.strUsrName
+            LEFT JOIN ContactHeadImgUrl AS u ON u.usrName = s.strUsrName
+            {'LEFT JOIN misc_db.ContactHeadImg1 AS h ON h.usrName = s.strUsrName' if has_misc else ''}
+            ORDER BY s.nOrder DESC
+            LIMIT ? OFFSET ?
+        '''
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, [limit, offset])
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
     def merge(self, db_path):
         if not (os.path.exists(db_path) or os.path.isfile(db_path)):
             print(f'{db_path} 不存在')
@@ -187,6 +264,7 @@ class MicroMsg(DataBaseBase):
             increase_update_data(db_path, self.cursor, self.DB, 'ContactHeadImgUrl', 'usrName', 0)
             increase_update_data(db_path, self.cursor, self.DB, 'ContactLabel', 'LabelId', 0)
             increase_update_data(db_path, self.cursor, self.DB, 'Session', 'strUsrName', 0)
+            self.label_catalog = None
         except:
             print(f"数据库操作错误: {traceback.format_exc()}")
             self.DB.rollback()
@@ -33,6 +33,29 @@ class Misc(DataBaseBase):
         else:
             return b''
 
+    def iter_avatars(self, batch_size=500):
+        """
+        顺序扫描一遍 ContactHeadImg1，按批读取；旧版本没有 m_headImgMD5 列时 md5 为空，导出时按内容计算
+        @return: 生成器 (usrName, md5, smallHeadBuf)
+        """
+        if not self.open_flag:
+            return
+        cursor = self.reader().cursor()
+        try:
+            columns = {row[1] for row in cursor.execute('PRAGMA table_info(ContactHeadImg1)').fetchall()}
+            md5_column = 'm_headImgMD5' if 'm_headImgMD5' in columns else "''"
+            cursor.execute(f'''
+                select usrName, {md5_column}, smallHeadBuf
+                from ContactHeadImg1
+            ''')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
     def set_avatar_buffer(self, username, img_path):
         try:
             # 打开图片并缩放
@@ -1,5 +1,3 @@
-import os.path
-import shutil
 import sqlite3
 import traceback
 import concurrent
@@ -10,9 +8,10 @@ from datetime import datetime, date
 from typing import Tuple
 
 from wxManager import MessageType
-from wxManager.merge import increase_data, increase_update_data
+from wxManager.merge_coordinator import MergeCoordinator, MergeTable, series_tasks
+from wxManager.query_builder import Query, ensure_index
 from wxManager.log import logger
-from wxManager.model import DataBaseBase
+from wxManager.model import DataBaseBase, Me
 
 
 def convert_to_timestamp_(time_input) -> int:
@@ -89,10 +88,24 @@ def get_local_type(type_: MessageType):
 
 
 class Msg(DataBaseBase):
+    # StrTime 占位，格式化时间由 Message.str_time 按需计算
+    columns = ("localId,TalkerId,Type,SubType,IsSender,CreateTime,Status,StrContent,'' as StrTime,MsgSvrID,"
+               "BytesExtra,CompressContent,DisplayContent")
+
+    def self_init(self):
+        self.indexes_ready = False
+
+    def prepare_indexes(self):
+        """第一次按会话查询前在每个分片上补上 (StrTalker, CreateTime) 索引"""
+        if self.indexes_ready:
+            return
+        for db in self.DB or []:
+            ensure_index(db, 'MSG', ('StrTalker', 'CreateTime'))
+        self.indexes_ready = True
 
     def _get_messages_by_num(self, cursor, username_, start_sort_seq, msg_num):
         sql = '''
-            select localId,TalkerId,Type,SubType,IsSender,CreateTime,Status,StrContent,strftime('%Y-%m-%d %H:%M:%S',CreateTime,'unixepoch','localtime') as StrTime,MsgSvrID,BytesExtra,CompressContent,DisplayContent
+            select localId,TalkerId,Type,SubType,IsSender,CreateTime,Status,StrContent,'' as StrTime,MsgSvrID,BytesExtra,CompressContent,DisplayContent
             from MSG
             where StrTalker = ? and CreateTime < ?
             order by CreateTime desc 
@@ -126,23 +139,17 @@ class Msg(DataBaseBase):
 
         # 使用线程池
         with ThreadPoolExecutor(max_workers=len(self.DB)) as executor:
-            executor.map(task, self.DB)
+            executor.map(task, self.readers())
         self.commit()
         return results
 
     def _get_messages_by_username(self, cursor, username: str,
                                   time_range: Tuple[int | float | str | date, int | float | str | date] = None, ):
-        if time_range:
-            start_time, end_time = convert_to_timestamp(time_range)
-        sql = f'''
-            select localId,TalkerId,Type,SubType,IsSender,CreateTime,Status,StrContent,strftime('%Y-%m-%d %H:%M:%S',CreateTime,'unixepoch','localtime') as StrTime,MsgSvrID,BytesExtra,CompressContent,DisplayContent
-            from MSG
-            where StrTalker=?
-            {'AND CreateTime>' + str(start_time) + ' AND CreateTime<' + str(end_time) if time_range else ''}
-            order by CreateTime
-        '''
-        cursor.execute(sql, [username])
-        result = cursor.fetchall()
+        result = (Query(Msg.columns, 'MSG')
+                  .where('StrTalker = ?', username)
+                  .time_range('CreateTime', time_range)
+                  .order_by('CreateTime')
+                  .fetchall(cursor))
         if result:
             return result
         else:
@@ -150,11 +157,12 @@ class Msg(DataBaseBase):
 
     def get_messages_by_username(self, username: str,
                                  time_range: Tuple[int | float | str | date, int | float | str | date] = None, ):
+        self.prepare_indexes()
         with concurrent.futures.ThreadPoolExecutor() as executor:
             # 创建一个任务列表
             futures = [
                 executor.submit(self._get_messages_by_username, db.cursor(), username, time_range)
-                for db in self.DB
+                for db in self.readers()
             ]
 
             # 等待所有任务完成，并获取结果
@@ -175,11 +183,11 @@ class Msg(DataBaseBase):
         @return: messages, 最后一条消息的start_sort_seq
         """
         sql = f'''
-    select localId,TalkerId,Type,SubType,IsSender,CreateTime,Status,StrContent,strftime('%Y-%m-%d %H:%M:%S',CreateTime,'unixepoch','localtime') as StrTime,MsgSvrID,BytesExtra,CompressContent,DisplayContent
+    select localId,TalkerId,Type,SubType,IsSender,CreateTime,Status,StrContent,'' as StrTime,MsgSvrID,BytesExtra,CompressContent,DisplayContent
     from MSG
     where MsgSvrID=?
 '''
-        for db in self.DB:
+        for db in self.readers():
             cursor = db.cursor()
             cursor.execute(sql, [server_id])
             result = cursor.fetchone()
@@ -205,7 +213,7 @@ class Msg(DataBaseBase):
 
     def get_messages_calendar(self, username):
         res = []
-        for db in self.DB:
+        for db in self.readers():
             r1 = self._get_messages_calendar(db.cursor(), username)
             if r1:
                 res.extend(r1)
@@ -214,18 +222,14 @@ class Msg(DataBaseBase):
 
     def _get_messages_by_type(self, cursor, username: str, type_: MessageType,
                               time_range: Tuple[int | float | str | date, int | float | str | date] = None, ):
-        if time_range:
-            start_time, end_time = convert_to_timestamp(time_range)
         local_type, sub_type = get_local_type(type_)
-        sql = f'''
-            select localId,TalkerId,Type,SubType,IsSender,CreateTime,Status,StrContent,strftime('%Y-%m-%d %H:%M:%S',CreateTime,'unixepoch','localtime') as StrTime,MsgSvrID,BytesExtra,CompressContent,DisplayContent
-            from MSG
-            where StrTalker=? and Type=? and SubType = ?
-            {'AND CreateTime>' + str(start_time) + ' AND CreateTime<' + str(end_time) if time_range else ''}
-            order by CreateTime
-        '''
-        cursor.execute(sql, [username, local_type, sub_type])
-        result = cursor.fetchall()
+        result = (Query(Msg.columns, 'MSG')
+                  .where('StrTalker = ?', username)
+                  .where('Type = ?', local_type)
+                  .where('SubType = ?', sub_type)
+                  .time_range('CreateTime', time_range)
+                  .order_by('CreateTime')
+                  .fetchall(cursor))
         if result:
             return result
         else:
@@ -233,11 +237,12 @@ class Msg(DataBaseBase):
 
     def get_messages_by_type(self, username: str, type_: MessageType,
                              time_range: Tuple[int | float | str | date, int | float | str | date] = None, ):
+        self.prepare_indexes()
         with concurrent.futures.ThreadPoolExecutor() as executor:
             # 创建一个任务列表
             futures = [
                 executor.submit(self._get_messages_by_type, db.cursor(), username, type_, time_range)
-                for db in self.DB
+                for db in self.readers()
             ]
 
             # 等待所有任务完成，并获取结果
@@ -250,6 +255,34 @@ class Msg(DataBaseBase):
 
         return results
 
+    def _get_sender_stats(self, cursor, start_time, end_time):
+        sql = f'''
+            select StrTalker,IsSender,count(*),max(CreateTime)
+            from MSG
+            where CreateTime >= ? {'and CreateTime <= ?' if end_time is not None else ''}
+            group by StrTalker,IsSender
+        '''
+        cursor.execute(sql, [start_time] if end_time is None else [start_time, end_time])
+        return cursor.fetchall()
+
+    def get_sender_stats(self, start_time=0, end_time=None):
+        """
+        按会话和发送者统计消息数，用于构建互动关系图
+        群聊中他人发送的消息发送者保存在BytesExtra里，这里只统计自己在群里发送的消息
+        @param start_time: 只统计该时间（含）之后的消息
+        @param end_time: 只统计该时间（含）之前的消息，None 表示不限
+        @return: List[(talker, sender, count, last_time)]，收到的单聊消息 sender 为 talker
+        """
+        me = Me().wxid
+        results = []
+        for db in self.readers():
+            for talker, is_sender, count, last_time in self._get_sender_stats(db.cursor(), start_time, end_time):
+                if is_sender:
+                    results.append((talker, me, count, last_time))
+                elif not talker.endswith('@chatroom'):
+                    results.append((talker, talker, count, last_time))
+        return results
+
     def update_audio_text(self, MsgSvrID_, voicetrans_text):
         voicetrans_tag = f'<voicetrans transtext="{voicetrans_text}" istransend="true" tranfailfinish="0" />'
         sql_xml = f'''
@@ -270,32 +303,12 @@ class Msg(DataBaseBase):
         finally:
             lock.release()
 
+    def merge_tasks(self, db_file_name):
+        return series_tasks(self, db_file_name, 'Multi', [
+            MergeTable('Name2Id', 'UsrName'),
+            MergeTable('DBInfo', 'tableIndex', update=True),
+            MergeTable('MSG', 'MsgSvrID', exclude_column='localId'),
+        ])
+
     def merge(self, db_file_name):
-        def task_(db_path, cursor, db):
-            """
-            每个线程执行的任务，获取某个数据库实例中的查询结果。
-            """
-            increase_data(db_path, cursor, db, 'Name2Id', 'UsrName')
-            increase_update_data(db_path, cursor, db, 'DBInfo', 'tableIndex')
-            increase_data(db_path, cursor, db, 'MSG', 'MsgSvrID', exclude_column='localId')
-
-        tasks = []
-        for i in range(100):
-            db_path = db_file_name.replace('0', f'{i}')
-            if os.path.exists(db_path):
-                # print('初始化数据库：', db_path)
-                file_name = os.path.basename(db_path)
-                if file_name in self.db_file_name:
-                    index = self.db_file_name.index(file_name)
-                    db = self.DB[index]
-                    cursor = db.cursor()
-                    task_(db_path, cursor, db)
-                    tasks.append([db_path, cursor, db])
-                else:
-                    shutil.copy(db_path, os.path.join(self.db_dir, 'Multi', file_name))
-        # print(tasks)
-        # 使用线程池 (没有加快合并速度)
-        # with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
-        #     executor.map(lambda args: task_(*args), tasks)
-        self.commit()
-        print(len(tasks))
+        MergeCoordinator().add_tasks(self.merge_tasks(db_file_name)).run()
@@ -5,6 +5,8 @@ from datetime import date
 from typing import Tuple
 
 from wxManager.db_v3.msg import convert_to_timestamp
+from wxManager.model.db_model import connect, database_exists
+from wxManager.query_builder import Query
 
 lock = threading.Lock()
 DB = None
@@ -38,6 +40,8 @@ def singleton(cls):
 
 # @singleton
 class Sns:
+    columns = "FeedId,CreateTime,strftime('%Y-%m-%d %H:%M:%S',CreateTime,'unixepoch','localtime') as StrTime,Type,UserName,Status,StringId,Content"
+
     def __init__(self):
         self.DB = None
         self.cursor = None
@@ -49,13 +53,36 @@ class Sns:
         if not self.open_flag:
             if db_dir:
                 db_path = os.path.join(db_dir, 'Sns.db')
-            if os.path.exists(db_path):
-                self.DB = sqlite3.connect(db_path, check_same_thread=False)
+            if database_exists(db_path):
+                # 注册为内存数据库时打开内存中的 Sns.db
+                self.DB = connect(db_path)
                 # '''创建游标'''
                 self.cursor = self.DB.cursor()
                 self.open_flag = True
                 if lock.locked():
                     lock.release()
+                self.create_index()
+
+    def create_index(self):
+        """
+        按作者+时间、评论按FeedId建立索引，IF NOT EXISTS 保证只在第一次打开时真正建索引
+        """
+        sqls = [
+            "CREATE INDEX IF NOT EXISTS FeedsV20UserNameTimeIdx ON FeedsV20(UserName,CreateTime);",
+            "CREATE INDEX IF NOT EXISTS FeedsV20CreateTimeIdx ON FeedsV20(CreateTime);",
+            "CREATE INDEX IF NOT EXISTS CommentV20FeedIdIdx ON CommentV20(FeedId);",
+        ]
+        try:
+            lock.acquire(True)
+            for sql in sqls:
+                self.cursor.execute(sql)
+            self.DB.commit()
+            return True
+        except sqlite3.Error:
+            # 只读数据库无法建索引，退化为全表扫描
+            return False
+        finally:
+            lock.release()
 
     def close(self):
         if self.open_flag:
@@ -86,6 +113,16 @@ class Sns:
             lock.release()
         return ''
 
+    def _query(self, sql, args):
+        result = []
+        try:
+            lock.acquire(True)
+            self.cursor.execute(sql, args)
+            result = self.cursor.fetchall()
+        finally:
+            lock.release()
+        return result
+
     def get_feeds(
             self,
             time_range: Tuple[int | float | str | date, int | float | str | date] = None,
@@ -106,22 +143,11 @@ class Sns:
         """
         if not self.open_flag:
             return None
-        if time_range:
-            start_time, end_time = convert_to_timestamp(time_range)
-        result = []
-        sql = f'''
-                select FeedId,CreateTime,strftime('%Y-%m-%d %H:%M:%S',CreateTime,'unixepoch','localtime') as StrTime,Type,UserName,Status,StringId,Content
-                from FeedsV20
-                {'where  CreateTime>' + str(start_time) + ' AND CreateTime<' + str(end_time) if time_range else ''}
-                order by CreateTime
-            '''
-        try:
-            lock.acquire(True)
-            self.cursor.execute(sql)
-            result = self.cursor.fetchall()
-        finally:
-            lock.release()
-        return result
+        sql, args = (Query(Sns.columns, 'FeedsV20')
+                     .time_range('CreateTime', time_range)
+                     .order_by('CreateTime')
+                     .build())
+        return self._query(sql, args)
 
     def get_feeds_by_username(
             self,
@@ -143,23 +169,75 @@ class Sns:
         """
         if not self.open_flag:
             return []
+        sql, args = (Query(Sns.columns, 'FeedsV20')
+                     .where('UserName = ?', username)
+                     .time_range('CreateTime', time_range)
+                     .order_by('CreateTime')
+                     .build())
+        return self._query(sql, args)
+
+    def get_latest_feeds(self, username='', num=10):
+        """
+        获取最新的num条朋友圈，按时间倒序
+        @param username: 为空时不区分作者
+        @param num:
+        @return: 同get_feeds
+        """
+        if not self.open_flag:
+            return []
+        sql = f'''
+                select {Sns.columns}
+                from FeedsV20
+                {'where UserName=?' if username else ''}
+                order by CreateTime desc
+                limit ?
+            '''
+        return self._query(sql, [username, num] if username else [num])
+
+    def iter_feeds(
+            self,
+            username='',
+            time_range: Tuple[int | float | str | date, int | float | str | date] = None,
+            page_size=500,
+    ):
+        """
+        分页遍历朋友圈，按(CreateTime,FeedId)做游标，每页都是一次索引范围查询
+        @param username: 为空时不区分作者
+        @param time_range:
+        @param page_size:
+        @return: 生成器，每次返回一页，格式同get_feeds
+        """
+        if not self.open_flag:
+            return
+        start_time, end_time = convert_to_timestamp(time_range) if time_range else (0, 0)
+        conditions = ['(CreateTime,FeedId) > (?,?)']
+        if username:
+            conditions.append('UserName=?')
         if time_range:
-            start_time, end_time = convert_to_timestamp(time_range)
-        result = []
+            conditions.append('CreateTime < ?')
         sql = f'''
-                select FeedId,CreateTime,strftime('%Y-%m-%d %H:%M:%S',CreateTime,'unixepoch','localtime') as StrTime,Type,UserName,Status,StringId,Content
+                select {Sns.columns}
                 from FeedsV20
-                where UserName=?
-                {' AND CreateTime > ' + str(start_time) + ' AND CreateTime < ' + str(end_time) if time_range else ''} 
-                order by CreateTime
+                where {' AND '.join(conditions)}
+                order by CreateTime,FeedId
+                limit ?
             '''
-        try:
-            lock.acquire(True)
-            self.cursor.execute(sql, [username])
-            result = self.cursor.fetchall()
-        finally:
-            lock.release()
-        return result
+        # 起始游标，CreateTime取start_time保证与get_feeds一样是开区间
+        last_time, last_feed_id = start_time, 2 ** 63 - 1 if time_range else -2 ** 63
+        while True:
+            args = [last_time, last_feed_id]
+            if username:
+                args.append(username)
+            if time_range:
+                args.append(end_time)
+            args.append(page_size)
+            page = self._query(sql, args)
+            if not page:
+                break
+            yield page
+            if len(page) < page_size:
+                break
+            last_feed_id, last_time = page[-1][0], page[-1][1]
 
     def get_comment(self, feed_id):
         """
@@ -194,5 +272,37 @@ class Sns:
             lock.release()
         return result
 
+    def get_interactions(self, start_time=0, end_time=None):
+        """
+        获取所有朋友圈的点赞和评论，附带朋友圈作者，用于构建互动关系图
+        @param start_time: 只返回该时间（含）之后的互动
+        @param end_time: 只返回该时间（含）之前的互动，None 表示不限
+        @return: List[
+            a[0]:FeedId,
+            a[1]:UserName,朋友圈作者wxid,
+            a[2]:CreateTime,时间戳,
+            a[3]:CommentType,1=点赞,2=评论,
+            a[4]:FromUserName,
+            a[5]:ReplyUserName
+        ]
+        """
+        if not self.open_flag:
+            return []
+        result = []
+        sql = f'''
+                select CommentV20.FeedId,FeedsV20.UserName,CommentV20.CreateTime,CommentType,FromUserName,ReplyUserName
+                from CommentV20
+                join FeedsV20 on CommentV20.FeedId = FeedsV20.FeedId
+                where CommentV20.CreateTime >= ? {'and CommentV20.CreateTime <= ?' if end_time is not None else ''}
+                order by CommentV20.CreateTime
+            '''
+        try:
+            lock.acquire(True)
+            self.cursor.execute(sql, [start_time] if end_time is None else [start_time, end_time])
+            result = self.cursor.fetchall()
+        finally:
+            lock.release()
+        return result
+
     def __del__(self):
         self.close()
\ No newline at end of file
@@ -10,8 +10,6 @@
 """
 import concurrent
 import hashlib
-import os
-import shutil
 import sqlite3
 import threading
 from concurrent.futures import ThreadPoolExecutor
@@ -19,8 +17,10 @@ from datetime import date, datetime
 from typing import Tuple
 
 from wxManager import MessageType
-from wxManager.merge import increase_data, increase_update_data
+from wxManager.merge_coordinator import MergeCoordinator, MergeTable, series_tasks
 from wxManager.model.db_model import DataBaseBase
+from wxManager.db_v4.shard_catalog import ShardCatalog
+from wxManager.query_builder import Query, ensure_index
 
 
 def convert_to_timestamp_(time_input) -> int:
@@ -63,10 +63,35 @@ def get_local_type(type_: MessageType):
 
 class BizMessageDB(DataBaseBase):
     columns = (
-        "local_id,server_id,local_type,sort_seq,Name2Id.user_name as sender_username,create_time,strftime('%Y-%m-%d %H:%M:%S',"
-        "create_time,'unixepoch','localtime') as StrTime,status,upload_status,server_seq,origin_source,source,"
+        # StrTime 占位，格式化时间由 Message.str_time 按需计算
+        "local_id,server_id,local_type,sort_seq,Name2Id.user_name as sender_username,create_time,'' as StrTime,"
+        "status,upload_status,server_seq,origin_source,source,"
         "message_content,compress_content")
 
+    def self_init(self):
+        # 分片目录，查询前筛掉没有该会话或不在时间范围内的分片
+        self.catalog = ShardCatalog(self, 'Msg_*')
+        self.indexed_tables = set()
+
+    def prepare_indexes(self, table_name, shards):
+        """
+        第一次查询某个会话时，在可能有结果的分片上补上按时间、按类型+时间查询的索引
+        @param table_name: Msg_<md5>
+        @param shards: 分片序号
+        """
+        for index in shards:
+            if (index, table_name) in self.indexed_tables:
+                continue
+            conn = self.DB[index]
+            ensure_index(conn, table_name, ('create_time',))
+            ensure_index(conn, table_name, ('local_type', 'create_time'))
+            self.indexed_tables.add((index, table_name))
+
+    def shard_readers(self, table_name, time_range=None):
+        shards = self.catalog.shards_for(table_name, time_range=convert_to_timestamp(time_range) if time_range else None)
+        self.prepare_indexes(table_name, shards)
+        return [self.reader(index) for index in shards]
+
     def get_messages(self):
         pass
 
@@ -82,17 +107,11 @@ class BizMessageDB(DataBaseBase):
         table_name = f'Msg_{hashlib.md5(username.encode("utf-8")).hexdigest()}'
         if not self.table_exists(cursor, table_name):
             return None
-        if time_range:
-            start_time, end_time = convert_to_timestamp(time_range)
-        sql = f'''
-select {BizMessageDB.columns}
-from {table_name} as msg
-join Name2Id on msg.real_sender_id = Name2Id.rowid
-{'where create_time>' + str(start_time) + ' AND create_time<' + str(end_time) if time_range else ''}
-order by sort_seq
-        '''
-        cursor.execute(sql)
-        result = cursor.fetchall()
+        result = (Query(BizMessageDB.columns, f'{table_name} as msg')
+                  .join('join Name2Id on msg.real_sender_id = Name2Id.rowid')
+                  .time_range('create_time', time_range)
+                  .order_by('sort_seq')
+                  .fetchall(cursor))
         if result:
             return result
         else:
@@ -100,11 +119,13 @@ order by sort_seq
 
     def get_messages_by_username(self, username: str,
                                  time_range: Tuple[int | float | str | date, int | float | str | date] = None, ):
-        with concurrent.futures.ThreadPoolExecutor() as executor:
+        table_name = f'Msg_{hashlib.md5(username.encode("utf-8")).hexdigest()}'
+        readers = self.shard_readers(table_name, time_range)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(readers), 1)) as executor:
             # 创建一个任务列表
             futures = [
                 executor.submit(self._get_messages_by_username, db.cursor(), username, time_range)
-                for db in self.DB
+                for db in readers
             ]
 
             # 等待所有任务完成，并获取结果
@@ -136,7 +157,7 @@ order by sort_seq
 
         # 使用线程池
         with ThreadPoolExecutor(max_workers=len(self.DB)) as executor:
-            executor.map(task, self.DB)
+            executor.map(task, self.readers())
         self.commit()
         return results
 
@@ -173,7 +194,7 @@ from {table_name} as msg
 join Name2Id on msg.real_sender_id = Name2Id.rowid
 where server_id = ?
 '''
-        for db in self.DB:
+        for db in self.catalog.readers(table_name, server_id=server_id):
             cursor = db.cursor()
             if not self.table_exists(cursor, table_name):
                 continue
@@ -184,6 +205,8 @@ where server_id = ?
 
     def get_messages_by_num(self, username, start_sort_seq, msg_num=20):
         results = []
+        table_name = f'Msg_{hashlib.md5(username.encode("utf-8")).hexdigest()}'
+        readers = self.catalog.readers(table_name, sort_seq_before=start_sort_seq)
         # for db in self.DB:
         #     cursor = db.cursor()
         #     yield self._get_messages_by_num(cursor, username, start_sort_seq, msg_num)
@@ -202,9 +225,8 @@ where server_id = ?
                 cursor.close()
 
         # 使用线程池
-        with ThreadPoolExecutor(max_workers=len(self.DB)) as executor:
-            executor.map(task, self.DB)
-        self.commit()
+        with ThreadPoolExecutor(max_workers=max(len(readers), 1)) as executor:
+            executor.map(task, readers)
         return results
 
     def _get_messages_calendar(self, cursor, username):
@@ -226,7 +248,8 @@ where server_id = ?
 
     def get_messages_calendar(self, username):
         res = []
-        for db in self.DB:
+        table_name = f'Msg_{hashlib.md5(username.encode("utf-8")).hexdigest()}'
+        for db in self.catalog.readers(table_name):
             r1 = self._get_messages_calendar(db.cursor(), username)
             if r1:
                 res.extend(r1)
@@ -238,18 +261,13 @@ where server_id = ?
         table_name = f'Msg_{hashlib.md5(username.encode("utf-8")).hexdigest()}'
         if not self.table_exists(cursor, table_name):
             return None
-        if time_range:
-            start_time, end_time = convert_to_timestamp(time_range)
         local_type = get_local_type(type_)
-        sql = f'''
-select {BizMessageDB.columns}
-from {table_name} as msg
-join Name2Id on msg.real_sender_id = Name2Id.rowid
-where local_type=? {'and create_time>' + str(start_time) + ' AND create_time<' + str(end_time) if time_range else ''}
-order by sort_seq
-        '''
-        cursor.execute(sql, [local_type])
-        result = cursor.fetchall()
+        result = (Query(BizMessageDB.columns, f'{table_name} as msg')
+                  .join('join Name2Id on msg.real_sender_id = Name2Id.rowid')
+                  .where('local_type = ?', local_type)
+                  .time_range('create_time', time_range)
+                  .order_by('sort_seq')
+                  .fetchall(cursor))
         if result:
             return result
         else:
@@ -257,11 +275,13 @@ order by sort_seq
 
     def get_messages_by_type(self, username: str, type_: MessageType,
                              time_range: Tuple[int | float | str | date, int | float | str | date] = None, ):
-        with concurrent.futures.ThreadPoolExecutor() as executor:
+        table_name = f'Msg_{hashlib.md5(username.encode("utf-8")).hexdigest()}'
+        readers = self.shard_readers(table_name, time_range)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(readers), 1)) as executor:
             # 创建一个任务列表
             futures = [
                 executor.submit(self._get_messages_by_type, db.cursor(), username, type_, time_range)
-                for db in self.DB
+                for db in readers
             ]
 
             # 等待所有任务完成，并获取结果
@@ -274,43 +294,25 @@ order by sort_seq
 
         return results
 
-    def merge(self, db_file_name):
-        def task_(db_path, cursor, db):
-            """
-            每个线程执行的任务，获取某个数据库实例中的查询结果。
-            """
-            increase_data(db_path, cursor, db, 'Name2Id', 'user_name')
-            increase_update_data(db_path, cursor, db, 'TimeStamp', 'timestamp')
-            tgt_conn = sqlite3.connect(db_path)
-            tgt_cur = tgt_conn.cursor()
-            tgt_cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            result = tgt_cur.fetchall()
-            tgt_cur.close()
+    def merge_tasks(self, db_file_name):
+        return series_tasks(self, db_file_name, 'message', self._merge_tables)
+
+    @staticmethod
+    def _merge_tables(db_path):
+        """新数据库中的表，每个会话一张 Msg_xxx"""
+        tgt_conn = sqlite3.connect(db_path)
+        try:
+            result = tgt_conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name GLOB 'Msg*';"
+            ).fetchall()
+        finally:
             tgt_conn.close()
-            # print(result)
-            if result:
-                for row in result:
-                    table_name = row[0]
-                    if table_name.startswith('Msg'):
-                        increase_data(db_path, cursor, db, table_name, 'server_id', exclude_column='local_id')
-
-        tasks = []
-        for i in range(100):
-            db_path = db_file_name.replace('0', f'{i}')
-            if os.path.exists(db_path):
-                # print('初始化数据库：', db_path)
-                file_name = os.path.basename(db_path)
-                if file_name in self.db_file_name:
-                    index = self.db_file_name.index(file_name)
-                    db = self.DB[index]
-                    cursor = db.cursor()
-                    task_(db_path, cursor, db)
-                    tasks.append([db_path, cursor, db])
-                else:
-                    shutil.copy(db_path, os.path.join(self.db_dir, 'message'))
-        # print(tasks)
-        # 使用线程池 (没有加快合并速度)
-        # with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
-        #     executor.map(lambda args: task_(*args), tasks)
-        self.commit()
-        print(len(tasks))
+        tables = [
+            MergeTable('Name2Id', 'user_name'),
+            MergeTable('TimeStamp', 'timestamp', update=True),
+        ]
+        tables.extend(MergeTable(row[0], 'server_id', exclude_column='local_id') for row in result)
+        return tables
+
+    def merge(self, db_file_name):
+        MergeCoordinator().add_tasks(self.merge_tasks(db_file_name)).run()
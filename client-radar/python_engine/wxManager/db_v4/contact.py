@@ -9,6 +9,7 @@
 @Description : 
 """
 import os
+import sqlite3
 import traceback
 
 from wxManager.merge import increase_update_data, increase_data
@@ -27,26 +28,48 @@ class ContactDB(DataBaseBase):
         except:
             return False
 
+    def self_init(self):
+        # 标签表很小，每次打开数据库时整张读进来，之后按 id 查名称不再查询数据库
+        self.label_catalog = None
+
+    def get_label_catalog(self) -> dict:
+        """
+        @return: {label_id_(str): label_name_}
+        """
+        if self.label_catalog is None:
+            sql = '''
+                select label_id_, label_name_ from contact_label
+            '''
+            try:
+                cursor = self.DB.cursor()
+                cursor.execute(sql)
+                self.label_catalog = {str(label_id): name for label_id, name in cursor.fetchall()}
+                cursor.close()
+            except sqlite3.Error:
+                self.label_catalog = {}
+        return self.label_catalog
+
     def get_label_by_id(self, label_id) -> str:
-        sql = '''
-            select label_name_ from contact_label
-            where label_id_ = ?
-        '''
-        try:
-            cursor = self.DB.cursor()
-            cursor.execute(sql, [label_id])
-            result = cursor.fetchone()
-            if result:
-                return result[0]
-            else:
-                return ''
-        except:
+        if not self.open_flag:
             return ''
+        return self.get_label_catalog().get(str(label_id), '')
+
+    def get_label_names(self, label_id_lists) -> list:
+        """
+        批量把标签 id 列表转换成标签名
+        @param label_id_lists: ['1,2,', '3', ...]
+        @return: [['同事', '朋友'], ['家人'], ...]，与输入一一对应
+        """
+        catalog = self.get_label_catalog() if self.open_flag else {}
+        return [
+            [catalog.get(label_id, '') for label_id in label_id_list.strip(',').split(',')] if label_id_list else []
+            for label_id_list in label_id_lists
+        ]
 
     def get_labels(self, label_id_list) -> str:
         if not label_id_list:
             return ''
-        return ','.join(map(self.get_label_by_id, label_id_list.strip(',').split(',')))
+        return ','.join(self.get_label_names([label_id_list])[0])
 
     def get_contacts(self):
         if not self.open_flag:
@@ -143,6 +166,7 @@ where username=?
             increase_update_data(db_path, self.cursor, self.DB, 'openim_appid', 'lang_id')
             # increase_update_data(db_path, self.cursor, self.DB, 'chat_room_member', 'room_id_')
             increase_data(db_path, self.cursor, self.DB, 'name2id', 'username')
+            self.label_catalog = None
         except:
             print(f"数据库操作错误: {traceback.format_exc()}")
             self.DB.rollback()
@@ -9,13 +9,42 @@
 @Description : 
 """
 import os
+import sqlite3
+import threading
 import traceback
 
+from wxManager.log import logger
 from wxManager.merge import increase_data
 from wxManager.model import DataBaseBase
 
 
 class EmotionDB(DataBaseBase):
+    def self_init(self):
+        # md5 -> (aes_key, thumb_url, cdn_url)，第一次查询时整张表读进来
+        self.emoji_catalog = None
+        self.catalog_lock = threading.Lock()
+
+    def preload(self) -> dict:
+        """
+        一次读取 kNonStoreEmoticonTable，之后每条表情消息只查一次 dict
+        @return: {md5: (aes_key, thumb_url, cdn_url)}
+        """
+        with self.catalog_lock:
+            if self.emoji_catalog is None:
+                sql = '''
+                select md5,aes_key,thumb_url,cdn_url
+                from kNonStoreEmoticonTable
+                '''
+                try:
+                    cursor = self.reader().cursor()
+                    cursor.execute(sql)
+                    self.emoji_catalog = {row[0]: row[1:] for row in cursor.fetchall()}
+                    cursor.close()
+                except sqlite3.Error:
+                    logger.error(f'表情表读取失败\n{traceback.format_exc()}')
+                    self.emoji_catalog = {}
+            return self.emoji_catalog
+
     def get_emoji_url(self, md5, thumb=False):
         emoji_info = self._get_emoji_info(md5)
         if emoji_info:
@@ -24,18 +53,10 @@ class EmotionDB(DataBaseBase):
             return ''
 
     def _get_emoji_info(self, md5):
-        sql = '''
-        select aes_key,thumb_url,cdn_url
-        from kNonStoreEmoticonTable
-        where md5=?
-        '''
-        cursor = self.DB.cursor()
-        cursor.execute(sql, [md5])
-        result = cursor.fetchone()
-        if result:
-            return result
-        else:
+        if not self.open_flag or not md5:
             return None
+        catalog = self.emoji_catalog if self.emoji_catalog is not None else self.preload()
+        return catalog.get(md5)
 
     def merge(self, db_path):
         if not (os.path.exists(db_path) or os.path.isfile(db_path)):
@@ -47,6 +68,7 @@ class EmotionDB(DataBaseBase):
             increase_data(db_path, self.cursor, self.DB, 'kStoreEmoticonCaptionsTable', 'md5_')
             increase_data(db_path, self.cursor, self.DB, 'kStoreEmoticonFilesTable', 'md5_')
             increase_data(db_path, self.cursor, self.DB, 'kStoreEmoticonPackageTable', 'package_id_')
+            self.emoji_catalog = None
         except:
             print(f"数据库操作错误: {traceback.format_exc()}")
             self.DB.rollback()
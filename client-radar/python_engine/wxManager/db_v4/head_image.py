@@ -40,6 +40,28 @@ where username = ?
         else:
             return b''
 
+    def iter_avatars(self, batch_size=500):
+        """
+        顺序扫描一遍 head_image，按批读取
+        @return: 生成器 (username, md5, image_buffer)
+        """
+        if not self.open_flag:
+            return
+        sql = '''
+select username, md5, image_buffer
+from head_image
+        '''
+        cursor = self.reader().cursor()
+        try:
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
     def set_avatar_buffer(self, username, img_path):
         try:
             # 打开图片并缩放
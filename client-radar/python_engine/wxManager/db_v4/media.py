@@ -10,26 +10,22 @@
 """
 import os
 import shutil
-import subprocess
-import sys
 import traceback
+from typing import Dict, Iterable, Tuple
 
+from wxManager.audio_transcoder import AudioTranscoder
 from wxManager.merge import increase_update_data, increase_data
 from wxManager.model import DataBaseBase
-from wxManager.log import logger
-
-
-def get_ffmpeg_path():
-    # 获取打包后的资源目录
-    resource_dir = getattr(sys, '_MEIPASS', os.path.abspath(os.path.dirname(__file__)))
-
-    # 构建 FFmpeg 可执行文件的路径
-    ffmpeg_path = os.path.join(resource_dir, 'app', 'resources', 'data', 'ffmpeg.exe')
-
-    return ffmpeg_path
+from wxManager.db_v4.shard_catalog import ShardCatalog
 
 
 class MediaDB(DataBaseBase):
+    def self_init(self):
+        # 语音按 svr_id 查询，目录记录每个分片 svr_id 的范围
+        self.catalog = ShardCatalog(self, 'VoiceInfo', {'server_id': 'svr_id'})
+        # 转码结果按 svr_id 缓存，同一条语音多次导出只转码一次
+        self.transcoder = AudioTranscoder(os.path.join(self.db_dir, 'audio_cache'))
+
     def get_media_buffer(self, server_id) -> bytes:
         sql = '''
         select voice_data
@@ -38,7 +34,7 @@ class MediaDB(DataBaseBase):
         '''
         if not self.DB:
             return b''
-        for db in self.DB:
+        for db in self.catalog.readers('VoiceInfo', server_id=server_id):
             cursor = db.cursor()
             cursor.execute(sql, [server_id])
             result = cursor.fetchone()
@@ -52,51 +48,50 @@ class MediaDB(DataBaseBase):
         else:
             return f'{output_dir}/{server_id}.mp3'
 
+    def get_media_buffers(self, server_ids) -> Dict[int, bytes]:
+        """
+        批量读取语音数据，每个分片每 500 个 svr_id 查询一次
+        @param server_ids:
+        @return: {server_id: voice_data}，找不到的不在结果中
+        """
+        keys = {int(server_id): server_id for server_id in server_ids}
+        results = {}
+        if not self.DB:
+            return results
+        for db in self.readers():
+            remaining = [key for key in keys if keys[key] not in results]
+            cursor = db.cursor()
+            for i in range(0, len(remaining), 500):
+                chunk = remaining[i:i + 500]
+                sql = f'select svr_id, voice_data from VoiceInfo where svr_id in ({",".join("?" * len(chunk))})'
+                cursor.execute(sql, chunk)
+                for svr_id, voice_data in cursor.fetchall():
+                    if svr_id in keys:
+                        results[keys[svr_id]] = voice_data
+            cursor.close()
+            if len(results) == len(keys):
+                break
+        return results
+
     def get_audio(self, server_id, output_dir, filename=''):
+        if not self.DB:
+            return ''
         if not filename:
             filename = server_id
-        silk_path = f"{output_dir}/{filename}.silk"
-        pcm_path = f"{output_dir}/{filename}.pcm"
         mp3_path = f"{output_dir}/{filename}.mp3"
-        if os.path.exists(mp3_path):
-            return mp3_path
-        buf = self.get_media_buffer(server_id)
-        if not buf:
-            return ''
-        with open(silk_path, "wb") as f:
-            f.write(buf)
-        # open(silk_path, "wb").write()
-        try:
-            decode(silk_path, pcm_path, 44100)
-            # 调用系统上的 ffmpeg 可执行文件
-            # 获取 FFmpeg 可执行文件的路径
-            ffmpeg_path = get_ffmpeg_path()
-            # # 调用 FFmpeg
-            if os.path.exists(ffmpeg_path):
-                cmd = f'''"{ffmpeg_path}" -loglevel quiet -y -f s16le -i "{pcm_path}" -ar 44100 -ac 1 "{mp3_path}"'''
-                # system(cmd)
-                # 使用subprocess.run()执行命令
-                subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            else:
-                # 源码运行的时候下面的有效
-                # 这里不知道怎么捕捉异常
-                cmd = f'''"{os.path.join(os.getcwd(), 'app', 'resources', 'data', 'ffmpeg.exe')}" -loglevel quiet -y -f s16le -i "{pcm_path}" -ar 44100 -ac 1 "{mp3_path}"'''
-                # system(cmd)
-                # 使用subprocess.run()执行命令
-                subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if os.path.exists(silk_path):
-                os.remove(silk_path)
-            if os.path.exists(pcm_path):
-                os.remove(pcm_path)
-        except Exception as e:
-            print(f"Error: {e}")
-            logger.error(f'语音错误\n{traceback.format_exc()}')
-            cmd = f'''"{os.path.join(os.getcwd(), 'app', 'resources', 'data', 'ffmpeg.exe')}" -loglevel quiet -y -f s16le -i "{pcm_path}" -ar 44100 -ac 1 "{mp3_path}"'''
-            # system(cmd)
-            # 使用subprocess.run()执行命令
-            subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        finally:
-            return mp3_path
+        return self.transcoder.transcode_batch([(server_id, mp3_path)], self.get_media_buffers).get(server_id, '')
+
+    def get_audios(self, items: Iterable[Tuple[int, str]], output_dir) -> Dict[int, str]:
+        """
+        批量导出语音
+        @param items: (server_id, filename)，filename 为空时使用 server_id
+        @param output_dir:
+        @return: {server_id: mp3 路径}，失败的为空字符串
+        """
+        if not self.DB:
+            return {}
+        jobs = [(server_id, f"{output_dir}/{filename or server_id}.mp3") for server_id, filename in items]
+        return self.transcoder.transcode_batch(jobs, self.get_media_buffers)
 
     def merge(self, db_path):
         # todo 判断数据库对应情况
@@ -12,7 +12,7 @@ import os
 import traceback
 
 from wxManager.merge import increase_update_data
-from wxManager.model.db_model import DataBaseBase
+from wxManager.model.db_model import DataBaseBase, attach
 
 
 class SessionDB(DataBaseBase):
@@ -32,6 +32,51 @@ order by sort_timestamp desc
         else:
             return []
 
+    def get_sessions_enriched(self, contact_db_path, head_image_db_path='', limit=-1, offset=0, with_avatar=False):
+        """
+        会话列表，ATTACH 联系人库和头像库后一次 JOIN 取出侧边栏需要的所有字段
+        @param contact_db_path: contact/contact.db
+        @param head_image_db_path: head_image/head_image.db，为空时头像列为 NULL
+        @param limit: 每页数量，-1 表示不分页
+        @param offset:
+        @param with_avatar: 是否同时返回头像数据，否则只返回头像 md5
+        @return: List[
+            a[0]~a[10]: 同 get_session
+            a[11]:remark
+            a[12]:nick_name
+            a[13]:alias
+            a[14]:local_type
+            a[15]:small_head_url
+            a[16]:big_head_url
+            a[17]:头像md5
+            a[18]:头像数据
+        ]
+        """
+        if not self.open_flag:
+            return []
+        conn = self.reader()
+        has_contact = attach(conn, 'contact_db', contact_db_path)
+        has_head_image = attach(conn, 'head_image_db', head_image_db_path)
+        contact_columns = 'c.remark, c.nick_name, c.alias, c.local_type, c.small_head_url, c.big_head_url' \
+            if has_contact else 'NULL, NULL, NULL, NULL, NULL, NULL'
+        head_columns = f'h.md5, {"h.image_buffer" if with_avatar else "NULL"}' if has_head_image else 'NULL, NULL'
+        sql = f'''
+select s.username, s.type, s.unread_count, s.unread_first_msg_srv_id, s.last_timestamp, s.summary, s.last_msg_type,
+    s.last_msg_sub_type, strftime('%Y/%m/%d', s.last_timestamp, 'unixepoch','localtime') AS strTime,
+    s.last_sender_display_name, s.last_msg_sender, {contact_columns}, {head_columns}
+from SessionTable AS s
+{'left join contact_db.contact AS c on c.username = s.username' if has_contact else ''}
+{'left join head_image_db.head_image AS h on h.username = s.username' if has_head_image else ''}
+order by s.sort_timestamp desc
+limit ? offset ?
+        '''
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, [limit, offset])
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
     def merge(self, db_path):
         if not (os.path.exists(db_path) or os.path.isfile(db_path)):
             print(f'{db_path} 不存在')
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 20:30
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-shard_catalog.py
+@Description : message_0.db、message_1.db…… 分片目录
+
+记录每个分片中有哪些 Msg_<md5> 表，以及每张表的行数、sort_seq/create_time/server_id 的范围，
+查询前先用目录筛掉不可能有结果的分片，不必每个分片都查一遍 sqlite_master 和数据
+
+目录保存在分片旁边的 json 文件中：
+    - 分片文件的 mtime 和大小没变时直接使用，进程重启也不用重新统计
+    - 分片变化时只统计每张表 rowid 大于上次最大 rowid 的新行（合并只会追加），rowid 变小说明表被重建，整表重新统计
+"""
+import json
+import os
+import sqlite3
+import threading
+import traceback
+from typing import Dict, List
+
+from wxManager.log import logger
+
+CATALOG_VERSION = 1
+
+# 统计的范围列，在表中不存在的列范围为 None
+RANGE_COLUMNS = ('sort_seq', 'create_time', 'server_id')
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        return None
+
+
+def _merge_min(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+def _merge_max(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def _overlaps(stats, column, start=None, end=None):
+    """表中 column 的范围与开区间 (start, end) 是否有交集，范围未知时认为有"""
+    low, high = stats.get(f'min_{column}'), stats.get(f'max_{column}')
+    if low is None or high is None:
+        return True
+    if start is not None and high <= start:
+        return False
+    if end is not None and low >= end:
+        return False
+    return True
+
+
+class ShardCatalog:
+    """
+    使用示例：
+    catalog = ShardCatalog(message_db, 'Msg_*')
+    for conn in catalog.readers(table_name, time_range=(start, end)):
+        ...
+    """
+
+    def __init__(self, db, table_pattern='Msg_*', columns: Dict[str, str] = None, cache_file=None):
+        """
+        @param db: is_series 的 DataBaseBase，使用它的只读连接统计
+        @param table_pattern: 需要统计的表名（GLOB）
+        @param columns: 范围列在表中的实际列名，如 MediaDB 的 {'server_id': 'svr_id'}
+        @param cache_file: 目录保存路径，默认为第一个分片旁边的 <分片名>.catalog.json，为空字符串时不保存
+        """
+        self.db = db
+        self.table_pattern = table_pattern
+        self.columns = {column: column for column in RANGE_COLUMNS}
+        self.columns.update(columns or {})
+        self.cache_file = cache_file
+        self.shards = {}  # 分片文件名 -> {'stamp': [mtime_ns, size], 'tables': {表名: 统计}}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _cache_path(self):
+        if self.cache_file is not None:
+            return self.cache_file
+        pools = self.db.reader_pools or []
+        if not pools:
+            return ''
+        return pools[0].db_path + '.catalog.json'
+
+    def _load(self):
+        path = self._cache_path()
+        if not path:
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == CATALOG_VERSION and data.get('table_pattern') == self.table_pattern:
+            self.shards = data.get('shards', {})
+
+    def _save(self):
+        path = self._cache_path()
+        if not path:
+            return
+        data = {'version': CATALOG_VERSION, 'table_pattern': self.table_pattern, 'shards': self.shards}
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # 目录只读时只在内存中使用
+            logger.error(f'分片目录保存失败: {path}')
+
+    def _table_stats(self, cursor, table_name, old):
+        """统计一张表，old 不为空时只统计 rowid 大于 old['max_rowid'] 的新行"""
+        existing = {info[1] for info in cursor.execute(f'PRAGMA table_info("{table_name}")').fetchall()}
+        max_rowid = cursor.execute(f'SELECT max(rowid) FROM "{table_name}"').fetchone()[0] or 0
+        if old and max_rowid < old.get('max_rowid', 0):
+            old = None  # 表被重建
+        after = old['max_rowid'] if old else 0
+        if old and max_rowid == after:
+            return old
+        selects = ['count(*)', 'max(rowid)']
+        for column in RANGE_COLUMNS:
+            real = self.columns[column]
+            if real in existing:
+                selects.extend([f'min("{real}")', f'max("{real}")'])
+            else:
+                selects.extend(['NULL', 'NULL'])
+        row = cursor.execute(f'SELECT {", ".join(selects)} FROM "{table_name}" WHERE rowid > ?', [after]).fetchone()
+        stats = {'rows': row[0], 'max_rowid': row[1] or after}
+        for i, column in enumerate(RANGE_COLUMNS):
+            stats[f'min_{column}'] = row[2 + 2 * i]
+            stats[f'max_{column}'] = row[3 + 2 * i]
+        if old:
+            stats['rows'] += old['rows']
+            for column in RANGE_COLUMNS:
+                stats[f'min_{column}'] = _merge_min(old.get(f'min_{column}'), stats[f'min_{column}'])
+                stats[f'max_{column}'] = _merge_max(old.get(f'max_{column}'), stats[f'max_{column}'])
+        return stats
+
+    def _scan(self, index, old):
+        cursor = self.db.reader(index).cursor()
+        try:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name GLOB ?", [self.table_pattern])
+            table_names = [row[0] for row in cursor.fetchall()]
+            old_tables = old.get('tables', {}) if old else {}
+            return {name: self._table_stats(cursor, name, old_tables.get(name)) for name in table_names}
+        finally:
+            cursor.close()
+
+    def refresh(self):
+        """检查分片文件是否变化，只重新统计变化了的分片"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+            file_names = list(self.db.db_file_name) if self.db.reader_pools else []
+            changed = False
+            for index, file_name in enumerate(file_names):
+                stamp = _stamp(self.db.reader_pools[index].db_path)
+                old = self.shards.get(file_name)
+                if old and old.get('stamp') == stamp:
+                    continue
+                try:
+                    tables = self._scan(index, old)
+                except sqlite3.Error:
+                    logger.error(f'分片 {file_name} 统计失败\n{traceback.format_exc()}')
+                    self.shards.pop(file_name, None)
+                    continue
+                self.shards[file_name] = {'stamp': stamp, 'tables': tables}
+                changed = True
+            for file_name in set(self.shards) - set(file_names):
+                del self.shards[file_name]
+                changed = True
+            if changed:
+                self._save()
+
+    def table_stats(self, table_name) -> List[dict]:
+        """
+        @return: 每个分片中该表的统计，没有该表的分片为 None
+        """
+        self.refresh()
+        file_names = list(self.db.db_file_name) if self.db.reader_pools else []
+        return [self.shards.get(name, {}).get('tables', {}).get(table_name) for name in file_names]
+
+    def shards_for(self, table_name, time_range=None, sort_seq_before=None, server_id=None) -> List[int]:
+        """
+        可能有结果的分片序号
+        @param table_name: Msg_<md5>
+        @param time_range: (start, end) 时间戳，开区间
+        @param sort_seq_before: 只要 sort_seq 小于该值的消息
+        @param server_id: 只要该 server_id 的消息
+        @return:
+        """
+        if server_id is not None:
+            try:
+                server_id = int(server_id)
+            except (TypeError, ValueError):
+                server_id = None
+        self.refresh()
+        file_names = list(self.db.db_file_name) if self.db.reader_pools else []
+        indexes = []
+        for index, file_name in enumerate(file_names):
+            shard = self.shards.get(file_name)
+            if shard is None:
+                # 统计失败的分片不能排除
+                indexes.append(index)
+                continue
+            stats = shard['tables'].get(table_name)
+            if not stats or not stats['rows']:
+                continue
+            if time_range and not _overlaps(stats, 'create_time', time_range[0], time_range[1]):
+                continue
+            if sort_seq_before is not None and not _overlaps(stats, 'sort_seq', end=sort_seq_before):
+                continue
+            if server_id is not None and not _overlaps(stats, 'server_id', server_id - 1, server_id + 1):
+                continue
+            indexes.append(index)
+        return indexes
+
+    def readers(self, table_name, **kwargs) -> List[sqlite3.Connection]:
+        """当前线程中可能有结果的分片的只读连接，参数同 shards_for"""
+        return [self.db.reader(index) for index in self.shards_for(table_name, **kwargs)]
+
+    def count(self, table_name) -> int:
+        """该表在所有分片中的总行数"""
+        return sum(stats['rows'] for stats in self.table_stats(table_name) if stats)
+
+
+if __name__ == '__main__':
+    pass
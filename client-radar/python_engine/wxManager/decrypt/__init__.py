@@ -12,12 +12,23 @@ from typing import List
 
 import psutil
 
-from wxManager.decrypt.wx_info_v3 import dump_wechat_info_v3
-from wxManager.decrypt.wx_info_v4 import dump_wechat_info_v4
 from wxManager.decrypt.common import WeChatInfo
 
 
+def __getattr__(name):
+    # wx_info_v3/wx_info_v4 依赖 pymem、yara、Crypto，用到时再导入
+    if name == 'dump_wechat_info_v3':
+        from wxManager.decrypt.wx_info_v3 import dump_wechat_info_v3 as value
+    elif name == 'dump_wechat_info_v4':
+        from wxManager.decrypt.wx_info_v4 import dump_wechat_info_v4 as value
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
 def get_info_v4() -> List[WeChatInfo]:
+    from wxManager.decrypt.wx_info_v4 import dump_wechat_info_v4
     result_v4 = []
     for process in psutil.process_iter(['name', 'exe', 'pid']):
         if process.name() == 'Weixin.exe':
@@ -37,6 +48,7 @@ def get_info_v4() -> List[WeChatInfo]:
 
 
 def get_info_v3(version_list) -> List[WeChatInfo]:
+    from wxManager.decrypt.wx_info_v3 import dump_wechat_info_v3
     result = []
     for process in psutil.process_iter(['name', 'exe', 'pid']):
         if process.name() == 'WeChat.exe':
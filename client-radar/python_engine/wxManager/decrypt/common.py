@@ -9,13 +9,14 @@
 @Description : 
 """
 import psutil
-import win32api
 
 if __name__ == '__main__':
     pass
 
 
 def get_version(pid):
+    # win32api 只在 Windows 上可用，放到这里导入，离线分析 dump 时不需要它
+    import win32api
     p = psutil.Process(pid)
     version_info = win32api.GetFileVersionInfo(p.exe(), '\\')
     version = f"{win32api.HIWORD(version_info['FileVersionMS'])}.{win32api.LOWORD(version_info['FileVersionMS'])}.{win32api.HIWORD(version_info['FileVersionLS'])}.{win32api.LOWORD(version_info['FileVersionLS'])}"
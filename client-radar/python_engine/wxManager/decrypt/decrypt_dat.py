@@ -8,10 +8,13 @@
 @File        : wxManager-decrypt_dat.py
 @Description : 微信4.0图片加密原理解析：https://blog.lc044.love/post/16
 """
+import json
 import os
 import struct
+import time
+from itertools import islice
 from typing import List, Tuple
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from aiofiles import open as aio_open
 from aiofiles.os import makedirs
 
@@ -26,6 +29,14 @@ pic_head = (0xff, 0xd8, 0x89, 0x50, 0x47, 0x49)
 decode_code = 0
 decode_code_v4 = -1
 
+# 异或密钥缓存文件，按 wx_dir 保存
+XOR_KEY_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.client-radar', 'xor_keys.json')
+# 至少这么多个文件推导出同一个密钥才采用
+XOR_SAMPLES = 3
+# 最多探测的 _t.dat 文件数
+XOR_MAX_PROBE_FILES = 2000
+_xor_key_memo = {}
+
 AES_KEY_MAP = {
     b'\x07\x08V1\x08\x07': b'cfcd208495d565ef',  # 4.0第一代图片密钥
     b'\x07\x08V2\x08\x07': b'43e7d25eb1b9bb64',  # 4.0第二代图片密钥，微信4.0.3正式版使用
@@ -120,6 +131,153 @@ def decode_dat(xor_key: int, file_path, out_path, dst_name='') -> str | bytes:
     return file_outpath
 
 
+def _read_head_tail(file_path, head_size=0xf, tail_size=2) -> Tuple[bytes, bytes]:
+    """
+    只读取文件头和文件尾，不读整个文件
+    """
+    fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        size = os.fstat(fd).st_size
+        if size < head_size + tail_size:
+            return b'', b''
+        if hasattr(os, 'pread'):
+            return os.pread(fd, head_size, 0), os.pread(fd, tail_size, size - tail_size)
+        # Windows 没有 os.pread
+        head = os.read(fd, head_size)
+        os.lseek(fd, size - tail_size, os.SEEK_SET)
+        return head, os.read(fd, tail_size)
+    finally:
+        os.close(fd)
+
+
+def probe_xor_key(file_path) -> int:
+    """
+    用一个 _t.dat 缩略图（jpg）推导异或密钥
+    :return: 推导失败时返回 -1
+    """
+    try:
+        header, file_tail = _read_head_tail(file_path)
+    except OSError:
+        return -1
+    if not is_v4_image(header):
+        return -1
+    jpg_known_tail = b'\xff\xd9'
+    xor_key = [c ^ p for c, p in zip(file_tail, jpg_known_tail)]
+    if len(xor_key) == 2 and xor_key[0] == xor_key[1]:
+        return xor_key[0]
+    return -1
+
+
+def iter_thumb_files(wx_dir, dir_names=('cache', 'temp', 'msg'), max_files=XOR_MAX_PROBE_FILES):
+    """
+    依次遍历各目录下的 _t.dat 文件，最多返回 max_files 个
+    """
+    num = 0
+    for dir_name in dir_names:
+        stack = [os.path.join(wx_dir, dir_name)]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith('_t.dat'):
+                    yield entry.path
+                    num += 1
+                    if num >= max_files:
+                        return
+
+
+class XorKeyResolver:
+    """
+    微信 4.0 图片异或密钥的查找与缓存
+    1. 进程内缓存
+    2. 本地缓存文件（按 wx_dir 保存），用保存时的样本文件复核，不一致就作废
+    3. 并行探测若干 _t.dat，多个文件的结果一致才采用
+    """
+
+    def __init__(self, cache_path=XOR_KEY_CACHE_PATH, samples=XOR_SAMPLES, max_workers=8):
+        """
+        @param cache_path: 本地缓存文件
+        @param samples: 需要多少个文件推导出同一个密钥才采用
+        @param max_workers: 探测文件的线程数
+        """
+        self.cache_path = cache_path
+        self.samples = samples
+        self.max_workers = max_workers
+
+    def _load(self) -> dict:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, wx_dir, xor_key, sample_files):
+        data = self._load()
+        data[wx_dir] = {'xor_key': xor_key, 'files': sample_files, 'updated': int(time.time())}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(self.cache_path + '.tmp', self.cache_path)
+        except OSError:
+            pass
+
+    def _load_cached(self, wx_dir) -> int:
+        entry = self._load().get(wx_dir)
+        if not entry:
+            return -1
+        xor_key = entry.get('xor_key', -1)
+        # 样本文件还在时复核一次；都不在了也无法判断对错，直接使用
+        checked = [probe_xor_key(file) for file in entry.get('files', []) if os.path.exists(file)]
+        if any(key != xor_key for key in checked if key != -1):
+            return -1
+        return xor_key
+
+    def _discover(self, wx_dir) -> Tuple[int, List[str]]:
+        votes = {}
+        files = {}
+        file_iter = iter_thumb_files(wx_dir)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                batch = list(islice(file_iter, self.max_workers * 4))
+                if not batch:
+                    break
+                for file_path, xor_key in zip(batch, executor.map(probe_xor_key, batch)):
+                    if xor_key != -1:
+                        votes[xor_key] = votes.get(xor_key, 0) + 1
+                        files.setdefault(xor_key, []).append(file_path)
+                if votes and max(votes.values()) >= self.samples:
+                    break
+        if not votes:
+            return -1, []
+        xor_key = max(votes, key=votes.get)
+        if len(votes) > 1:
+            print(f'[!] 异或密钥不一致：{ {hex(k): v for k, v in votes.items()} }，采用 0x{xor_key:x}')
+        return xor_key, files[xor_key][:self.samples]
+
+    def resolve(self, wx_dir) -> int:
+        """
+        @param wx_dir: 微信账号目录（包含 cache、temp、msg）
+        @return: 异或密钥，找不到时返回 -1
+        """
+        wx_dir = os.path.normcase(os.path.abspath(wx_dir))
+        if wx_dir in _xor_key_memo:
+            return _xor_key_memo[wx_dir]
+        xor_key = self._load_cached(wx_dir)
+        if xor_key == -1:
+            xor_key, sample_files = self._discover(wx_dir)
+            if xor_key != -1:
+                print(f'[*] 找到异或密钥: 0x{xor_key:x}')
+                self._save(wx_dir, xor_key, sample_files)
+        if xor_key != -1:
+            _xor_key_memo[wx_dir] = xor_key
+        return xor_key
+
+
 def get_decode_code_v4(wx_dir):
     """
     从微信文件夹里找到异或密钥，原理详见：https://blog.lc044.love/post/16
@@ -129,41 +287,8 @@ def get_decode_code_v4(wx_dir):
     cache_dir = os.path.join(wx_dir, 'cache')
     if not os.path.isdir(wx_dir) or not os.path.exists(cache_dir):
         raise ValueError(f'微信路径输入错误，请检查：{wx_dir}')
-
-    def find_xor_key(dir0):
-        ok_flag = False
-        for root, dirs, files in os.walk(dir0):
-            if ok_flag:
-                break
-            for file in files:
-                if file.endswith("_t.dat"):
-                    # 构造源文件和目标文件的完整路径
-                    src_file_path = os.path.join(root, file)
-                    with open(src_file_path, 'rb') as f:
-                        data = f.read()
-                        if not is_v4_image(data):
-                            continue
-                        file_tail = data[-2:]
-
-                        jpg_known_tail = b'\xff\xd9'
-                        # 推导出密钥
-                        xor_key = [c ^ p for c, p in zip(file_tail, jpg_known_tail)]
-                        if len(set(xor_key)) == 1:
-                            print(f'[*] 找到异或密钥: 0x{xor_key[0]:x}')
-                            return xor_key[0]
-        return -1
-
-    xor_key_ = find_xor_key(cache_dir)
-    if xor_key_ != -1:
-        return xor_key_
-    else:
-        dirs = ['temp', 'msg']
-        for dir_name in dirs:
-            cache_dir = os.path.join(wx_dir, dir_name)
-            xor_key_ = find_xor_key(cache_dir)
-            if xor_key_ != -1:
-                return xor_key_
-    return 0
+    xor_key = XorKeyResolver().resolve(wx_dir)
+    return xor_key if xor_key != -1 else 0
 
 
 def get_image_type(data: bytes) -> str:
@@ -22,6 +22,7 @@ from typing import Union, List
 from Crypto.Cipher import AES
 
 from wxManager.log import logger
+from wxManager.decrypt.snapshot import TornPagesError, has_wal, snapshot_db_file
 
 SQLITE_FILE_HEADER = "SQLite format 3\x00"  # SQLite文件头
 
@@ -87,7 +88,18 @@ def decrypt_db_file_v3(key: str, db_path, out_path):
 
 
 def decode_wrapper(tasks):
-    """用于包装解码函数的顶层定义"""
+    """用于包装解码函数的顶层定义，有 WAL 时连同已提交的帧一起解密"""
+    key, src_file_path, dest_file_path = tasks
+    if has_wal(src_file_path):
+        try:
+            snapshot_db_file(3, key, src_file_path, dest_file_path, incremental=False)
+            return True, [src_file_path, dest_file_path, key]
+        except TornPagesError as e:
+            # 不校验页的整库解密会把这些页解成乱码，这一次算失败
+            print(f"【!!!】{src_file_path} WAL 快照失败: {e}")
+            return False, f"[-] {src_file_path} 有页正在写入"
+        except ValueError as e:
+            print(f"【!!!】{src_file_path} WAL 快照失败: {e}")
     return decrypt_db_file_v3(*tasks)
 
 
@@ -7,6 +7,8 @@ from Crypto.Cipher import AES
 from Crypto.Protocol.KDF import PBKDF2
 from Crypto.Hash import SHA512
 
+from wxManager.decrypt.snapshot import TornPagesError, has_wal, snapshot_db_file
+
 # Constants
 IV_SIZE = 16
 HMAC_SHA256_SIZE = 64
@@ -104,7 +106,18 @@ def decrypt_db_file_v4(pkey, in_db_path, out_db_path):
 
 
 def decode_wrapper(tasks):
-    """用于包装解码函数的顶层定义"""
+    """用于包装解码函数的顶层定义，有 WAL 时连同已提交的帧一起解密"""
+    key, src_file_path, dest_file_path = tasks
+    if has_wal(src_file_path):
+        try:
+            snapshot_db_file(4, key, src_file_path, dest_file_path, incremental=False)
+            return True
+        except TornPagesError as e:
+            # 不校验页的整库解密会把这些页解成乱码，这一次算失败
+            print(f"【!!!】{src_file_path} WAL 快照失败: {e}")
+            return False
+        except ValueError as e:
+            print(f"【!!!】{src_file_path} WAL 快照失败: {e}")
     return decrypt_db_file_v4(*tasks)
 
 
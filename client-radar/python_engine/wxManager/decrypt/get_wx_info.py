@@ -1,7 +1,5 @@
 import os
 import sys
-import hmac
-import hashlib
 import ctypes
 import winreg
 import pymem
@@ -10,9 +8,10 @@ from win32com.client import Dispatch
 import psutil
 import pymem.process
 
-from wxManager.decrypt.wx_info_v4 import dump_wechat_info_v4
 from wxManager.decrypt import WeChatInfo
 from wxManager.decrypt.common import get_version
+from wxManager.decrypt.key_vault import KeyVault
+from wxManager.decrypt.key_verifier import PAGE_SIZE, check_key_v3, verify_keys
 
 ReadProcessMemory = ctypes.windll.kernel32.ReadProcessMemory
 void_p = ctypes.c_void_p
@@ -160,26 +159,14 @@ def get_key(db_path, addr_len):
         key_bytes = bytes(key)
         return key_bytes
 
-    def verify_key(key, wx_db_path):
-        if not wx_db_path or wx_db_path.lower() == "none":
-            return True
-        KEY_SIZE = 32
-        DEFAULT_PAGESIZE = 4096
-        DEFAULT_ITER = 64000
-        with open(wx_db_path, "rb") as file:
-            blist = file.read(5000)
-        salt = blist[:16]
-        byteKey = hashlib.pbkdf2_hmac("sha1", key, salt, DEFAULT_ITER, KEY_SIZE)
-        first = blist[16:DEFAULT_PAGESIZE]
-
-        mac_salt = bytes([(salt[i] ^ 58) for i in range(16)])
-        mac_key = hashlib.pbkdf2_hmac("sha1", byteKey, mac_salt, 2, KEY_SIZE)
-        hash_mac = hmac.new(mac_key, first[:-32], hashlib.sha1)
-        hash_mac.update(b'\x01\x00\x00\x00')
-
-        if hash_mac.digest() != first[-32:-12]:
-            return False
-        return True
+    def iter_candidates(h_process, type_addrs):
+        # 离设备类型字符串越近的指针越可能是 key，距离作为排序分数
+        for i in type_addrs[::-1]:
+            for j in range(i, i - 2000, -addr_len):
+                key_bytes = read_key_bytes(h_process, j, addr_len)
+                if key_bytes == "None":
+                    continue
+                yield key_bytes, i - j
 
     phone_type1 = "iphone\x00"
     phone_type2 = "android\x00"
@@ -189,6 +176,10 @@ def get_key(db_path, addr_len):
     module_name = "WeChatWin.dll"
 
     MicroMsg_path = os.path.join(db_path, "MSG", "MicroMsg.db")
+    if db_path == "None" or not os.path.exists(MicroMsg_path):
+        return "None"
+    with open(MicroMsg_path, "rb") as file:
+        buf = file.read(PAGE_SIZE)
 
     type1_addrs = pm.pattern_scan_module(phone_type1.encode(), module_name, return_multiple=True)
     type2_addrs = pm.pattern_scan_module(phone_type2.encode(), module_name, return_multiple=True)
@@ -198,14 +189,9 @@ def get_key(db_path, addr_len):
     # print(type_addrs)
     if type_addrs == "None":
         return "None"
-    for i in type_addrs[::-1]:
-        for j in range(i, i - 2000, -addr_len):
-            key_bytes = read_key_bytes(pm.process_handle, j, addr_len)
-            if key_bytes == "None":
-                continue
-            if db_path != "None" and verify_key(key_bytes, MicroMsg_path):
-                return key_bytes.hex()
-    return "None"
+    # v3 校验一次只有 64000 轮 SHA1，在当前进程中校验，不为此启动进程池（auto_bridge 等打包后的入口没有 freeze_support）
+    key = verify_keys(iter_candidates(pm.process_handle, type_addrs), buf, check_key_v3, processes=1)
+    return key if key else "None"
 
 
 # 读取微信信息(account,mobile,name,mail,wxid,key)
@@ -270,7 +256,16 @@ def read_info(version_list):
             tmp_rd['wxid'] = get_info_wxid(Handle)
             tmp_rd['wx_dir'] = get_wx_dir(tmp_rd['wxid']) if tmp_rd['wxid'] != "None" else "None"
             tmp_rd['key'] = "None"
-            tmp_rd['key'] = get_key(tmp_rd['wx_dir'], addrLen)
+            # 先用本地密钥库中保存的 key 校验一次，失败才扫描进程内存
+            micro_msg_path = os.path.join(tmp_rd['wx_dir'], "MSG", "MicroMsg.db")
+            vault = KeyVault()
+            key = vault.get(tmp_rd['wxid'], micro_msg_path, check_key_v3) if tmp_rd['wx_dir'] != "None" else None
+            if key:
+                tmp_rd['key'] = key
+            else:
+                tmp_rd['key'] = get_key(tmp_rd['wx_dir'], addrLen)
+                if tmp_rd['key'] != 'None':
+                    vault.put(tmp_rd['wxid'], micro_msg_path, tmp_rd['key'])
             if tmp_rd['key'] == 'None':
                 tmp_rd['errcode'] = 404
                 tmp_rd['errmsg'] = '请重启微信后重试。'
@@ -281,6 +276,8 @@ def read_info(version_list):
 
 
 def get_info_v4():
+    # v4 的 key 扫描依赖 yara，只在需要时导入，read_info 不受影响
+    from wxManager.decrypt.wx_info_v4 import dump_wechat_info_v4
     result_v4 = []
     for process in psutil.process_iter(['name', 'exe', 'pid']):
         if process.name() == 'Weixin.exe':
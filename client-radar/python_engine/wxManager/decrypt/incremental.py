@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/20 1:30
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-incremental.py
+@Description : 按页增量解密
+
+微信每次改写一页都会用新的随机 IV 重新加密，IV 保存在页尾的保留区中。
+解密时把每一页的 IV 记录在 <输出文件>.pages 中，下次只解密 IV 变化了的页并原地写回输出文件：
+    - 输出文件是源数据库逐页的明文镜像，不能被其他程序写入（建索引、合并等在镜像之外的工作库中进行）
+    - 每一页都校验 HMAC，校验失败的页（微信正在写入）保留旧内容，下次再解密
+    - salt 变化（数据库重建）或 .pages 不存在时整库解密
+"""
+import hashlib
+import hmac
+import os
+import struct
+from functools import lru_cache
+from typing import Set, Tuple
+
+from Crypto.Cipher import AES
+
+from wxManager.log import logger
+
+PAGE_SIZE = 4096
+SALT_SIZE = 16
+IV_SIZE = 16
+KEY_SIZE = 32
+SQLITE_HEADER = b'SQLite format 3\x00'
+PAGES_SUFFIX = '.pages'
+
+# 每次从源文件读取的页数
+READ_PAGES = 256
+
+# PageMirror.write_page 的结果
+PAGE_SAME = 0
+PAGE_CHANGED = 1
+PAGE_TORN = 2
+
+
+class PageCipher:
+    """
+    v3：PBKDF2-HMAC-SHA1 64000 轮，页尾 48 字节 = IV(16) + HMAC-SHA1(20) + 填充(12)
+    v4：PBKDF2-HMAC-SHA512 256000 轮，页尾 80 字节 = IV(16) + HMAC-SHA512(64)
+    """
+
+    def __init__(self, db_version, key: str, salt: bytes):
+        self.db_version = db_version
+        if db_version == 3:
+            self.hash_name, self.rounds, self.reserve, self.mac_size = 'sha1', 64000, 48, 20
+        else:
+            self.hash_name, self.rounds, self.reserve, self.mac_size = 'sha512', 256000, 80, 64
+        self.enc_key, self.mac_key = derive_keys(self.hash_name, self.rounds, bytes.fromhex(key), salt)
+
+    def iv(self, page: bytes) -> bytes:
+        return page[PAGE_SIZE - self.reserve: PAGE_SIZE - self.reserve + IV_SIZE]
+
+    def verify(self, page: bytes, pgno: int) -> bool:
+        """
+        @param page: 一整页密文
+        @param pgno: 页号，从 1 开始
+        """
+        offset = SALT_SIZE if pgno == 1 else 0
+        mac_start = PAGE_SIZE - self.reserve + IV_SIZE
+        mac = hmac.new(self.mac_key, page[offset:mac_start], self.hash_name)
+        mac.update(struct.pack('<I', pgno))
+        return hmac.compare_digest(mac.digest(), page[mac_start:mac_start + self.mac_size])
+
+    def decrypt(self, page: bytes, pgno: int) -> bytes:
+        """
+        @return: 一整页明文，保留区原样保留；第一页的 salt 换成 SQLite 文件头
+        """
+        offset = SALT_SIZE if pgno == 1 else 0
+        end = PAGE_SIZE - self.reserve
+        plain = AES.new(self.enc_key, AES.MODE_CBC, self.iv(page)).decrypt(page[offset:end])
+        if pgno == 1:
+            return SQLITE_HEADER + plain + page[end:]
+        return plain + page[end:]
+
+
+@lru_cache(maxsize=64)
+def derive_keys(hash_name, rounds, password: bytes, salt: bytes) -> Tuple[bytes, bytes]:
+    """同一个数据库的 salt 不变，派生的密钥缓存起来，增量解密时不必每次都跑几万轮 PBKDF2"""
+    enc_key = hashlib.pbkdf2_hmac(hash_name, password, salt, rounds, KEY_SIZE)
+    mac_salt = bytes(x ^ 0x3a for x in salt)
+    mac_key = hashlib.pbkdf2_hmac(hash_name, enc_key, mac_salt, 2, KEY_SIZE)
+    return enc_key, mac_key
+
+
+def _load_pages(path, salt) -> bytearray | None:
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if data[:SALT_SIZE] != salt:
+        return None
+    return bytearray(data[SALT_SIZE:])
+
+
+class PageMirror:
+    """
+    明文镜像文件和它的每页 IV 记录
+    使用示例：
+    with PageMirror(cipher, salt, dest_path) as mirror:
+        mirror.write_page(pgno, page)
+        mirror.truncate(page_count)
+    """
+
+    def __init__(self, cipher: PageCipher, salt: bytes, dest_path, incremental=True, file=None):
+        """
+        @param incremental: False 时忽略已有的镜像，整库解密，也不保存 .pages
+        @param file: 写入这个文件对象（如 io.BytesIO）而不是 dest_path，总是整库解密，close() 时不关闭它
+        """
+        self.cipher = cipher
+        self.salt = salt
+        self.dest_path = dest_path
+        self.incremental = incremental and file is None
+        self.pages_path = dest_path + PAGES_SUFFIX if self.incremental else None
+        ivs = _load_pages(self.pages_path, salt) if self.incremental and os.path.exists(dest_path) else None
+        self.full = ivs is None
+        self.ivs = ivs if ivs is not None else bytearray()
+        # 本次校验失败、还没有被更新版本覆盖的页
+        self.torn = set()
+        self.closed = False
+        self._own_file = file is None
+        if file is None:
+            os.makedirs(os.path.dirname(dest_path) or '.', exist_ok=True)
+            file = open(dest_path, 'wb' if self.full else 'r+b')
+        self.file = file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(save=exc_type is None)
+
+    def _set_iv(self, pgno, iv: bytes):
+        end = pgno * IV_SIZE
+        if len(self.ivs) < end:
+            self.ivs.extend(bytes(end - len(self.ivs)))
+        self.ivs[end - IV_SIZE:end] = iv
+
+    def iv_of(self, pgno) -> bytes:
+        return bytes(self.ivs[(pgno - 1) * IV_SIZE: pgno * IV_SIZE])
+
+    def write_page(self, pgno, page: bytes) -> int:
+        """
+        @param pgno: 页号，从 1 开始
+        @param page: 一整页密文
+        @return: PAGE_SAME、PAGE_CHANGED 或 PAGE_TORN
+        """
+        iv = self.cipher.iv(page)
+        if iv == self.iv_of(pgno):
+            return PAGE_SAME
+        self.file.seek((pgno - 1) * PAGE_SIZE)
+        if not any(page):
+            # 空页（预分配或被截断）原样写入
+            self.file.write(page)
+        elif self.cipher.verify(page, pgno):
+            self.file.write(self.cipher.decrypt(page, pgno))
+        else:
+            # 这一页正在被改写，保留旧内容，IV 记为全 0 下次一定重新解密
+            if self.full:
+                self.file.write(bytes(PAGE_SIZE))
+            self._set_iv(pgno, bytes(IV_SIZE))
+            self.torn.add(pgno)
+            return PAGE_TORN
+        self._set_iv(pgno, iv)
+        self.torn.discard(pgno)
+        return PAGE_CHANGED
+
+    def truncate(self, page_count):
+        self.file.truncate(page_count * PAGE_SIZE)
+        del self.ivs[page_count * IV_SIZE:]
+        self.torn = {pgno for pgno in self.torn if pgno <= page_count}
+
+    def close(self, save=True):
+        if self.closed:
+            return
+        self.closed = True
+        if self._own_file:
+            self.file.close()
+        if not self.incremental:
+            return
+        if save:
+            tmp_path = self.pages_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(self.salt)
+                f.write(self.ivs)
+            os.replace(tmp_path, self.pages_path)
+        elif os.path.exists(self.pages_path):
+            # 镜像可能已经部分写入，记录作废，下次整库解密
+            os.remove(self.pages_path)
+
+
+def open_encrypted(db_version, key, f_in) -> Tuple[PageCipher, bytes]:
+    """
+    读取并校验第一页
+    @return: (cipher, 第一页密文)，第一页校验失败（key 错误或正在写入）时抛出 ValueError
+    """
+    first = f_in.read(PAGE_SIZE)
+    if len(first) < PAGE_SIZE:
+        raise ValueError(f'{f_in.name} 不是完整的数据库文件')
+    cipher = PageCipher(db_version, key, first[:SALT_SIZE])
+    if not cipher.verify(first, 1):
+        raise ValueError(f'{f_in.name} 第一页校验失败，key 错误或文件正在写入')
+    return cipher, first
+
+
+def sync_pages(mirror: PageMirror, f_in, first: bytes, skip_pages: Set[int] = frozenset()) -> dict:
+    """
+    逐页比较 IV，把源数据库中变化了的页写入镜像
+    @param mirror:
+    @param f_in: 源数据库，已经读过第一页
+    @param first: 第一页密文
+    @param skip_pages: 不从源数据库读取的页（WAL 中有更新的版本）
+    @return: {'pages': 总页数, 'changed': 解密的页数, 'torn': HMAC 校验失败而跳过的页数, 'full': 是否整库解密}
+    """
+    counts = [0, 0, 0]
+    pgno = 1
+    buf = first + f_in.read(PAGE_SIZE * (READ_PAGES - 1))
+    while buf:
+        for start in range(0, len(buf) - PAGE_SIZE + 1, PAGE_SIZE):
+            if pgno not in skip_pages:
+                counts[mirror.write_page(pgno, buf[start:start + PAGE_SIZE])] += 1
+            pgno += 1
+        buf = f_in.read(PAGE_SIZE * READ_PAGES)
+    return {'pages': pgno - 1, 'changed': counts[PAGE_CHANGED], 'torn': counts[PAGE_TORN], 'full': mirror.full}
+
+
+def decrypt_db_file_incremental(db_version, key: str, src_path, dest_path) -> dict:
+    """
+    增量解密一个数据库文件到明文镜像，只读取主数据库文件，WAL 见 snapshot.snapshot_db_file
+    @param db_version: 3 或 4
+    @param key: 十六进制的 key
+    @param src_path: 加密的源数据库
+    @param dest_path: 明文镜像
+    @return: 见 sync_pages；第一页校验失败时抛出 ValueError
+    """
+    with open(src_path, 'rb') as f_in:
+        cipher, first = open_encrypted(db_version, key, f_in)
+        with PageMirror(cipher, first[:SALT_SIZE], dest_path) as mirror:
+            result = sync_pages(mirror, f_in, first)
+            mirror.truncate(result['pages'])
+    if result['torn']:
+        logger.info(f'{src_path} 有 {result["torn"]} 页正在写入，下次同步时重新解密')
+    return result
+
+
+if __name__ == '__main__':
+    pass
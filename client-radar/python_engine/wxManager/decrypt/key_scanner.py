@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 15:10
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-key_scanner.py
+@Description : 与数据来源无关的 v4 密钥候选扫描器
+
+数据来源（MemorySource）只需提供两个能力：列出内存区域、按地址读取字节
+    ProcessMemorySource  正在运行的微信进程（仅 Windows）
+    DumpFileSource       minidump 或裸内存 dump 文件，通过 mmap 读取，可在 Linux 上离线分析
+扫描按固定大小的窗口进行，相邻窗口重叠一个特征长度，峰值内存只与窗口大小有关；
+候选 key 以生成器的形式产出，找到一个就可以马上送去校验（见 key_verifier）
+"""
+import argparse
+import bisect
+import ctypes
+import mmap
+import multiprocessing
+import struct
+from typing import Iterator, List, Tuple
+
+from wxManager.decrypt.key_verifier import KEY_SIZE, PAGE_SIZE, check_key_v4, verify_keys
+
+# 每个窗口的大小
+WINDOW_SIZE = 4 * 1024 * 1024
+
+# 特征：/.{6}\x00{2}\x00{8}\x20\x00{7}\x2f\x00{7}/，前 8 字节是指向 key 的指针
+# 先查找不常见的后 16 字节，再检查前面的 10 个 0
+PATTERN_SIZE = 32
+_ANCHOR = b'\x20' + b'\x00' * 7 + b'\x2f' + b'\x00' * 7
+_ANCHOR_OFFSET = 16
+_ZEROS = b'\x00' * 10
+
+MEM_COMMIT = 0x1000
+MEM_PRIVATE = 0x20000
+
+# minidump 中用到的流类型
+MINIDUMP_SIGNATURE = b'MDMP'
+MEMORY_LIST_STREAM = 5
+MEMORY64_LIST_STREAM = 9
+MEMORY_INFO_LIST_STREAM = 16
+
+
+class MemoryRegion:
+    def __init__(self, base_address: int, size: int):
+        self.base_address = base_address
+        self.size = size
+
+    def __repr__(self):
+        return f'MemoryRegion(0x{self.base_address:x}, 0x{self.size:x})'
+
+
+class MemorySource:
+    """
+    内存数据来源的基类
+    """
+
+    def regions(self) -> List[MemoryRegion]:
+        raise NotImplementedError
+
+    def read(self, address: int, size: int) -> bytes | None:
+        """
+        @return: 读取失败或地址不在来源范围内时返回 None
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _MEMORY_BASIC_INFORMATION(ctypes.Structure):
+    _fields_ = [
+        ("BaseAddress", ctypes.c_void_p),
+        ("AllocationBase", ctypes.c_void_p),
+        ("AllocationProtect", ctypes.c_ulong),
+        ("RegionSize", ctypes.c_size_t),
+        ("State", ctypes.c_ulong),
+        ("Protect", ctypes.c_ulong),
+        ("Type", ctypes.c_ulong),
+    ]
+
+
+class ProcessMemorySource(MemorySource):
+    """
+    正在运行的进程，只扫描已提交的私有内存（堆）
+    """
+    PROCESS_VM_READ = 0x0010
+    PROCESS_QUERY_INFORMATION = 0x0400
+
+    def __init__(self, pid: int):
+        from ctypes import wintypes
+        self.pid = pid
+        # 单独的 WinDLL 实例，避免修改 ctypes.windll.kernel32 上的 argtypes
+        self.kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self.kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+        self.kernel32.OpenProcess.restype = wintypes.HANDLE
+        self.kernel32.ReadProcessMemory.argtypes = [wintypes.HANDLE, wintypes.LPCVOID, wintypes.LPVOID,
+                                                    ctypes.c_size_t, ctypes.POINTER(ctypes.c_size_t)]
+        self.kernel32.ReadProcessMemory.restype = wintypes.BOOL
+        self.kernel32.VirtualQueryEx.argtypes = [wintypes.HANDLE, wintypes.LPCVOID, ctypes.c_void_p, ctypes.c_size_t]
+        self.kernel32.VirtualQueryEx.restype = ctypes.c_size_t
+        self.kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        self.kernel32.CloseHandle.restype = wintypes.BOOL
+        self.handle = self.kernel32.OpenProcess(self.PROCESS_VM_READ | self.PROCESS_QUERY_INFORMATION, False, pid)
+        if not self.handle:
+            raise OSError(f'无法打开进程 {pid}')
+        # 复用同一块缓冲区，不为每次读取分配内存
+        self._buffer = ctypes.create_string_buffer(WINDOW_SIZE + PATTERN_SIZE)
+
+    def regions(self) -> List[MemoryRegion]:
+        regions = []
+        mbi = _MEMORY_BASIC_INFORMATION()
+        address = 0
+        while self.kernel32.VirtualQueryEx(self.handle, address, ctypes.byref(mbi), ctypes.sizeof(mbi)):
+            if mbi.State == MEM_COMMIT and mbi.Type == MEM_PRIVATE:
+                regions.append(MemoryRegion(mbi.BaseAddress, mbi.RegionSize))
+            address = (mbi.BaseAddress or 0) + mbi.RegionSize
+        return regions
+
+    def read(self, address: int, size: int) -> bytes | None:
+        buffer = self._buffer if size <= len(self._buffer) else ctypes.create_string_buffer(size)
+        bytes_read = ctypes.c_size_t(0)
+        if not self.kernel32.ReadProcessMemory(self.handle, address, buffer, size, ctypes.byref(bytes_read)):
+            return None
+        # buffer.raw 会先复制整块缓冲区（4 MiB），只复制实际读到的部分
+        return ctypes.string_at(buffer, bytes_read.value)
+
+    def close(self):
+        if self.handle:
+            self.kernel32.CloseHandle(self.handle)
+            self.handle = None
+
+
+class DumpFileSource(MemorySource):
+    """
+    内存 dump 文件
+    minidump（procdump -ma、任务管理器“创建转储文件”）按其中记录的地址映射；
+    其他文件视为从 base_address 开始的一整段裸内存
+    """
+
+    def __init__(self, path, base_address=0, private_only=True):
+        """
+        @param path: dump 文件路径
+        @param base_address: 裸 dump 对应的起始地址
+        @param private_only: minidump 中带有内存属性信息时，只扫描已提交的私有内存
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        # [(起始地址, 大小, 文件偏移)]，按起始地址排序
+        self._ranges: List[Tuple[int, int, int]] = []
+        self._scan_ranges: List[Tuple[int, int, int]] = []
+        if self._mmap[:4] == MINIDUMP_SIGNATURE:
+            self._parse_minidump(private_only)
+        else:
+            self._ranges = [(base_address, len(self._mmap), 0)]
+            self._scan_ranges = self._ranges
+        self._starts = [start for start, _, _ in self._ranges]
+
+    def _parse_minidump(self, private_only):
+        data = self._mmap
+        _, _, stream_num, directory_rva = struct.unpack_from('<4sIII', data, 0)
+        streams = {}
+        for i in range(stream_num):
+            stream_type, size, rva = struct.unpack_from('<III', data, directory_rva + i * 12)
+            streams[stream_type] = (size, rva)
+        ranges = []
+        if MEMORY64_LIST_STREAM in streams:
+            _, rva = streams[MEMORY64_LIST_STREAM]
+            range_num, offset = struct.unpack_from('<QQ', data, rva)
+            for i in range(range_num):
+                start, size = struct.unpack_from('<QQ', data, rva + 16 + i * 16)
+                ranges.append((start, size, offset))
+                offset += size
+        elif MEMORY_LIST_STREAM in streams:
+            _, rva = streams[MEMORY_LIST_STREAM]
+            range_num = struct.unpack_from('<I', data, rva)[0]
+            for i in range(range_num):
+                start, size, offset = struct.unpack_from('<QII', data, rva + 4 + i * 16)
+                ranges.append((start, size, offset))
+        ranges.sort()
+        self._ranges = ranges
+        self._scan_ranges = ranges
+        if private_only and MEMORY_INFO_LIST_STREAM in streams:
+            private = self._private_regions(*streams[MEMORY_INFO_LIST_STREAM])
+            self._scan_ranges = [r for r in ranges if self._in_regions(r[0], private)]
+
+    def _private_regions(self, size, rva) -> List[Tuple[int, int]]:
+        header_size, entry_size, entry_num = struct.unpack_from('<IIQ', self._mmap, rva)
+        regions = []
+        for i in range(entry_num):
+            offset = rva + header_size + i * entry_size
+            base_address, _, _, _, region_size, state, _, type_ = struct.unpack_from('<QQIIQIII', self._mmap, offset)
+            if state == MEM_COMMIT and type_ == MEM_PRIVATE:
+                regions.append((base_address, region_size))
+        regions.sort()
+        return regions
+
+    @staticmethod
+    def _in_regions(address, regions) -> bool:
+        i = bisect.bisect_right(regions, (address, float('inf'))) - 1
+        return i >= 0 and regions[i][0] <= address < regions[i][0] + regions[i][1]
+
+    def regions(self) -> List[MemoryRegion]:
+        return [MemoryRegion(start, size) for start, size, _ in self._scan_ranges]
+
+    def read(self, address: int, size: int) -> bytes | None:
+        i = bisect.bisect_right(self._starts, address) - 1
+        if i < 0:
+            return None
+        start, range_size, offset = self._ranges[i]
+        if address + size > start + range_size:
+            return None
+        offset += address - start
+        return self._mmap[offset:offset + size]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+
+
+def iter_windows(source: MemorySource, window_size=WINDOW_SIZE, overlap=PATTERN_SIZE - 1) \
+        -> Iterator[Tuple[int, bytes, int]]:
+    """
+    把每个内存区域切成固定大小、相邻之间重叠 overlap 字节的窗口
+    @return: (窗口起始地址, 窗口数据, 窗口本身的长度)，数据长度最多为 窗口长度+overlap，
+             只需报告起点落在窗口本身长度内的匹配，重叠部分留给下一个窗口，避免重复
+    """
+    for region in source.regions():
+        end = region.base_address + region.size
+        address = region.base_address
+        while address < end:
+            length = min(window_size, end - address)
+            data = source.read(address, min(length + overlap, end - address))
+            if data:
+                yield address, data, length
+            address += length
+
+
+def iter_key_pointers(source: MemorySource, window_size=WINDOW_SIZE) -> Iterator[Tuple[int, int]]:
+    """
+    产出特征处记录的 key 指针，已去重
+    @return: (特征所在地址, key 指针)
+    """
+    seen = set()
+    for address, data, length in iter_windows(source, window_size):
+        pos = data.find(_ANCHOR, _ANCHOR_OFFSET)
+        while pos != -1:
+            start = pos - _ANCHOR_OFFSET
+            if start >= length:
+                break
+            # 与 yara 规则一致：前 6 个任意字节不包含换行符，其后是 10 个 0
+            if data[start + 6:pos] == _ZEROS and b'\n' not in data[start:start + 6]:
+                pointer = struct.unpack_from('<Q', data, start)[0]
+                if pointer and pointer not in seen:
+                    seen.add(pointer)
+                    yield address + start, pointer
+            pos = data.find(_ANCHOR, pos + 1)
+
+
+def locality_score(ref_address: int, pointer: int) -> int:
+    """
+    key 通常和引用它的结构体在同一块堆上分配，并且按 16 字节对齐
+    距离越近、对齐越好，分数越小，越先校验
+    """
+    score = abs(pointer - ref_address)
+    if pointer % 16:
+        score += 1 << 40
+    return score
+
+
+def iter_key_candidates(source: MemorySource, window_size=WINDOW_SIZE) -> Iterator[Tuple[bytes, int]]:
+    """
+    产出候选 key（32 字节），已去重
+    @return: (key, locality_score)
+    """
+    seen = set()
+    for ref_address, pointer in iter_key_pointers(source, window_size):
+        key = source.read(pointer, KEY_SIZE)
+        if not key or len(key) != KEY_SIZE or key in seen:
+            continue
+        seen.add(key)
+        yield key, locality_score(ref_address, pointer)
+
+
+def find_key(source: MemorySource, buf: bytes, processes=None) -> str | None:
+    """
+    扫描并校验 key：候选 key 一边扫描一边交给 KeyVerifier 校验，找到后立即停止
+    @param source: 内存数据来源
+    @param buf: 数据库文件的第一页
+    @param processes: 校验用的进程数，默认为 cpu 核数的一半
+    @return: 十六进制的 key，找不到时返回 None
+    """
+    return verify_keys(iter_key_candidates(source), buf, check_key_v4, processes)
+
+
+def find_key_in_dump(dump_path, db_path, base_address=0, processes=None) -> str | None:
+    """
+    离线从内存 dump 文件中找 key
+    @param dump_path: minidump 或裸内存 dump
+    @param db_path: 同一账号下任意一个加密数据库，如 head_image.db
+    @param base_address: 裸 dump 对应的起始地址
+    @param processes:
+    @return:
+    """
+    with open(db_path, 'rb') as f:
+        buf = f.read(PAGE_SIZE)
+    with DumpFileSource(dump_path, base_address=base_address) as source:
+        return find_key(source, buf, processes)
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description='从微信进程的内存 dump 中查找 v4 数据库密钥')
+    parser.add_argument('dump', help='minidump 或裸内存 dump 文件')
+    parser.add_argument('db', help='同一账号下的加密数据库，如 head_image.db')
+    parser.add_argument('--base', type=lambda x: int(x, 0), default=0, help='裸 dump 的起始地址')
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    args = parser.parse_args()
+    print(find_key_in_dump(args.dump, args.db, args.base, args.processes))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 17:05
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-key_vault.py
+@Description : 本地密钥库，按 wxid 和数据库第一页的 salt 保存已校验过的 key
+
+启动时先用保存的 key 对当前数据库做一次 HMAC 校验，通过就直接使用，不必再扫描微信进程内存；
+salt 变化（重新登录、换号、数据库重建）或校验失败时返回 None，由调用方回退到完整扫描
+"""
+import json
+import os
+import threading
+import time
+from typing import Callable
+
+from wxManager.decrypt.key_verifier import PAGE_SIZE, SALT_SIZE
+
+DEFAULT_VAULT_PATH = os.path.join(os.path.expanduser('~'), '.client-radar', 'key_vault.json')
+
+_lock = threading.Lock()
+
+
+def _read_first_page(db_path) -> bytes:
+    try:
+        with open(db_path, 'rb') as f:
+            return f.read(PAGE_SIZE)
+    except OSError:
+        return b''
+
+
+class KeyVault:
+    """
+    使用示例：
+    vault = KeyVault()
+    key = vault.get(wxid, micro_msg_path, check_key_v3)
+    if not key:
+        key = get_key(...)
+        vault.put(wxid, micro_msg_path, key)
+    """
+
+    def __init__(self, path=DEFAULT_VAULT_PATH):
+        self.path = path
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, data: dict):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        # 只有当前用户可读写；Windows 上 chmod 只影响只读属性，文件放在用户目录下由系统 ACL 保护
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+
+    def get(self, wxid, db_path, check: Callable[[bytes, bytes], bool]) -> str | None:
+        """
+        取出保存的 key 并用当前数据库校验
+        @param wxid:
+        @param db_path: MicroMsg.db(v3) 或 message_0.db(v4)
+        @param check: key_verifier.check_key_v3 或 check_key_v4
+        @return: 十六进制的 key，不存在或校验失败时返回 None
+        """
+        if not wxid:
+            return None
+        with _lock:
+            entry = self._load().get(wxid)
+        if not entry:
+            return None
+        buf = _read_first_page(db_path)
+        if len(buf) < PAGE_SIZE or buf[:SALT_SIZE].hex() != entry.get('salt'):
+            return None
+        try:
+            key = bytes.fromhex(entry.get('key', ''))
+        except ValueError:
+            return None
+        if not check(key, buf):
+            return None
+        return key.hex()
+
+    def put(self, wxid, db_path, key: str):
+        """
+        保存校验通过的 key
+        @param wxid:
+        @param db_path: 与 get 时相同的数据库
+        @param key: 十六进制的 key
+        """
+        if not wxid or not key or key == 'None':
+            return
+        buf = _read_first_page(db_path)
+        if len(buf) < SALT_SIZE:
+            return
+        with _lock:
+            data = self._load()
+            data[wxid] = {
+                'key': key,
+                'salt': buf[:SALT_SIZE].hex(),
+                'db': os.path.basename(db_path),
+                'updated': int(time.time())
+            }
+            self._save(data)
+
+    def remove(self, wxid):
+        with _lock:
+            data = self._load()
+            if data.pop(wxid, None) is not None:
+                self._save(data)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 16:20
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-key_verifier.py
+@Description : 候选密钥校验调度，先做廉价的过滤再做昂贵的 PBKDF2
+
+校验顺序：
+    1. 同一个 salt 已经校验通过的 key 直接返回
+    2. 去重、熵过滤，排除明显不是随机密钥的候选
+    3. 按指针距离等启发式信息排序，最可能的先校验（排序窗口满、扫描暂停或结束时取出）
+    4. 多进程校验，任意一个通过后通过共享 Event 通知其他进程放弃剩余任务；
+       候选在单独的线程中产生，找到后不等扫描产生下一个候选就返回
+"""
+import hashlib
+import heapq
+import hmac
+import multiprocessing
+import queue
+import struct
+import threading
+from itertools import count
+from typing import Callable, Dict, Iterable, Tuple
+
+from Crypto.Hash import SHA512
+from Crypto.Protocol.KDF import PBKDF2
+
+KEY_SIZE = 32
+SALT_SIZE = 16
+PAGE_SIZE = 4096
+IV_SIZE = 16
+AES_BLOCK_SIZE = 16
+
+# v3: PBKDF2-HMAC-SHA1 64000 轮；v4: PBKDF2-HMAC-SHA512 256000 轮
+ROUND_COUNT_V3 = 64000
+ROUND_COUNT_V4 = 256000
+HMAC_SHA512_SIZE = 64
+
+# 随机的 32 字节里平均有约 30 个不同的值，少于这个数基本不可能是密钥
+MIN_DISTINCT_BYTES = 16
+# 连续相同字节的最大长度，随机数据出现 4 个相同字节的概率约为 1e-7
+MAX_REPEAT_RUN = 4
+
+# 校验结果缓存，键为 (校验函数名, salt)
+_verified: Dict[Tuple[str, bytes], bytes] = {}
+_rejected: Dict[Tuple[str, bytes], set] = {}
+_cache_lock = threading.Lock()
+
+# 工作进程中的取消标记，由进程池的 initializer 设置
+_cancel_event = None
+
+# 超过这么久（秒）没有新的候选时认为扫描暂停，排序窗口中已有的候选先去校验
+SCAN_PAUSE = 0.05
+_SCAN_DONE = object()
+
+
+def check_key_v3(key: bytes, buf: bytes) -> bool:
+    """
+    用数据库第一页的 HMAC 校验 v3 的 key
+    @param key: 候选 key
+    @param buf: 数据库文件开头至少一页的数据
+    @return:
+    """
+    salt = buf[:SALT_SIZE]
+    byte_key = hashlib.pbkdf2_hmac("sha1", key, salt, ROUND_COUNT_V3, KEY_SIZE)
+    first = buf[SALT_SIZE:PAGE_SIZE]
+    mac_salt = bytes(x ^ 0x3a for x in salt)
+    mac_key = hashlib.pbkdf2_hmac("sha1", byte_key, mac_salt, 2, KEY_SIZE)
+    hash_mac = hmac.new(mac_key, first[:-32], hashlib.sha1)
+    hash_mac.update(b'\x01\x00\x00\x00')
+    return hash_mac.digest() == first[-32:-12]
+
+
+def check_key_v4(key: bytes, buf: bytes) -> bool:
+    """
+    用数据库第一页的 HMAC 校验 v4 的 key
+    @param key: 候选 key
+    @param buf: 数据库文件开头至少一页的数据
+    @return:
+    """
+    # 获取文件开头的 salt
+    salt = buf[:SALT_SIZE]
+    # salt 异或 0x3a 得到 mac_salt，用于计算 HMAC
+    mac_salt = bytes(x ^ 0x3a for x in salt)
+    new_key = PBKDF2(key, salt, dkLen=KEY_SIZE, count=ROUND_COUNT_V4, hmac_hash_module=SHA512)
+    mac_key = PBKDF2(new_key, mac_salt, dkLen=KEY_SIZE, count=2, hmac_hash_module=SHA512)
+    # 计算 hash 校验码的保留空间
+    reserve = IV_SIZE + HMAC_SHA512_SIZE
+    reserve = ((reserve + AES_BLOCK_SIZE - 1) // AES_BLOCK_SIZE) * AES_BLOCK_SIZE
+    mac = hmac.new(mac_key, buf[SALT_SIZE:PAGE_SIZE - reserve + IV_SIZE], SHA512)
+    mac.update(struct.pack('<I', 1))  # page number as 1
+    hash_mac = mac.digest()
+    hash_mac_start_offset = PAGE_SIZE - reserve + IV_SIZE
+    return hash_mac == buf[hash_mac_start_offset:hash_mac_start_offset + len(hash_mac)]
+
+
+def looks_random(key: bytes) -> bool:
+    """
+    廉价的熵过滤：排除长度不对、不同字节值过少或有长串重复字节的候选
+    """
+    if len(key) != KEY_SIZE:
+        return False
+    if len(set(key)) < MIN_DISTINCT_BYTES:
+        return False
+    run = 1
+    for i in range(1, KEY_SIZE):
+        run = run + 1 if key[i] == key[i - 1] else 1
+        if run >= MAX_REPEAT_RUN:
+            return False
+    return True
+
+
+def _init_worker(event):
+    global _cancel_event
+    _cancel_event = event
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """放入有界队列，stop 被设置时放弃"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=SCAN_PAUSE)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _verify_task(args):
+    check, key, buf = args
+    if _cancel_event is not None and _cancel_event.is_set():
+        # 其他进程已经找到了，不再做 PBKDF2
+        return key, None
+    ok = check(key, buf)
+    if ok and _cancel_event is not None:
+        _cancel_event.set()
+    return key, ok
+
+
+class KeyVerifier:
+    """
+    候选密钥校验调度器
+
+    使用示例：
+    verifier = KeyVerifier(check_key_v4)
+    key = verifier.verify(candidates, first_page)
+    candidates 中的元素可以是 key，也可以是 (key, score)，score 越小越先校验
+    """
+
+    def __init__(self, check: Callable[[bytes, bytes], bool], processes=None, reorder_window=64):
+        """
+        @param check: 校验函数，必须是模块级函数以便传给子进程
+        @param processes: 校验进程数，默认为 cpu 核数的一半，为 1 时在当前进程中校验
+        @param reorder_window: 排序窗口，最多缓存这么多候选后按 score 取出最小的，兼顾流式和排序；
+                               扫描暂停超过 SCAN_PAUSE 秒时不等窗口满
+        """
+        self.check = check
+        self.processes = processes or max(multiprocessing.cpu_count() // 2, 1)
+        self.reorder_window = reorder_window
+        self.checked = 0
+        self.filtered = 0
+
+    def _cache_key(self, buf) -> Tuple[str, bytes]:
+        return self.check.__name__, bytes(buf[:SALT_SIZE])
+
+    def _prefilter(self, candidates, rejected) -> Iterable[Tuple[float, bytes]]:
+        seen = set()
+        for candidate in candidates:
+            key, score = candidate if isinstance(candidate, tuple) else (candidate, 0)
+            key = bytes(key)
+            if key in seen or key in rejected or not looks_random(key):
+                self.filtered += 1
+                continue
+            seen.add(key)
+            yield score, key
+
+    def _produce(self, scored, candidates: queue.Queue, stop: threading.Event):
+        """扫描线程：候选放入有界队列，找到 key 后在下一个候选产生时停止"""
+        try:
+            for item in scored:
+                if not _put(candidates, item, stop):
+                    return
+        except Exception as e:
+            item = e
+        else:
+            item = _SCAN_DONE
+        _put(candidates, item, stop)
+
+    def _take(self, result, failed) -> bytes | None:
+        if isinstance(result, BaseException):
+            raise result
+        key, ok = result
+        if ok is not None:
+            self.checked += 1
+        if ok is False:
+            failed.add(key)
+        return key if ok else None
+
+    def verify(self, candidates: Iterable, buf: bytes) -> bytes | None:
+        """
+        @param candidates: 候选 key 的可迭代对象，可以是生成器，边产生边校验
+        @param buf: 数据库第一页
+        @return: 校验通过的 key，找不到时返回 None
+        """
+        buf = bytes(buf[:PAGE_SIZE])
+        cache_key = self._cache_key(buf)
+        with _cache_lock:
+            if cache_key in _verified:
+                return _verified[cache_key]
+            rejected = set(_rejected.get(cache_key, ()))
+        # 候选在单独的线程中产生，扫描卡在下一个候选上时也能在找到 key 后立即返回
+        stop = threading.Event()
+        candidates_queue = queue.Queue(maxsize=max(self.reorder_window, 1) * 4)
+        threading.Thread(target=self._produce, args=(self._prefilter(candidates, rejected), candidates_queue, stop),
+                         daemon=True).start()
+        results = queue.Queue()
+        pool = None
+        if self.processes == 1:
+            def submit(key):
+                results.put(_verify_task((self.check, key, buf)))
+        else:
+            event = multiprocessing.Event()
+            pool = multiprocessing.Pool(processes=self.processes, initializer=_init_worker, initargs=(event,))
+
+            def submit(key):
+                pool.apply_async(_verify_task, ((self.check, key, buf),), callback=results.put,
+                                 error_callback=results.put)
+        # 每个进程最多排队两个任务，其余的候选留在排序窗口中
+        max_inflight = self.processes * 2 if pool else 1
+        # 排序窗口：同分时保持原有顺序；窗口满、扫描暂停或扫描结束时取出 score 最小的
+        heap, order = [], count()
+        exhausted = paused = False
+        inflight = 0
+        found = None
+        failed = set()
+        try:
+            while True:
+                while inflight and found is None:
+                    try:
+                        result = results.get_nowait()
+                    except queue.Empty:
+                        break
+                    inflight -= 1
+                    found = self._take(result, failed)
+                if found is not None or (exhausted and not heap and not inflight):
+                    break
+                if heap and inflight < max_inflight and (exhausted or paused or len(heap) >= self.reorder_window):
+                    submit(heapq.heappop(heap)[2])
+                    inflight += 1
+                    continue
+                if not exhausted and len(heap) < self.reorder_window:
+                    try:
+                        item = candidates_queue.get(timeout=SCAN_PAUSE if heap or inflight else None)
+                    except queue.Empty:
+                        paused = True
+                        continue
+                    if item is _SCAN_DONE:
+                        exhausted = True
+                    elif isinstance(item, BaseException):
+                        raise item
+                    else:
+                        paused = False
+                        score, key = item
+                        heapq.heappush(heap, (score, next(order), key))
+                    continue
+                # 窗口已满或扫描结束，只能等校验结果
+                result = results.get()
+                inflight -= 1
+                found = self._take(result, failed)
+        finally:
+            stop.set()
+            if pool is not None:
+                # 队列里剩余的任务和正在进行的 PBKDF2 都直接放弃
+                event.set()
+                pool.terminate()
+                pool.join()
+        with _cache_lock:
+            if found:
+                _verified[cache_key] = found
+            _rejected.setdefault(cache_key, set()).update(failed)
+        return found
+
+
+def verify_keys(candidates: Iterable, buf: bytes, check=check_key_v4, processes=None) -> str | None:
+    """
+    @return: 十六进制的 key，找不到时返回 None
+    """
+    key = KeyVerifier(check, processes).verify(candidates, buf)
+    return bytes.hex(key) if key else None
+
+
+def clear_cache():
+    with _cache_lock:
+        _verified.clear()
+        _rejected.clear()
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/20 3:40
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-memory.py
+@Description : 把数据库直接解密到内存，不在磁盘上留下明文
+
+联系人、会话、朋友圈这类中小数据库每次同步都要整库解密，先写明文文件再由 init_database 重新打开没有必要：
+    - 不超过 memory_limit 的数据库解密到内存（包括 WAL 中已提交的页），用 sqlite3 deserialize 打开
+    - 超过的解密到临时文件，连接用 mmap 读取，释放时删除
+解密结果用 register_memory_database 挂到 <db_dir> 下原来的路径上，DataBaseV3/V4().init_database(db_dir) 不用修改。
+SyncScheduler、SyncDaemon 以 in_memory=True 创建时（sync_accounts.py / watch_sync.py --in-memory）对 MEMORY_DATABASES 使用这种方式。
+使用示例：
+    load_databases_in_memory(4, key, wx_dir, db_dir)
+    database = DataBaseV4()
+    database.init_database(db_dir)
+"""
+import os
+import tempfile
+from typing import Dict, Iterable
+
+from wxManager.decrypt.snapshot import WAL_SUFFIX, snapshot_db_file, snapshot_to_buffer
+from wxManager.log import logger
+from wxManager.model.db_model import MemoryDatabase, register_memory_database, unregister_memory_database
+
+# 超过这个大小的数据库解密到临时文件
+MEMORY_LIMIT = 128 * 1024 * 1024
+
+# 默认放在内存中的数据库，相对于源目录和输出目录的路径
+MEMORY_DATABASES = {
+    3: ['MicroMsg.db', 'Sns.db'],
+    4: [os.path.join('contact', 'contact.db'), os.path.join('session', 'session.db')],
+}
+
+# SQLite 文件头中的读写版本号，2 表示 WAL，内存数据库不支持 WAL
+_VERSION_OFFSET = 18
+_LEGACY_VERSION = b'\x01\x01'
+
+
+def decrypt_to_memory(db_version, key: str, src_path, memory_limit=MEMORY_LIMIT, temp_dir=None) -> MemoryDatabase:
+    """
+    解密一个数据库到内存
+    @param db_version: 3 或 4
+    @param key: 十六进制的 key
+    @param src_path: 加密的源数据库
+    @param memory_limit: 源数据库（含 WAL）超过这个字节数时解密到临时文件
+    @param temp_dir: 临时文件目录，默认为系统临时目录
+    @return: 第一页校验失败、有页正在写入时抛出 ValueError
+    """
+    wal_path = src_path + WAL_SUFFIX
+    size = os.path.getsize(src_path) + (os.path.getsize(wal_path) if os.path.exists(wal_path) else 0)
+    if size <= memory_limit:
+        data = bytearray(snapshot_to_buffer(db_version, key, src_path))
+        data[_VERSION_OFFSET:_VERSION_OFFSET + 2] = _LEGACY_VERSION
+        return MemoryDatabase(data=bytes(data))
+    fd, temp_path = tempfile.mkstemp(suffix='.db', dir=temp_dir)
+    os.close(fd)
+    try:
+        snapshot_db_file(db_version, key, src_path, temp_path, incremental=False)
+        with open(temp_path, 'r+b') as f:
+            f.seek(_VERSION_OFFSET)
+            f.write(_LEGACY_VERSION)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return MemoryDatabase(temp_path=temp_path)
+
+
+def load_databases_in_memory(db_version, key: str, src_dir, db_dir, names: Iterable[str] = None,
+                             memory_limit=MEMORY_LIMIT) -> Dict[str, MemoryDatabase]:
+    """
+    解密 names 中的数据库到内存，并注册到 <db_dir> 下对应的路径，已经注册过的替换为新的
+    @param db_version: 3 或 4
+    @param key: 十六进制的 key
+    @param src_dir: 源目录，v3 为 <wx_dir>/Msg，v4 为 db_storage
+    @param db_dir: 之后传给 init_database 的目录
+    @param names: 相对路径，默认为 MEMORY_DATABASES[db_version]
+    @param memory_limit:
+    @return: {注册的路径: MemoryDatabase}，解密失败的数据库不包含在内
+    """
+    os.makedirs(db_dir, exist_ok=True)
+    loaded = {}
+    for name in names or MEMORY_DATABASES[db_version]:
+        src_path = os.path.join(src_dir, name)
+        if not os.path.isfile(src_path):
+            continue
+        try:
+            database = decrypt_to_memory(db_version, key, src_path, memory_limit)
+        except (OSError, ValueError) as e:
+            logger.error(f'{src_path} 解密到内存失败: {e}')
+            continue
+        db_path = os.path.join(db_dir, name)
+        register_memory_database(db_path, database)
+        loaded[db_path] = database
+    return loaded
+
+
+def is_memory_database(db_version, name) -> bool:
+    """
+    @param name: 相对于源目录的路径
+    @return: 是否在 MEMORY_DATABASES 中
+    """
+    name = os.path.normcase(os.path.normpath(name))
+    return any(name == os.path.normcase(item) for item in MEMORY_DATABASES[db_version])
+
+
+def remove_plaintext(db_path):
+    """删除以前解密到磁盘上的明文副本及其 WAL、增量解密记录"""
+    for path in (db_path, db_path + '-wal', db_path + '-shm', db_path + '.pages', db_path + '.wal'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def release_databases(db_paths: Iterable[str]):
+    """释放 load_databases_in_memory 加载的数据库，之后这些路径重新指向磁盘上的文件"""
+    for db_path in db_paths:
+        unregister_memory_database(db_path)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/20 3:00
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-snapshot.py
+@Description : 把主数据库和 -wal 中已提交的页一起解密成一致的明文快照
+
+微信的数据库开着 WAL，最新写入的页先追加在 xxx.db-wal 中，checkpoint 之后才写回 xxx.db。
+WAL 文件的格式（https://www.sqlite.org/fileformat2.html#walformat）：
+    - 32 字节文件头：magic、版本、页大小、checkpoint 序号、salt1、salt2、校验和
+    - 之后每一帧 = 24 字节帧头（页号、提交后的页数、salt1、salt2、校验和）+ 一整页
+帧中的页和主数据库用同样的格式加密（每页自带 IV 和 HMAC），所以可以逐帧校验、解密后覆盖到镜像上。
+
+一次快照：
+    1. 读 WAL 文件头，主数据库按页增量解密（见 incremental.py），上一次已经从 WAL 覆盖过的页不读主数据库
+    2. 从上一次读到的位置继续读 WAL 帧，salt 和累积校验和都对得上才算有效，只应用到最后一个提交帧为止
+    3. 再读一次 WAL 文件头，和第 1 步不同说明期间 WAL 被重置（checkpoint 后重新开始），重来一次
+读到的位置、累积校验和、被 WAL 覆盖的页记录在 <输出文件>.wal 中，WAL 的 salt 变了就从头读。
+checkpoint 把帧原样写回主数据库，写回的页和帧的 IV 相同，WAL 重置后不会再解密一遍。
+"""
+import io
+import json
+import os
+import struct
+import time
+from typing import Dict, Tuple
+
+from wxManager.decrypt.incremental import PAGE_SIZE, SALT_SIZE, PAGE_CHANGED, PageMirror, open_encrypted, sync_pages
+from wxManager.log import logger
+
+WAL_SUFFIX = '-wal'
+STATE_SUFFIX = '.wal'
+WAL_MAGIC = (0x377f0682, 0x377f0683)
+WAL_HEADER_SIZE = 32
+FRAME_HEADER_SIZE = 24
+FRAME_SIZE = FRAME_HEADER_SIZE + PAGE_SIZE
+
+# WAL 在读取期间被重置、整库解密时有页正在写入时重试的次数
+SNAPSHOT_RETRIES = 3
+# 整库解密时有页正在写入，等这么久（秒）再重新读取
+TORN_RETRY_DELAY = 0.2
+
+_WAL_HEADER = struct.Struct('>8I')
+_FRAME_HEADER = struct.Struct('>6I')
+
+
+class TornPagesError(ValueError):
+    """整库解密时有页一直校验失败（微信正在写入），解密结果不完整"""
+
+
+def wal_checksum(data: bytes, s0: int, s1: int, big_endian: bool) -> Tuple[int, int]:
+    """SQLite WAL 的累积校验和，data 长度是 8 的倍数"""
+    words = struct.unpack(('>' if big_endian else '<') + f'{len(data) // 4}I', data)
+    for i in range(0, len(words), 2):
+        s0 = (s0 + words[i] + s1) & 0xFFFFFFFF
+        s1 = (s1 + words[i + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+
+def read_wal_header(wal_path) -> dict | None:
+    """
+    @return: {'salt': [salt1, salt2], 'checkpoint': checkpoint 序号, 'big_endian': 校验和字节序, 'cksum': [s0, s1]}；
+             没有 WAL、WAL 为空或文件头无效时返回 None
+    """
+    try:
+        with open(wal_path, 'rb') as f:
+            data = f.read(WAL_HEADER_SIZE)
+    except OSError:
+        return None
+    if len(data) < WAL_HEADER_SIZE:
+        return None
+    magic, version, page_size, checkpoint, salt1, salt2, cksum1, cksum2 = _WAL_HEADER.unpack(data)
+    if magic not in WAL_MAGIC:
+        return None
+    big_endian = bool(magic & 1)
+    if wal_checksum(data[:24], 0, 0, big_endian) != (cksum1, cksum2):
+        return None
+    if page_size != PAGE_SIZE:
+        logger.info(f'{wal_path} 页大小 {page_size} 不是 {PAGE_SIZE}，忽略')
+        return None
+    return {'salt': [salt1, salt2], 'checkpoint': checkpoint, 'big_endian': big_endian, 'cksum': [cksum1, cksum2]}
+
+
+def read_wal_frames(wal_path, header: dict, offset: int, cksum) -> Tuple[Dict[int, bytes], dict | None]:
+    """
+    从 offset 开始读取已提交的帧
+    @param wal_path:
+    @param header: read_wal_header 的返回值
+    @param offset: 开始读取的位置，必须是帧的边界
+    @param cksum: offset 之前最后一帧的累积校验和
+    @return: ({页号: 该页最后一次提交的密文}, 最后一个提交帧 {'offset': 之后的位置, 'cksum': 校验和, 'db_size': 页数})，
+             没有新的提交帧时第二项为 None
+    """
+    committed = {}
+    pending = {}
+    commit = None
+    s0, s1 = cksum
+    big_endian = header['big_endian']
+    salt = tuple(header['salt'])
+    with open(wal_path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            frame = f.read(FRAME_SIZE)
+            if len(frame) < FRAME_SIZE:
+                break
+            pgno, db_size, salt1, salt2, cksum1, cksum2 = _FRAME_HEADER.unpack_from(frame)
+            if (salt1, salt2) != salt:
+                # 上一轮 WAL 留下的旧帧
+                break
+            s0, s1 = wal_checksum(frame[:8] + frame[FRAME_HEADER_SIZE:], s0, s1, big_endian)
+            if (s0, s1) != (cksum1, cksum2):
+                # 正在写入的帧
+                break
+            offset += FRAME_SIZE
+            pending[pgno] = frame[FRAME_HEADER_SIZE:]
+            if db_size:
+                committed.update(pending)
+                pending.clear()
+                commit = {'offset': offset, 'cksum': [s0, s1], 'db_size': db_size}
+    return committed, commit
+
+
+def _load_state(path, header) -> dict | None:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if header is None or state.get('salt') != header['salt']:
+        return None
+    return state
+
+
+def _save_state(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _snapshot_once(db_version, key, src_path, dest_path, incremental, file=None) -> dict | None:
+    wal_path = src_path + WAL_SUFFIX
+    incremental = incremental and file is None
+    state_path = dest_path + STATE_SUFFIX if incremental else None
+    header = read_wal_header(wal_path)
+    state = _load_state(state_path, header) if incremental else None
+    if state is None:
+        state = {'offset': WAL_HEADER_SIZE, 'cksum': header['cksum'] if header else [0, 0], 'overlay': [],
+                 'db_size': 0}
+    overlay = set(state['overlay'])
+
+    with open(src_path, 'rb') as f_in:
+        cipher, first = open_encrypted(db_version, key, f_in)
+        with PageMirror(cipher, first[:SALT_SIZE], dest_path, incremental, file) as mirror:
+            if mirror.full:
+                # 镜像重建，WAL 也要从头读
+                overlay.clear()
+                state.update(offset=WAL_HEADER_SIZE, cksum=header['cksum'] if header else [0, 0], db_size=0)
+            result = sync_pages(mirror, f_in, first, overlay)
+            frames, commit = read_wal_frames(wal_path, header, state['offset'], state['cksum']) if header else ({}, None)
+            if read_wal_header(wal_path) != header:
+                # 读取期间 WAL 被重置，已经写入镜像的页和 IV 记录是对应的，保存后重来
+                return None
+            for pgno in sorted(frames):
+                if mirror.write_page(pgno, frames[pgno]) == PAGE_CHANGED:
+                    result['changed'] += 1
+                overlay.add(pgno)
+            if commit:
+                state.update(commit)
+            db_size = state['db_size'] if overlay else result['pages']
+            mirror.truncate(db_size)
+            result.update(pages=db_size, torn=len(mirror.torn), wal_frames=len(frames))
+
+    if not incremental:
+        return result
+    if header:
+        state.update(salt=header['salt'], overlay=sorted(overlay))
+        _save_state(state_path, state)
+    elif os.path.exists(state_path):
+        os.remove(state_path)
+    return result
+
+
+def _snapshot_complete(db_version, key, src_path, dest_path, file=None) -> dict:
+    """
+    整库解密成一致的快照；没有旧镜像可以保留，校验失败的页是全 0，所以有页正在写入时稍等重新读取
+    """
+    error = None
+    for _ in range(SNAPSHOT_RETRIES):
+        # 每次都是整库解密，重试时覆盖上一次写入的内容
+        result = _snapshot_once(db_version, key, src_path, dest_path, False, file)
+        if result is None:
+            logger.info(f'{src_path} 读取期间 WAL 被重置，重新读取')
+            error = ValueError(f'{src_path} 的 WAL 一直在重置，稍后再同步')
+            continue
+        if not result['torn']:
+            return result
+        logger.info(f'{src_path} 有 {result["torn"]} 页正在写入，重新读取')
+        error = TornPagesError(f'{src_path} 有 {result["torn"]} 页一直在写入，稍后再同步')
+        time.sleep(TORN_RETRY_DELAY)
+    if dest_path is not None and os.path.exists(dest_path):
+        # 不留下打不开的明文
+        os.remove(dest_path)
+    raise error
+
+
+def snapshot_to_buffer(db_version, key: str, src_path) -> bytes:
+    """
+    主数据库 + WAL 中已提交的页解密到内存，不写磁盘
+    @return: 明文数据库的完整内容；第一页校验失败、有页一直在写入或 WAL 反复被重置时抛出 ValueError
+    """
+    buffer = io.BytesIO()
+    _snapshot_complete(db_version, key, src_path, None, buffer)
+    return buffer.getvalue()
+
+
+def snapshot_db_file(db_version, key: str, src_path, dest_path, incremental=True) -> dict:
+    """
+    主数据库 + WAL 中已提交的页一起解密成一致的明文快照
+    @param db_version: 3 或 4
+    @param key: 十六进制的 key
+    @param src_path: 加密的源数据库，同目录下的 <src_path>-wal 会被一起读取
+    @param dest_path: 明文镜像
+    @param incremental: True 时只解密变化的页、只读取新增的帧，正在写入的页保留旧内容，结果中 torn 不为 0，下次同步时重新解密；
+                        False 时整库解密，不保存 .pages/.wal 记录，有页正在写入时重试，一直不成功抛出 TornPagesError
+    @return: {'pages', 'changed', 'torn', 'full', 'wal_frames': 本次应用的页数}；
+             第一页校验失败或 WAL 反复被重置时抛出 ValueError
+    """
+    if not incremental:
+        return _snapshot_complete(db_version, key, src_path, dest_path)
+    for _ in range(SNAPSHOT_RETRIES):
+        result = _snapshot_once(db_version, key, src_path, dest_path, incremental)
+        if result is not None:
+            if result['torn']:
+                logger.info(f'{src_path} 有 {result["torn"]} 页正在写入，下次同步时重新解密')
+            return result
+        logger.info(f'{src_path} 读取期间 WAL 被重置，重新读取')
+    raise ValueError(f'{src_path} 的 WAL 一直在重置，稍后再同步')
+
+
+def has_wal(src_path) -> bool:
+    """源数据库是否有还没写回的 WAL 帧"""
+    return read_wal_header(src_path + WAL_SUFFIX) is not None
+
+
+if __name__ == '__main__':
+    pass
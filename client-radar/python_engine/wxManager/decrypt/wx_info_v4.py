@@ -13,7 +13,6 @@ import ctypes
 import multiprocessing
 import os.path
 
-import hmac
 import os
 import struct
 import time
@@ -21,12 +20,13 @@ from ctypes import wintypes
 from multiprocessing import freeze_support
 
 import pymem
-from Crypto.Protocol.KDF import PBKDF2
-from Crypto.Hash import SHA512
 import yara
 
 from wxManager.decrypt.common import WeChatInfo
 from wxManager.decrypt.common import get_version
+from wxManager.decrypt.key_scanner import ProcessMemorySource, find_key
+from wxManager.decrypt.key_vault import KeyVault
+from wxManager.decrypt.key_verifier import check_key_v4, verify_keys
 
 # 定义必要的常量
 PROCESS_ALL_ACCESS = 0x1F0FFF
@@ -44,9 +44,6 @@ ROUND_COUNT = 256000
 PAGE_SIZE = 4096
 SALT_SIZE = 16
 
-finish_flag = False
-
-
 # 定义 MEMORY_BASIC_INFORMATION 结构
 class MEMORY_BASIC_INFORMATION(ctypes.Structure):
     _fields_ = [
@@ -219,144 +216,30 @@ def read_string_from_pid(pid: int, addr: int, size: int):
 
 
 def is_ok(passphrase, buf):
-    global finish_flag
-    if finish_flag:
-        return False
-    # 获取文件开头的 salt
-    salt = buf[:SALT_SIZE]
-    # salt 异或 0x3a 得到 mac_salt，用于计算 HMAC
-    mac_salt = bytes(x ^ 0x3a for x in salt)
-    # 使用 PBKDF2 生成新的密钥
-    new_key = PBKDF2(passphrase, salt, dkLen=KEY_SIZE, count=ROUND_COUNT, hmac_hash_module=SHA512)
-    # 使用新的密钥和 mac_salt 计算 mac_key
-    mac_key = PBKDF2(new_key, mac_salt, dkLen=KEY_SIZE, count=2, hmac_hash_module=SHA512)
-    # 计算 hash 校验码的保留空间
-    reserve = IV_SIZE + HMAC_SHA512_SIZE
-    reserve = ((reserve + AES_BLOCK_SIZE - 1) // AES_BLOCK_SIZE) * AES_BLOCK_SIZE
-    # 校验 HMAC
-    start = SALT_SIZE
-    end = PAGE_SIZE
-    mac = hmac.new(mac_key, buf[start:end - reserve + IV_SIZE], SHA512)
-    mac.update(struct.pack('<I', 1))  # page number as 1
-    hash_mac = mac.digest()
-    # 校验 HMAC 是否一致
-    hash_mac_start_offset = end - reserve + IV_SIZE
-    hash_mac_end_offset = hash_mac_start_offset + len(hash_mac)
-    if hash_mac == buf[hash_mac_start_offset:hash_mac_end_offset]:
-        print(f"[v] found key at 0x{start:x}")
-        finish_flag = True
-        return True
-    return False
-
-
-def check_chunk(chunk, buf):
-    global finish_flag
-    if finish_flag:
-        return False
-    if is_ok(chunk, buf):
-        return chunk
-    return False
-
-
-def verify_key(key: bytes, buffer: bytes, flag, result):
-    if len(key) != 32:
-        return False
-    if flag.value:  # 如果其他进程已找到结果，提前退出
-        return False
-    if is_ok(key, buffer):  # 替换为实际的目标检测条件
-        print("Key found!", key)
-        with flag.get_lock():  # 保证线程安全
-            flag.value = True
-            return key
-    else:
-        return False
+    return check_key_v4(passphrase, buf)
 
 
 def get_key_(keys, buf):
-    pool = multiprocessing.Pool(processes=multiprocessing.cpu_count() // 2)
-    results = pool.starmap(check_chunk, ((key, buf) for key in keys))
-    pool.close()
-    pool.join()
-
-    for r in results:
-        if r:
-            print("Key found!", r)
-            return bytes.hex(r)
-    return None
+    """
+    校验一组候选 key，任意一个通过后其他进程立即停止
+    :param keys:
+    :param buf: 数据库文件的第一页
+    :return: 十六进制的 key
+    """
+    return verify_keys(keys, buf, check_key_v4)
 
 
-def get_key_inner(pid, process_infos):
+def get_key(pid, process_handle, buf):
     """
-    扫描可能为key的内存
+    扫描进程内存中的候选 key，边扫描边校验
+    扫描逻辑见 key_scanner，同样可以用于离线分析内存 dump 文件
     :param pid:
-    :param process_infos:
+    :param process_handle:
+    :param buf: 数据库文件的第一页
     :return:
     """
-    process_handle = open_process(pid)
-    rules_v4_key = r'''
-        rule GetKeyAddrStub
-        {
-            strings:
-                $a = /.{6}\x00{2}\x00{8}\x20\x00{7}\x2f\x00{7}/
-            condition:
-                all of them
-        }
-        '''
-    rules = yara.compile(source=rules_v4_key)
-    pre_addresses = []
-    for base_address, region_size in process_infos:
-        memory = read_process_memory(process_handle, base_address, region_size)
-        # 定义目标数据（如内存或文件内容）
-        target_data = memory  # 二进制数据
-        if not memory:
-            continue
-        # 加上这些判断条件时灵时不灵
-        # if b'-----BEGIN PUBLIC KEY-----' not in target_data or b'USER_KEYINFO' not in target_data:
-        #     continue
-        # if b'db_storage' not in memory:
-        #     continue
-        # with open(f'key-{base_address}.bin', 'wb') as f:
-        #     f.write(target_data)
-        matches = rules.match(data=target_data)
-        if matches:
-            for match in matches:
-                rule_name = match.rule
-                if rule_name == 'GetKeyAddrStub':
-                    for string in match.strings:
-                        instance = string.instances[0]
-                        offset, content = instance.offset, instance.matched_data
-                        addr = read_num(target_data, offset, 8)
-                        pre_addresses.append(addr)
-    keys = []
-    key_set = set()
-    for pre_address in pre_addresses:
-        if True or any([base_address <= pre_address <= base_address + region_size - KEY_SIZE for base_address, region_size in
-                process_infos]):
-            key = read_bytes_from_pid(pid, pre_address, 32)
-            if key not in key_set:
-                keys.append(key)
-                key_set.add(key)
-    return keys
-
-
-def get_key(pid, process_handle, buf):
-    process_infos = get_memory_regions(process_handle)
-
-    def split_list(lst, n):
-        k, m = divmod(len(lst), n)
-        return (lst[i * k + min(i, m):(i + 1) * k + min(i + 1, m)] for i in range(n))
-
-    keys = []
-    pool = multiprocessing.Pool(processes=multiprocessing.cpu_count() // 2)
-    results = pool.starmap(get_key_inner, ((pid, process_info_) for process_info_ in
-                                           split_list(process_infos, min(len(process_infos), 40))))
-    pool.close()
-    pool.join()
-    for r in results:
-        if r:
-            keys += r
-    key = get_key_(keys, buf)
-    return key
+    with ProcessMemorySource(pid) as source:
+        return find_key(source, buf)
 
 
 def get_wx_dir(process_handle):
@@ -482,10 +365,18 @@ def dump_wechat_info_v4(pid) -> WeChatInfo | None:
     if not os.path.exists(db_file_path):
         db_file_path = os.path.join(wechat_info.wx_dir, 'head_image', 'head_image.db')
     with open(db_file_path, 'rb') as f:
-        buf = f.read()
-    wechat_info.key = get_key(pid, process_handle, buf)
-    ctypes.windll.kernel32.CloseHandle(process_handle)
+        buf = f.read(PAGE_SIZE)
     wechat_info.wxid = '_'.join(wechat_info.wx_dir.split('\\')[-3].split('_')[0:-1])
+    # 先用本地密钥库中保存的 key 校验一次，失败才扫描进程内存
+    message_db_path = os.path.join(wechat_info.wx_dir, 'message', 'message_0.db')
+    if not os.path.exists(message_db_path):
+        message_db_path = db_file_path
+    vault = KeyVault()
+    wechat_info.key = vault.get(wechat_info.wxid, message_db_path, check_key_v4)
+    if not wechat_info.key:
+        wechat_info.key = get_key(pid, process_handle, buf)
+        vault.put(wechat_info.wxid, message_db_path, wechat_info.key)
+    ctypes.windll.kernel32.CloseHandle(process_handle)
     wechat_info.wx_dir = '\\'.join(wechat_info.wx_dir.split('\\')[:-2])
     process.join()  # 等待子进程完成
     if not queue.empty():
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 11:05
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-interaction_graph.py
+@Description : 联系人互动关系图，数据来源于朋友圈点赞/评论和聊天记录发送者统计
+"""
+import bisect
+import math
+import time
+from array import array
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from wxManager.model import Me
+
+# 各类互动的权重
+WEIGHT_LIKE = 1.0
+WEIGHT_COMMENT = 3.0
+WEIGHT_REPLY = 2.0
+WEIGHT_MESSAGE = 0.2
+
+# 朋友圈 CommentType，1=点赞，2=评论
+COMMENT_TYPE_LIKE = 1
+COMMENT_TYPE_COMMENT = 2
+
+# 时间衰减常数（秒），默认 30 天
+DEFAULT_DECAY = 30 * 24 * 3600
+
+
+def _sum_stats(rows) -> Dict[Tuple[str, str], list]:
+    """多个分片中同一 (talker, sender) 的统计合并为 {(talker, sender): [count, last_time]}"""
+    stats = {}
+    for talker, sender, count, last_time in rows:
+        item = stats.setdefault((talker, sender), [0, 0])
+        item[0] += count
+        item[1] = max(item[1], last_time)
+    return stats
+
+
+class _CSR:
+    """
+    压缩稀疏行存储的有向带权邻接表
+    每一行的邻居按节点 id 升序存放，便于二分查找；order 记录行内按权重降序的行内偏移，便于取 top-k
+    """
+
+    def __init__(self):
+        self.indptr = array('q', [0])
+        self.indices = array('q')
+        self.weights = array('d')
+        self.scores = array('d')  # 时间衰减累加值，见 InteractionGraph._decay_factor
+        self.order = array('q')
+
+    def row_range(self, node) -> Tuple[int, int]:
+        if node + 1 >= len(self.indptr):
+            return 0, 0
+        return self.indptr[node], self.indptr[node + 1]
+
+    def find(self, src, dst) -> int:
+        """
+        @return: (src,dst) 边在数组中的下标，不存在时返回 -1
+        """
+        lo, hi = self.row_range(src)
+        pos = bisect.bisect_left(self.indices, dst, lo, hi)
+        if pos < hi and self.indices[pos] == dst:
+            return pos
+        return -1
+
+    def row(self, node) -> Dict[int, list]:
+        """一行导出为 {dst: [weight, score]}，用于与增量数据合并"""
+        lo, hi = self.row_range(node)
+        return {self.indices[i]: [self.weights[i], self.scores[i]] for i in range(lo, hi)}
+
+    def _append_row(self, row: Dict[int, list]):
+        start = len(self.indices)
+        for dst in sorted(row):
+            weight, score = row[dst]
+            self.indices.append(dst)
+            self.weights.append(weight)
+            self.scores.append(score)
+        self.order.extend(sorted(range(len(row)), key=lambda i: -self.weights[start + i]))
+        self.indptr.append(len(self.indices))
+
+    def _copy_rows(self, other: '_CSR', start, end):
+        """整段复制 other 的 [start, end) 行，other 中还没有的行为空行"""
+        if start >= end:
+            return
+        old_end = min(end, len(other.indptr) - 1)
+        if start < old_end:
+            lo, hi = other.indptr[start], other.indptr[old_end]
+            offset = len(self.indices) - lo
+            self.indices.extend(other.indices[lo:hi])
+            self.weights.extend(other.weights[lo:hi])
+            self.scores.extend(other.scores[lo:hi])
+            self.order.extend(other.order[lo:hi])
+            self.indptr.extend(ptr + offset for ptr in other.indptr[start + 1:old_end + 1])
+        self.indptr.extend([len(self.indices)] * (end - max(start, old_end)))
+
+    def merge(self, updates: Dict[int, Dict[int, list]], node_num) -> '_CSR':
+        """
+        合并增量，返回新的 CSR
+        只有有新边的行逐条重建，其余的行整段复制数组（内存拷贝）；除此之外只有 indptr 是 O(节点数) 的
+        @param updates: {src: {dst: [weight, score]}}
+        @param node_num: 合并后的节点数
+        """
+        csr = _CSR()
+        copied = 0
+        for node in sorted(updates):
+            csr._copy_rows(self, copied, node)
+            row = self.row(node)
+            for dst, (weight, score) in updates[node].items():
+                edge = row.setdefault(dst, [0.0, 0.0])
+                edge[0] += weight
+                edge[1] += score
+            csr._append_row(row)
+            copied = node + 1
+        csr._copy_rows(self, copied, node_num)
+        return csr
+
+
+class InteractionGraph:
+    """
+    互动关系图
+    边 a->b 表示 a 对 b 有过互动（给 b 的朋友圈点赞/评论、回复 b 的评论、给 b 发消息）
+    新数据先进入增量缓冲区，查询前合并进 CSR 数组；sync_* 方法按时间水位线只拉取新数据
+
+    使用示例：
+    graph = InteractionGraph()
+    graph.sync_sns(sns)
+    graph.sync_messages(msg_db)
+    graph.top_interactors('wxid_xxx', 10)
+    """
+
+    def __init__(self, decay=DEFAULT_DECAY, epoch=None):
+        self.decay = decay
+        # 衰减计算的基准时间，score = Σ w·exp((t-epoch)/decay)，查询时再乘 exp(-(now-epoch)/decay)
+        self.epoch = int(time.time()) if epoch is None else epoch
+        self.nodes: List[str] = []
+        self.node_ids: Dict[str, int] = {}
+        self.node_scores = array('d')
+        self._out = _CSR()
+        self._in = _CSR()
+        self._pending: Dict[Tuple[int, int], list] = {}
+        # 已同步数据的最大时间戳
+        self.sns_watermark = 0
+        self.msg_watermark = 0
+        # msg_watermark 这一秒已经统计过的消息数 {(talker, sender): count}，下次按 >= 水位线查询时扣除
+        self._msg_seen: Dict[Tuple[str, str], int] = {}
+        # sns_watermark 这一秒已经统计过的互动 {Sns.get_interactions 的一行: 次数}，同上
+        self._sns_seen: Counter = Counter()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _node_id(self, wxid) -> int:
+        node = self.node_ids.get(wxid)
+        if node is None:
+            node = len(self.nodes)
+            self.node_ids[wxid] = node
+            self.nodes.append(wxid)
+            self.node_scores.append(0.0)
+        return node
+
+    def _decay_factor(self, timestamp) -> float:
+        return math.exp((timestamp - self.epoch) / self.decay)
+
+    def add_interaction(self, src: str, dst: str, weight: float, timestamp: int, count=1):
+        """
+        添加一次（或 count 次）互动
+        @param src: 发起互动的 wxid
+        @param dst: 被互动的 wxid
+        @param weight: 单次互动的权重
+        @param timestamp: 互动时间
+        @param count: 次数，聚合数据按最后一次的时间计算衰减
+        @return:
+        """
+        if not src or not dst or src == dst:
+            return
+        u, v = self._node_id(src), self._node_id(dst)
+        weight *= count
+        score = weight * self._decay_factor(timestamp)
+        edge = self._pending.setdefault((u, v), [0.0, 0.0])
+        edge[0] += weight
+        edge[1] += score
+        self.node_scores[u] += score
+        self.node_scores[v] += score
+
+    def add_sns_interactions(self, rows):
+        """
+        @param rows: Sns.get_interactions 的返回结果
+        """
+        for feed_id, author, create_time, comment_type, from_username, reply_username in rows:
+            if comment_type == COMMENT_TYPE_LIKE:
+                self.add_interaction(from_username, author, WEIGHT_LIKE, create_time)
+            elif comment_type == COMMENT_TYPE_COMMENT:
+                self.add_interaction(from_username, author, WEIGHT_COMMENT, create_time)
+                if reply_username:
+                    self.add_interaction(from_username, reply_username, WEIGHT_REPLY, create_time)
+            self.sns_watermark = max(self.sns_watermark, create_time)
+
+    def add_message_stats(self, rows, me=''):
+        """
+        @param rows: Msg.get_sender_stats / MessageDB.get_sender_stats 的返回结果
+        @param me: 自己的 wxid，收到的单聊消息（sender == talker）记为 talker -> me
+        """
+        for talker, sender, count, last_time in rows:
+            dst = talker
+            if sender == talker and not talker.endswith('@chatroom'):
+                dst = me
+            self.add_interaction(sender, dst, WEIGHT_MESSAGE, last_time, count)
+            self.msg_watermark = max(self.msg_watermark, last_time)
+
+    def sync_sns(self, sns):
+        """
+        增量同步朋友圈互动
+        @param sns: wxManager.db_v3.sns.Sns
+        """
+        # 和 sync_messages 一样按 >= 水位线查询，扣除这一秒已经统计过的
+        rows = list((Counter(map(tuple, sns.get_interactions(self.sns_watermark))) - self._sns_seen).elements())
+        self.add_sns_interactions(rows)
+        self._sns_seen = Counter(map(tuple, sns.get_interactions(self.sns_watermark, self.sns_watermark)))
+
+    def sync_messages(self, msg_db):
+        """
+        增量同步聊天记录
+        @param msg_db: wxManager.db_v3.msg.Msg 或 wxManager.db_v4.message.MessageDB
+        """
+        # 和水位线同一秒、下一次同步才写入的消息也要统计，所以按 >= 查询，再扣除这一秒已经统计过的
+        rows = []
+        for (talker, sender), (count, last_time) in _sum_stats(msg_db.get_sender_stats(self.msg_watermark)).items():
+            count -= self._msg_seen.get((talker, sender), 0)
+            if count > 0:
+                rows.append((talker, sender, count, last_time))
+        self.add_message_stats(rows, Me().wxid)
+        self._msg_seen = {
+            key: count
+            for key, (count, _) in _sum_stats(msg_db.get_sender_stats(self.msg_watermark, self.msg_watermark)).items()
+        }
+
+    def compact(self):
+        """
+        将增量缓冲区合并进 CSR 数组，只重建有新边的行，见 _CSR.merge
+        """
+        if not self._pending:
+            return
+        out_updates, in_updates = {}, {}
+        for (u, v), edge in self._pending.items():
+            out_updates.setdefault(u, {})[v] = edge
+            in_updates.setdefault(v, {})[u] = edge
+        node_num = len(self.nodes)
+        self._out = self._out.merge(out_updates, node_num)
+        self._in = self._in.merge(in_updates, node_num)
+        self._pending.clear()
+
+    def _now_factor(self, now=None) -> float:
+        now = time.time() if now is None else now
+        return math.exp(-(now - self.epoch) / self.decay)
+
+    def top_interactors(self, wxid, k=10, direction='in') -> List[Tuple[str, float]]:
+        """
+        互动最多的 k 个联系人
+        @param wxid:
+        @param k:
+        @param direction: in=谁和 wxid 互动最多，out=wxid 和谁互动最多
+        @return: [(wxid, 权重)]
+        """
+        self.compact()
+        node = self.node_ids.get(wxid)
+        if node is None:
+            return []
+        csr = self._in if direction == 'in' else self._out
+        lo, hi = csr.row_range(node)
+        return [(self.nodes[csr.indices[lo + i]], csr.weights[lo + i]) for i in csr.order[lo:min(hi, lo + k)]]
+
+    def engagement_score(self, wxid, now=None) -> float:
+        """
+        按时间衰减加权后的互动活跃度（收到和发出的互动都计算在内）
+        """
+        node = self.node_ids.get(wxid)
+        if node is None:
+            return 0.0
+        return self.node_scores[node] * self._now_factor(now)
+
+    def edge_score(self, src, dst, now=None) -> float:
+        """
+        src 对 dst 按时间衰减加权后的互动分数
+        """
+        self.compact()
+        u, v = self.node_ids.get(src), self.node_ids.get(dst)
+        if u is None or v is None:
+            return 0.0
+        pos = self._out.find(u, v)
+        if pos == -1:
+            return 0.0
+        return self._out.scores[pos] * self._now_factor(now)
+
+    def weight(self, src, dst) -> float:
+        self.compact()
+        u, v = self.node_ids.get(src), self.node_ids.get(dst)
+        if u is None or v is None:
+            return 0.0
+        pos = self._out.find(u, v)
+        return self._out.weights[pos] if pos != -1 else 0.0
+
+    def is_mutual(self, wxid1, wxid2) -> bool:
+        return self.weight(wxid1, wxid2) > 0 and self.weight(wxid2, wxid1) > 0
+
+    def mutual_interactions(self, wxid, k=None) -> List[Tuple[str, float]]:
+        """
+        双向都有互动的联系人，按两个方向权重的较小值降序
+        @return: [(wxid, 权重)]
+        """
+        self.compact()
+        node = self.node_ids.get(wxid)
+        if node is None:
+            return []
+        out_lo, out_hi = self._out.row_range(node)
+        in_lo, in_hi = self._in.row_range(node)
+        result = []
+        i, j = out_lo, in_lo
+        # 两行都按节点 id 有序，归并求交集
+        while i < out_hi and j < in_hi:
+            a, b = self._out.indices[i], self._in.indices[j]
+            if a == b:
+                result.append((self.nodes[a], min(self._out.weights[i], self._in.weights[j])))
+                i += 1
+                j += 1
+            elif a < b:
+                i += 1
+            else:
+                j += 1
+        result.sort(key=lambda x: -x[1])
+        return result[:k] if k else result
+
+
+if __name__ == '__main__':
+    pass
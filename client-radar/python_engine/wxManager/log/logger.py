@@ -7,12 +7,13 @@ filename = time.strftime("%Y-%m-%d", time.localtime(time.time()))
 logger = logging.getLogger('test')
 logger.setLevel(level=logging.DEBUG)
 formatter = logging.Formatter('%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
+# delay=True: 第一次写日志时才创建文件，导入时不产生文件IO
 try:
     if not os.path.exists('./app/log/logs'):
         os.mkdir('./app/log/logs')
-    file_handler = logging.FileHandler(f'./app/log/logs/{filename}-log.log', encoding='utf-8')
+    file_handler = logging.FileHandler(f'./app/log/logs/{filename}-log.log', encoding='utf-8', delay=True)
 except:
-    file_handler = logging.FileHandler(f'日志文件-{filename}-log.log', encoding='utf-8')
+    file_handler = logging.FileHandler(f'日志文件-{filename}-log.log', encoding='utf-8', delay=True)
 
 file_handler.setLevel(level=logging.INFO)
 file_handler.setFormatter(formatter)
@@ -8,10 +8,8 @@
 @File        : MemoTrace-manager_v4.py
 @Description : 
 """
-import concurrent
 import os
 import re
-import traceback
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import date
 from typing import Tuple, List, Any
@@ -20,6 +18,7 @@ import xmltodict
 
 from wxManager import MessageType
 from wxManager.db_main import DataBaseInterface
+from wxManager.merge_coordinator import MergeCoordinator
 from wxManager.db_v3.audio2text import Audio2TextDB
 from wxManager.db_v3.hard_link_file import HardLinkFile
 from wxManager.db_v3.hard_link_image import HardLinkImage
@@ -35,8 +34,10 @@ from wxManager.db_v3.open_im_msg import OpenIMMsgDB
 from wxManager.db_v3.public_msg import PublicMsg
 from wxManager.db_v3.micro_msg import MicroMsg
 from wxManager.db_v3.favorite import Favorite
+from wxManager.avatar_export import export_avatars
 from wxManager.log import logger
 from wxManager.model.contact import Contact, Me, ContactType, Person
+from wxManager.parser.contact_parser import parse_extra_buf, parse_extra_bufs
 from wxManager.parser.file_parser import get_image_type
 from wxManager.parser.util.protocbuf.roomdata_pb2 import ChatRoomData
 from wxManager.parser.wechat_v3 import FACTORY_REGISTRY, parser_sub_type, Singleton
@@ -83,62 +84,7 @@ type_name_dict = {
 
 
 def decodeExtraBuf(extra_buf_content: bytes):
-    if not extra_buf_content:
-        return {
-            "region": ('', '', ''),
-            "signature": '',
-            "telephone": '',
-            "gender": 0,
-        }
-    trunkName = {
-        b"\x46\xCF\x10\xC4": "个性签名",
-        b"\xA4\xD9\x02\x4A": "国家",
-        b"\xE2\xEA\xA8\xD1": "省份",
-        b"\x1D\x02\x5B\xBF": "市",
-        # b"\x81\xAE\x19\xB4": "朋友圈背景url",
-        # b"\xF9\x17\xBC\xC0": "公司名称",
-        # b"\x4E\xB9\x6D\x85": "企业微信属性",
-        # b"\x0E\x71\x9F\x13": "备注图片",
-        b"\x75\x93\x78\xAD": "手机号",
-        b"\x74\x75\x2C\x06": "性别",
-    }
-    res = {"手机号": ""}
-    off = 0
-    try:
-        for key in trunkName:
-            trunk_head = trunkName[key]
-            try:
-                off = extra_buf_content.index(key) + 4
-            except:
-                pass
-            char = extra_buf_content[off: off + 1]
-            off += 1
-            if char == b"\x04":  # 四个字节的int，小端序
-                intContent = extra_buf_content[off: off + 4]
-                off += 4
-                intContent = int.from_bytes(intContent, "little")
-                res[trunk_head] = intContent
-            elif char == b"\x18":  # utf-16字符串
-                lengthContent = extra_buf_content[off: off + 4]
-                off += 4
-                lengthContent = int.from_bytes(lengthContent, "little")
-                strContent = extra_buf_content[off: off + lengthContent]
-                off += lengthContent
-                res[trunk_head] = strContent.decode("utf-16").rstrip("\x00")
-        return {
-            "region": (res["国家"], res["省份"], res["市"]),
-            "signature": res["个性签名"],
-            "telephone": res["手机号"],
-            "gender": res["性别"],
-        }
-    except:
-        logger.error(f'联系人解析错误:\n{traceback.format_exc()}')
-        return {
-            "region": ('', '', ''),
-            "signature": '',
-            "telephone": '',
-            "gender": 0,
-        }
+    return parse_extra_buf(extra_buf_content)
 
 
 def parser_messages(messages, username, db_dir=''):
@@ -177,6 +123,7 @@ class DataBaseV3(DataBaseInterface):
         self.db_dir = None
         self.chatroom_members_map = {}
         self.contacts_map = {}
+        self.chatroom_name_cache = {}  # 未命名群聊 -> 由群成员拼接出的名字
 
         self.misc_db = Misc('Misc.db')
         self.msg_db = Msg('Multi/MSG0.db', is_series=True)
@@ -197,6 +144,7 @@ class DataBaseV3(DataBaseInterface):
         Me().load_from_json(os.path.join(db_dir, 'info.json'))  # 加载自己的信息
         flag = True
         self.db_dir = db_dir
+        self.chatroom_name_cache = {}
         flag &= self.misc_db.init_database(db_dir)
         flag &= self.msg_db.init_database(db_dir)
         flag &= self.public_msg_db.init_database(db_dir)
@@ -241,6 +189,41 @@ class DataBaseV3(DataBaseInterface):
         """
         return self.micro_msg_db.get_session()
 
+    def get_sessions_enriched(self, limit=-1, offset=0, with_avatar=False) -> List[dict]:
+        """
+        侧边栏会话列表，会话、联系人、头像一次查询取出，不再逐个会话查询联系人
+        @param limit: 每页数量，-1 表示不分页
+        @param offset:
+        @param with_avatar: 是否返回头像数据
+        @return:
+        """
+        rows = self.micro_msg_db.get_sessions_enriched(
+            os.path.join(self.db_dir, 'Misc.db'), limit, offset, with_avatar
+        )
+        sessions = []
+        for row in rows:
+            username, remark, nickname = row[0], row[9] or '', row[10] or ''
+            if not nickname and username.endswith('@chatroom'):
+                nickname = self._get_chatroom_name(username)
+            sessions.append({
+                'username': username,
+                'display_name': remark or nickname or username,
+                'remark': remark,
+                'nickname': nickname,
+                'alias': row[11] or '',
+                'type': row[12] or 0,
+                'unread_count': row[2],
+                'last_timestamp': row[7],
+                'str_time': row[8],
+                'summary': row[5] or '',
+                'last_msg_type': row[6],
+                'small_head_url': row[13] or '',
+                'big_head_url': row[14] or '',
+                'avatar_md5': row[15] or '',
+                'avatar': row[16],
+            })
+        return sessions
+
     def get_messages(
             self,
             username_: str,
@@ -441,6 +424,11 @@ class DataBaseV3(DataBaseInterface):
         else:
             return self.media_msg_db.get_audio(reserved0, output_path, filename)
 
+    def get_audios(self, items, output_path, open_im=False):
+        if open_im:
+            return {}
+        return self.media_msg_db.get_audios(items, output_path)
+
     def get_audio_path(self, reserved0, output_path, filename=''):
         return self.media_msg_db.get_audio_path(reserved0, output_path, filename)
 
@@ -473,8 +461,16 @@ class DataBaseV3(DataBaseInterface):
     def get_avatar_buffer(self, username) -> bytes:
         return self.misc_db.get_avatar_buffer(username)
 
-    def create_contact(self, contact_info_list) -> Person:
-        detail = decodeExtraBuf(contact_info_list[9])
+    def export_avatars(self, output_dir, sprite=False) -> dict:
+        return export_avatars(self.misc_db.iter_avatars(), output_dir, sprite)
+
+    def create_contact(self, contact_info_list, detail=None) -> Person:
+        """
+        @param contact_info_list: MicroMsg.get_contact 的一行
+        @param detail: 已经解析好的 ExTraBuf，为空时在这里解析
+        """
+        if detail is None:
+            detail = decodeExtraBuf(contact_info_list[9])
         wxid = contact_info_list[0]
         nickname = contact_info_list[4]
         remark = contact_info_list[3]
@@ -492,6 +488,8 @@ class DataBaseV3(DataBaseInterface):
                 gender = '男'
             elif gender_code == 2:
                 gender = '女'
+            signature = detail.get('signature', '')
+            region = detail.get('region', region)
         type_ = contact_info_list[2]
         wxid = contact_info_list[0]
         contact = Contact(
@@ -565,8 +563,10 @@ class DataBaseV3(DataBaseInterface):
     def get_contacts(self) -> List[Person]:
         contacts = []
         contact_lists = self.micro_msg_db.get_contact()
-        for contact_info_list in contact_lists:
-            contact = self.create_contact(contact_info_list)
+        # 整张表的 ExTraBuf 一次解析完
+        details = parse_extra_bufs(contact_info_list[9] for contact_info_list in contact_lists)
+        for contact_info_list, detail in zip(contact_lists, details):
+            contact = self.create_contact(contact_info_list, detail)
             contacts.append(contact)
 
         contact_lists = self.open_contact_db.get_contacts()
@@ -575,6 +575,20 @@ class DataBaseV3(DataBaseInterface):
             contacts.append(contact)
         return contacts
 
+    def get_contacts_with_labels(self, label_names=None) -> List[Person]:
+        contacts = []
+        contact_lists = self.micro_msg_db.get_contacts_with_labels()
+        details = parse_extra_bufs(contact_info_list[9] for contact_info_list in contact_lists)
+        for contact_info_list, detail in zip(contact_lists, details):
+            contacts.append(self.create_contact(contact_info_list, detail))
+        if label_names:
+            label_names = set(label_names)
+            return [contact for contact in contacts if label_names.intersection(contact.label_list or ())]
+        # 企业微信联系人没有标签
+        for contact_info_list in self.open_contact_db.get_contacts():
+            contacts.append(self.create_open_im_contact(contact_info_list))
+        return contacts
+
     def set_remark(self, username: str, remark) -> bool:
         if username in self.contacts_map:
             self.contacts_map[username].remark = remark
@@ -640,9 +654,12 @@ class DataBaseV3(DataBaseInterface):
         :param wxid:
         :return:
         """
+        if wxid in self.chatroom_name_cache:
+            return self.chatroom_name_cache[wxid]
         chatroom = self.micro_msg_db.get_chatroom_info(wxid)
 
         if chatroom is None:
+            self.chatroom_name_cache[wxid] = ''
             return ''
         # 解析RoomData数据
         parsechatroom = ChatRoomData()
@@ -657,14 +674,21 @@ class DataBaseV3(DataBaseInterface):
             else:
                 contact = self.get_contact_by_username(mem.wxID)
                 chatroom_name += f'{contact.remark}、'
-        return chatroom_name.rstrip('、')
+        chatroom_name = chatroom_name.rstrip('、')
+        self.chatroom_name_cache[wxid] = chatroom_name
+        return chatroom_name
 
     # 联系人结束
 
     def get_favorite_items(self, time_range):
         return self.favorite_db.get_items(time_range)
 
-    def merge(self, db_dir):
+    def merge(self, db_dir, changed=None):
+        """
+        @param db_dir: 新数据库目录
+        @param changed: 只合并这些新数据库文件，None 表示全部
+        @return: {输出文件: {新数据库路径: {表名: 行数}}}
+        """
         merge_tasks = {
             self.msg_db: os.path.join(db_dir, 'Multi', 'MSG0.db'),
             self.media_msg_db: os.path.join(db_dir, 'Multi', 'MediaMSG0.db'),
@@ -680,19 +704,10 @@ class DataBaseV3(DataBaseInterface):
             self.public_msg_db: os.path.join(db_dir, 'PublicMsg.db'),
         }
 
-        def merge_task(db_instance, db_path):
-            """执行单个数据库的合并任务"""
-            db_instance.merge(db_path)
-
-        # 使用 ThreadPoolExecutor 进行多线程合并
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = {executor.submit(merge_task, db, path): (db, path) for db, path in merge_tasks.items()}
-
-            # 等待所有任务完成
-            for future in concurrent.futures.as_completed(futures):
-                db, path = futures[future]
-                try:
-                    future.result()  # 这里会抛出异常（如果有的话）
-                    print(f"成功合并数据库: {path}")
-                except Exception as e:
-                    print(f"合并 {path} 失败: {e}")
+        # 写入同一个文件的任务串行，不同文件之间并行；每批提交后记录水位线，中断后再次合并会从断点继续
+        coordinator = MergeCoordinator()
+        for db, path in merge_tasks.items():
+            coordinator.add_database(db, path)
+        if changed is not None:
+            coordinator.keep_sources(changed)
+        return coordinator.run()
@@ -8,7 +8,6 @@
 @File        : MemoTrace-manager_v4.py
 @Description : 
 """
-import concurrent
 import os
 import re
 from concurrent.futures import ProcessPoolExecutor, as_completed, ThreadPoolExecutor
@@ -25,13 +24,14 @@ from wxManager.db_v4.emotion import EmotionDB
 from wxManager.db_v4.media import MediaDB
 from wxManager.db_v4 import ContactDB, HeadImageDB, SessionDB, MessageDB, HardLinkDB
 from wxManager.db_main import DataBaseInterface, Context
+from wxManager.merge_coordinator import MergeCoordinator
 from wxManager.model.contact import Contact, ContactType, Person
 from wxManager.model import Me
 from wxManager.parser.util.protocbuf.roomdata_pb2 import ChatRoomData
 from wxManager.parser.wechat_v4 import FACTORY_REGISTRY, Singleton
+from wxManager.avatar_export import export_avatars
 from wxManager.log import logger
-from wxManager.parser.util.protocbuf import contact_pb2
-from google.protobuf.json_format import MessageToDict
+from wxManager.parser.contact_parser import parse_contact_info, parse_contact_infos
 
 
 def decompress(data):
@@ -74,6 +74,7 @@ class DataBaseV4(DataBaseInterface):
         self.db_dir = ''
         self.chatroom_members_map = {}
         self.contacts_map = {}
+        self.chatroom_name_cache = {}  # 未命名群聊 -> 由群成员拼接出的名字
 
         # V4
         self.contact_db = ContactDB('contact/contact.db')
@@ -90,6 +91,7 @@ class DataBaseV4(DataBaseInterface):
         Me().load_from_json(os.path.join(db_dir, 'info.json'))  # 加载自己的信息
         # print('初始化数据库', db_dir)
         self.db_dir = db_dir
+        self.chatroom_name_cache = {}
         flag = True
         flag &= self.contact_db.init_database(db_dir)
         flag &= self.head_image_db.init_database(db_dir)
@@ -117,6 +119,49 @@ class DataBaseV4(DataBaseInterface):
         """
         return self.session_db.get_session()
 
+    def get_sessions_enriched(self, limit=-1, offset=0, with_avatar=False) -> List[dict]:
+        """
+        侧边栏会话列表，会话、联系人、头像一次查询取出，不再逐个会话查询联系人
+        @param limit: 每页数量，-1 表示不分页
+        @param offset:
+        @param with_avatar: 是否返回头像数据
+        @return:
+        """
+        rows = self.session_db.get_sessions_enriched(
+            os.path.join(self.db_dir, 'contact', 'contact.db'),
+            os.path.join(self.db_dir, 'head_image', 'head_image.db'),
+            limit, offset, with_avatar
+        )
+        sessions = []
+        for row in rows:
+            username, remark, nickname = row[0], row[11] or '', row[12] or ''
+            if not nickname and username.endswith('@chatroom'):
+                nickname = self._get_chatroom_name(username)
+            summary = row[5]
+            if isinstance(summary, bytes):
+                try:
+                    summary = decompress(summary)
+                except zstd.ZstdError:
+                    summary = summary.decode('utf-8', errors='ignore')
+            sessions.append({
+                'username': username,
+                'display_name': remark or nickname or username,
+                'remark': remark,
+                'nickname': nickname,
+                'alias': row[13] or '',
+                'type': row[14] or 0,
+                'unread_count': row[2],
+                'last_timestamp': row[4],
+                'str_time': row[8],
+                'summary': summary or '',
+                'last_msg_type': row[6],
+                'small_head_url': row[15] or '',
+                'big_head_url': row[16] or '',
+                'avatar_md5': row[17] or '',
+                'avatar': row[18],
+            })
+        return sessions
+
     def get_messages(
             self,
             username_: str,
@@ -271,6 +316,9 @@ class DataBaseV4(DataBaseInterface):
     def get_audio(self, reserved0, output_path, open_im=False, filename=''):
         return self.media_db.get_audio(reserved0, output_path, filename)
 
+    def get_audios(self, items, output_path, open_im=False):
+        return self.media_db.get_audios(items, output_path)
+
     def get_media_buffer(self, server_id, is_open_im=False) -> bytes:
         return self.media_db.get_media_buffer(server_id)
 
@@ -294,7 +342,14 @@ class DataBaseV4(DataBaseInterface):
     def get_avatar_buffer(self, username) -> bytes:
         return self.head_image_db.get_avatar_buffer(username)
 
-    def create_contact(self, contact_info_list) -> Person:
+    def export_avatars(self, output_dir, sprite=False) -> dict:
+        return export_avatars(self.head_image_db.iter_avatars(), output_dir, sprite)
+
+    def create_contact(self, contact_info_list, detail=None) -> Person:
+        """
+        @param contact_info_list: ContactDB.get_contacts 的一行
+        @param detail: 已经解析好的 extra_buffer，为空时在这里解析
+        """
         wxid, local_type, flag = contact_info_list[0], contact_info_list[2], contact_info_list[3]
         nickname = contact_info_list[5]
         remark = contact_info_list[4]
@@ -308,12 +363,8 @@ class DataBaseV4(DataBaseInterface):
         region = ('', '', '')
         if not (wxid.endswith('@openim') or wxid.endswith('@chatroom')):
             try:
-                # 创建顶级消息对象
-                message = contact_pb2.ContactInfo()
-                # 解析二进制数据
-                message.ParseFromString(contact_info_list[10])
-                # 转换为 JSON 格式
-                detail = MessageToDict(message)
+                if detail is None:
+                    detail = parse_contact_info(contact_info_list[10])
                 gender_code = detail.get('gender', 0)
                 if gender_code == 1:
                     gender = '男'
@@ -370,11 +421,20 @@ class DataBaseV4(DataBaseInterface):
 
     def get_contacts(self) -> List[Person]:
         contacts = []
-        contact_lists = self.contact_db.get_contacts()
-        for contact_info_list in contact_lists:
-            if contact_info_list:
-                contact = self.create_contact(contact_info_list)
-                contacts.append(contact)
+        contact_lists = [contact_info_list for contact_info_list in self.contact_db.get_contacts() if contact_info_list]
+        # 整张表的 extra_buffer 一次解析完
+        details = parse_contact_infos(contact_info_list[10] for contact_info_list in contact_lists)
+        for contact_info_list, detail in zip(contact_lists, details):
+            contact = self.create_contact(contact_info_list, detail)
+            contacts.append(contact)
+        return contacts
+
+    def get_contacts_with_labels(self, label_names=None) -> List[Person]:
+        # create_contact 中的标签名来自 ContactDB 的标签表缓存
+        contacts = self.get_contacts()
+        if label_names:
+            label_names = set(label_names)
+            return [contact for contact in contacts if label_names.intersection(contact.label_list or ())]
         return contacts
 
     def set_remark(self, username: str, remark) -> bool:
@@ -425,9 +485,12 @@ class DataBaseV4(DataBaseInterface):
         return result
 
     def _get_chatroom_name(self, wxid):
+        if wxid in self.chatroom_name_cache:
+            return self.chatroom_name_cache[wxid]
         chatroom = self.contact_db.get_chatroom_info(wxid)
 
         if chatroom is None:
+            self.chatroom_name_cache[wxid] = ''
             return ''
         # 解析RoomData数据
         parsechatroom = ChatRoomData()
@@ -442,17 +505,20 @@ class DataBaseV4(DataBaseInterface):
             else:
                 contact = self.get_contact_by_username(mem.wxID)
                 chatroom_name += f'{contact.remark}、'
-        return chatroom_name.rstrip('、')
+        chatroom_name = chatroom_name.rstrip('、')
+        self.chatroom_name_cache[wxid] = chatroom_name
+        return chatroom_name
 
     # 联系人结束
 
     def get_favorite_items(self, time_range):
         return self.favorite_db.get_items(time_range)
 
-    def merge(self, db_dir):
+    def merge(self, db_dir, changed=None):
         """
         批量将db_path中的数据合入到数据库中
         @param db_path:
+        @param changed: 只合并这些新数据库文件，None 表示全部
         @return:
         """
         merge_tasks = {
@@ -466,19 +532,10 @@ class DataBaseV4(DataBaseInterface):
             self.session_db: os.path.join(db_dir, 'session', 'session.db'),
         }
 
-        def merge_task(db_instance, db_path):
-            """执行单个数据库的合并任务"""
-            db_instance.merge(db_path)
-
-        # 使用 ThreadPoolExecutor 进行多线程合并
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = {executor.submit(merge_task, db, path): (db, path) for db, path in merge_tasks.items()}
-
-            # 等待所有任务完成
-            for future in concurrent.futures.as_completed(futures):
-                db, path = futures[future]
-                try:
-                    future.result()  # 这里会抛出异常（如果有的话）
-                    print(f"成功合并数据库: {path}")
-                except Exception as e:
-                    print(f"合并 {path} 失败: {e}")
+        # 写入同一个文件的任务串行，不同文件之间并行；每批提交后记录水位线，中断后再次合并会从断点继续
+        coordinator = MergeCoordinator()
+        for db, path in merge_tasks.items():
+            coordinator.add_database(db, path)
+        if changed is not None:
+            coordinator.keep_sources(changed)
+        return coordinator.run()
@@ -1,9 +1,14 @@
 import os
 import sqlite3
 import traceback
+from contextlib import contextmanager
 
 from wxManager.log import logger
 
+# ATTACH 新数据库时使用的别名
+MERGE_SCHEMA = 'merge_src'
+MERGE_CHANGED_TABLE = 'merge_changed'
+
 
 def table_exists(conn, table_name):
     """检查表是否存在"""
@@ -12,175 +17,200 @@ def table_exists(conn, table_name):
     return cursor.fetchone()[0] > 0
 
 
-def get_create_statements(conn, table_name, object_type):
+def table_exists_in(conn, table_name, schema):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT count(*) FROM {schema}.sqlite_master WHERE type='table' AND name=?", (table_name,))
+    return cursor.fetchone()[0] > 0
+
+
+def get_create_statements(conn, table_name, object_type, schema='main'):
     """获取指定表的 CREATE TABLE 或 CREATE INDEX 语句"""
     cursor = conn.cursor()
-    cursor.execute(f"SELECT sql FROM sqlite_master WHERE type='{object_type}' AND tbl_name=?", (table_name,))
+    cursor.execute(f"SELECT sql FROM {schema}.sqlite_master WHERE type=? AND tbl_name=?", (object_type, table_name))
     return [row[0] for row in cursor.fetchall() if row[0]]  # 过滤掉 None 值
 
 
+def get_column_names(conn, table_name, schema='main'):
+    cursor = conn.cursor()
+    cursor.execute(f'PRAGMA {schema}.table_info("{table_name}")')
+    return [info[1] for info in cursor.fetchall()]
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+@contextmanager
+def attach_database(conn, db_path, alias=MERGE_SCHEMA):
+    """
+    把新数据库 ATTACH 到 conn 上，数据直接在 SQLite 内部复制，不经过 Python
+    ATTACH/DETACH 不能在事务中执行，进入前先提交未完成的事务
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('ATTACH DATABASE ? AS ' + alias, (db_path,))
+    try:
+        yield alias
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute('DETACH DATABASE ' + alias)
+
+
+def _prepare_table(conn, table_name, alias):
+    """
+    目标库中没有该表时，从新数据库复制表结构和索引
+    @return: 新数据库中是否有该表
+    """
+    if not table_exists_in(conn, table_name, alias):
+        return False
+    if not table_exists(conn, table_name):
+        # 复制表结构
+        create_table_sql = get_create_statements(conn, table_name, "table", alias)
+        if create_table_sql:
+            conn.execute(create_table_sql[0])  # 执行 CREATE TABLE 语句
+            print(f"表 {table_name} 结构已复制")
+        # 复制索引
+        for create_index_sql in get_create_statements(conn, table_name, "index", alias):
+            conn.execute(create_index_sql)  # 执行 CREATE INDEX 语句
+            print(f"索引已复制: {create_index_sql}")
+        conn.commit()
+    return True
+
+
+def _merge_columns(conn, table_name, alias, col_name, col_index, exclude_columns):
+    """
+    两个库中都有的列（去掉 exclude_columns），以及用于判断是否为新数据的列
+    """
+    new_columns = set(get_column_names(conn, table_name, alias))
+    column_names = [name for name in get_column_names(conn, table_name)
+                    if name not in exclude_columns and name in new_columns]
+    if col_name not in column_names:
+        if 0 <= col_index < len(column_names):
+            col_name = column_names[col_index]
+        else:
+            print(f"错误: 列 {col_name} 在表 {table_name} 中不存在")
+            return [], ''
+    return column_names, col_name
+
+
 def increase_data(db_path, src_cursor, src_conn, table_name, col_name, col_index=-1, exclude_column=''):
     """
     将db_path数据库的内容增量写入connect数据库中
+    新数据库 ATTACH 后用 INSERT ... SELECT ... WHERE NOT IN 在一个事务中完成，内存占用与表大小无关
     @param db_path: 新的数据库路径
     @param src_cursor: 待写入数据库游标
     @param src_conn: 待写入数据库连接
     @param table_name: 待写入的表名
     @param col_name: 根据该列进行判断是否是新增数据
-    @param col_index: 待写入的列号
+    @param col_index: 待写入的列号，col_name 不存在时使用
     @param exclude_column: 是否不考虑某一列（针对某一列是自增ID的表）
-    @return:
+    @return: 插入的行数
     """
     if not (os.path.exists(db_path) or os.path.isfile(db_path)):
         print(f'{db_path} 不存在')
-        return
+        return 0
     if not src_cursor or not src_conn:
         print(f'{db_path} 数据库连接无效，增量解析失败')
-        return
-    tgt_conn = sqlite3.connect(db_path)
-    tgt_cur = tgt_conn.cursor()
-
+        return 0
     try:
-        if not table_exists(src_conn, table_name):
-            # 复制表结构
-            create_table_sql = get_create_statements(tgt_conn, table_name, "table")
-            if create_table_sql:
-                src_conn.execute(create_table_sql[0])  # 执行 CREATE TABLE 语句
-                print(f"表 {table_name} 结构已复制")
-
-            # 复制索引
-            create_index_sql_list = get_create_statements(tgt_conn, table_name, "index")
-            for create_index_sql in create_index_sql_list:
-                src_conn.execute(create_index_sql)  # 执行 CREATE INDEX 语句
-                print(f"索引已复制: {create_index_sql}")
-        # 获取列名
-        src_cursor.execute(f"PRAGMA table_info({table_name})")
-        columns_info = src_cursor.fetchall()
-        column_names = [info[1] for info in columns_info]
-        if columns_info and exclude_column:
-            try:
-                exclude_col_index = column_names.index(exclude_column)
-            except ValueError:
-                print(f"错误: 列 {exclude_column} 在表 {table_name} 中不存在")
-                return
-            column_names = column_names[:exclude_col_index]+column_names[exclude_col_index+1:]
-        num_columns = len(column_names)
-        if col_index == -1:
-            try:
-                col_index = column_names.index(col_name)
-            except ValueError:
-                print(f"错误: 列 {col_name} 在表 {table_name} 中不存在")
-                return
-        # 从数据库B中选择主键不在数据库A中的行
-        query = f"""
-           SELECT {', '.join(column_names)}
-           FROM {table_name} 
-        """
-        tgt_cur.execute(query)
-        target_rows = tgt_cur.fetchall()
-        query = f'''
-        SELECT {col_name}
-        FROM {table_name}
-        '''
-        src_cursor.execute(query)
-        source_rows = src_cursor.fetchall()
-
-        source_rows = {r[0] for r in source_rows}
-        rows_to_insert = [row for row in target_rows if row[col_index] not in source_rows]
-        if rows_to_insert:
-            insert_query = f"""
-                INSERT INTO {table_name} ({', '.join(column_names)})
-                VALUES ({', '.join(['?'] * num_columns)})
-            """
-            src_cursor.executemany(insert_query, rows_to_insert)
+        with attach_database(src_conn, db_path) as alias:
+            if not _prepare_table(src_conn, table_name, alias):
+                return 0
+            exclude_columns = {exclude_column} if exclude_column else set()
+            column_names, col_name = _merge_columns(src_conn, table_name, alias, col_name, col_index, exclude_columns)
+            if not column_names:
+                return 0
+            columns = ', '.join(quote(name) for name in column_names)
+            table, key = quote(table_name), quote(col_name)
+            # 非相关子查询的 NOT IN 只会对目标表的 key 建一次临时 B 树（有索引时直接用索引），
+            # 相关子查询 NOT EXISTS 在没有索引时会退化为 O(n*m)；NULL 单独处理，与原来的 Python 集合语义一致
+            cursor = src_conn.execute(f"""
+                INSERT INTO main.{table} ({columns})
+                SELECT {columns}
+                FROM {alias}.{table}
+                WHERE {key} NOT IN (SELECT {key} FROM main.{table} WHERE {key} IS NOT NULL)
+                   OR ({key} IS NULL AND NOT EXISTS (SELECT 1 FROM main.{table} WHERE {key} IS NULL))
+            """)
+            inserted = cursor.rowcount
             src_conn.commit()
-            print(f"{len(rows_to_insert)} 行已插入到 {table_name} 表中")
-        else:
-            pass
-            # print(f"没有需要插入的数据，{table_name} 表已是最新")
+            if inserted > 0:
+                print(f"{inserted} 行已插入到 {table_name} 表中")
+            return inserted
     except sqlite3.Error as e:
         print(f"{db_path} 数据库操作错误: {e}")
-    finally:
-        tgt_cur.close()
-        tgt_conn.close()
+        return 0
 
 
 def increase_update_data(db_path, src_cur, src_conn, table_name, col_name, col_index=-1, exclude_first_column=False):
     """
     将 db_path 数据库的内容增量写入 src_conn 连接的数据库，如果有冲突则删除旧数据并更新
+    新数据库 ATTACH 后用 EXCEPT 找出变化的行，在一个事务中先删后插
     :param db_path: 目标数据库文件路径
     :param src_cur: 源数据库游标
     :param src_conn: 源数据库连接
     :param table_name: 需要同步的表名
     :param col_name: 用于匹配的列名
-    :param col_index: 指定列的索引（默认为 -1，即自动检测）
+    :param col_index: 指定列的索引，col_name 不存在时使用
     :param exclude_first_column: 是否排除第一列
+    :return: 更新的行数
     """
     if not (os.path.exists(db_path) or os.path.isfile(db_path)):
         print(f'{db_path} 不存在')
-        return
-
-    tgt_conn = sqlite3.connect(db_path)
-    tgt_cur = tgt_conn.cursor()
+        return 0
     try:
-        if not table_exists(tgt_conn, table_name):
-            # 复制表结构
-            create_table_sql = get_create_statements(src_conn, table_name, "table")
-            if create_table_sql:
-                tgt_conn.execute(create_table_sql[0])  # 执行 CREATE TABLE 语句
-                print(f"表 {table_name} 结构已复制")
-
-            # 复制索引
-            create_index_sql_list = get_create_statements(src_conn, table_name, "index")
-            for create_index_sql in create_index_sql_list:
-                tgt_conn.execute(create_index_sql)  # 执行 CREATE INDEX 语句
-                print(f"索引已复制: {create_index_sql}")
-
-        # 获取列名
-        src_cur.execute(f"PRAGMA table_info({table_name})")
-        columns_info = src_cur.fetchall()
-        if exclude_first_column:
-            columns_info = columns_info[1:]
-
-        column_names = [info[1] for info in columns_info]
-        num_columns = len(column_names)
-
-        if col_index == -1:
-            try:
-                col_index = column_names.index(col_name)
-            except ValueError:
-                print(f"错误: 列 {col_name} 在 {table_name} 表中不存在。")
-                return
-
-        # 查询目标数据库的数据
-        query = f"SELECT {', '.join(column_names)} FROM {table_name}"
-        tgt_cur.execute(query)
-        source_rows = set(tgt_cur.fetchall())  # 使用 set() 加速查询
-
-        # 查询源数据库已有的数据
-        src_cur.execute(query)
-        existing_rows = set(src_cur.fetchall())
-
-        # 需要删除并重新插入的行
-        rows_to_insert = [row for row in source_rows if row not in existing_rows]
-
-        if rows_to_insert:
-            delete_query = f"DELETE FROM {table_name} WHERE {col_name} = ?"
-            src_cur.executemany(delete_query, [(row[col_index],) for row in rows_to_insert])
-            src_conn.commit()
-
-            insert_query = f"INSERT INTO {table_name} ({', '.join(column_names)}) VALUES ({', '.join(['?'] * num_columns)})"
-            src_cur.executemany(insert_query, rows_to_insert)
+        with attach_database(src_conn, db_path) as alias:
+            if not _prepare_table(src_conn, table_name, alias):
+                return 0
+            exclude_columns = set(get_column_names(src_conn, table_name)[:1]) if exclude_first_column else set()
+            column_names, col_name = _merge_columns(src_conn, table_name, alias, col_name, col_index, exclude_columns)
+            if not column_names:
+                return 0
+            columns = ', '.join(quote(name) for name in column_names)
+            table, key = quote(table_name), quote(col_name)
+            # 新库中与旧库不完全相同的行，暂存在临时表中（temp_store 决定放在内存还是磁盘）
+            src_conn.execute(f"DROP TABLE IF EXISTS temp.{MERGE_CHANGED_TABLE}")
+            src_conn.execute(f"""
+                CREATE TEMP TABLE {MERGE_CHANGED_TABLE} AS
+                SELECT {columns} FROM {alias}.{table}
+                EXCEPT
+                SELECT {columns} FROM main.{table}
+            """)
+            src_conn.execute(f"""
+                DELETE FROM main.{table}
+                WHERE {key} IN (SELECT {key} FROM temp.{MERGE_CHANGED_TABLE})
+            """)
+            cursor = src_conn.execute(f"""
+                INSERT INTO main.{table} ({columns})
+                SELECT {columns} FROM temp.{MERGE_CHANGED_TABLE}
+            """)
+            updated = cursor.rowcount
             src_conn.commit()
-            print(f"{len(rows_to_insert)} 行已更新到 {table_name} 表中。")
-        else:
-            pass
-            # print(f"没有需要插入的数据，{table_name} 表已是最新。")
+            src_conn.execute(f"DROP TABLE IF EXISTS temp.{MERGE_CHANGED_TABLE}")
+            if updated > 0:
+                print(f"{updated} 行已更新到 {table_name} 表中。")
+            return updated
     except sqlite3.Error as e:
         print(f"{db_path} 数据库操作错误: {e}")
-    finally:
-        tgt_cur.close()
-        tgt_conn.close()
+        return 0
+
+
+def merge_tables(db_path, conn, tables) -> dict:
+    """
+    按顺序合并多张表，返回每张表新增/更新的行数
+    @param db_path: 新的数据库路径
+    @param conn: 待写入数据库连接
+    @param tables: [(表名, 判断列名, 是否更新已有行)]
+    @return: {表名: 行数}
+    """
+    counts = {}
+    cursor = conn.cursor()
+    for table_name, col_name, update in tables:
+        if update:
+            counts[table_name] = increase_update_data(db_path, cursor, conn, table_name, col_name)
+        else:
+            counts[table_name] = increase_data(db_path, cursor, conn, table_name, col_name)
+    return counts
 
 
 if __name__ == "__main__":
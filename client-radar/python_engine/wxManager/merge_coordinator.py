@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 19:10
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-merge_coordinator.py
+@Description : 可断点续传的多数据库增量合并
+
+每个输出数据库中有一张 merge_checkpoint 表，按 (新数据库文件名, 表名) 记录已经合并到的位置：
+    - 水位线是新数据库中该表的 rowid。MSG 的 localId、Msg_xxx 的 local_id 都是 rowid 的别名，按插入顺序递增；
+      server_id/MsgSvrID 是随机数，CreateTime 也会因为补拉历史消息而乱序，都不能作为水位线，只用来去重
+    - 每批最多 batch_size 行，插入数据和更新水位线在同一个事务里提交，中途崩溃后从最后一次提交的位置继续
+    - 同时记录水位线那一行的去重列的值，新数据库被重建（rowid 重新开始）时对不上就从头按去重列合并
+    - 需要更新已有行的小表（DBInfo、TimeStamp、联系人等）仍然整表比较，不记录水位线
+写入同一个输出文件的任务串行执行，不同输出文件（MSG0、MSG1……）之间并行
+"""
+import os
+import shutil
+import sqlite3
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List
+
+from wxManager.log import logger
+from wxManager.merge import (attach_database, _prepare_table, _merge_columns, quote, get_create_statements,
+                             increase_update_data)
+
+CHECKPOINT_TABLE = 'merge_checkpoint'
+DEFAULT_BATCH_SIZE = 20000
+
+
+class MergeTable:
+    def __init__(self, table_name, col_name, update=False, exclude_column='', col_index=-1):
+        """
+        @param table_name: 表名
+        @param col_name: 去重（或更新时匹配）的列
+        @param update: 是否用新数据覆盖已有行
+        @param exclude_column: 不复制的列（自增 ID）
+        @param col_index: col_name 不存在时使用的列号
+        """
+        self.table_name = table_name
+        self.col_name = col_name
+        self.update = update
+        self.exclude_column = exclude_column
+        self.col_index = col_index
+
+
+def ensure_checkpoint_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+            source TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            col_name TEXT,
+            watermark INTEGER NOT NULL DEFAULT 0,
+            watermark_key,
+            rows INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER,
+            PRIMARY KEY (source, table_name)
+        )
+    """)
+    conn.commit()
+
+
+def load_checkpoint(conn, source, table_name):
+    """
+    @return: (水位线, 水位线那一行的去重列的值, 已合并的行数)
+    """
+    row = conn.execute(
+        f"SELECT watermark, watermark_key, rows FROM {CHECKPOINT_TABLE} WHERE source=? AND table_name=?",
+        (source, table_name)
+    ).fetchone()
+    return row if row else (0, None, 0)
+
+
+def save_checkpoint(conn, source, table_name, col_name, watermark, watermark_key, rows):
+    """不提交，由调用方和本批数据一起提交"""
+    conn.execute(
+        f"INSERT OR REPLACE INTO {CHECKPOINT_TABLE} "
+        f"(source, table_name, col_name, watermark, watermark_key, rows, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (source, table_name, col_name, watermark, watermark_key, rows, int(time.time()))
+    )
+
+
+def reset_checkpoint(conn, source=None):
+    """删除水位线，下次合并时从头开始"""
+    if source is None:
+        conn.execute(f"DELETE FROM {CHECKPOINT_TABLE}")
+    else:
+        conn.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE source=?", (source,))
+    conn.commit()
+
+
+def _has_rowid(conn, table_name, alias):
+    create_sql = get_create_statements(conn, table_name, 'table', alias)
+    return bool(create_sql) and 'WITHOUT ROWID' not in create_sql[0].upper()
+
+
+def _ensure_key_index(conn, table_name, col_name):
+    """
+    分批去重时每批都要查一次目标表的去重列，没有以该列开头的索引时建一个
+    """
+    table = quote(table_name)
+    for index in conn.execute(f'PRAGMA main.index_list({table})').fetchall():
+        columns = conn.execute(f'PRAGMA main.index_info({quote(index[1])})').fetchall()
+        if columns and columns[0][2] == col_name:
+            return
+    index_name = quote(f'merge_{table_name}_{col_name}')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({quote(col_name)})')
+    conn.commit()
+
+
+def _insert_sql(alias, table, columns, key, rowid_range=False):
+    if not rowid_range:
+        # 没有索引时用非相关子查询，NULL 单独处理，与 merge.increase_data 的语义一致
+        where = f"""
+            {key} NOT IN (SELECT {key} FROM main.{table} WHERE {key} IS NOT NULL)
+            OR ({key} IS NULL AND NOT EXISTS (SELECT 1 FROM main.{table} WHERE {key} IS NULL))
+        """
+    else:
+        # 去重列上有索引，每行只做一次索引查找，不必每批都把目标表的整列读一遍
+        where = f"""
+            n.rowid > ? AND n.rowid <= ?
+            AND NOT EXISTS (SELECT 1 FROM main.{table} AS o WHERE o.{key} IS n.{key})
+        """
+    return f"""
+        INSERT INTO main.{table} ({columns})
+        SELECT {columns} FROM {alias}.{table} AS n
+        WHERE {where}
+    """
+
+
+def merge_table(conn, source_path, table: MergeTable, batch_size=DEFAULT_BATCH_SIZE, source=None) -> int:
+    """
+    按水位线分批把 source_path 中的一张表合并到 conn
+    @param conn: 输出数据库连接
+    @param source_path: 新数据库路径
+    @param table: 要合并的表
+    @param batch_size: 每次提交的行数
+    @param source: 水位线中记录的新数据库名，默认为文件名
+    @return: 新增（或更新）的行数
+    """
+    if table.update:
+        return increase_update_data(source_path, conn.cursor(), conn, table.table_name, table.col_name,
+                                    table.col_index)
+    source = source or os.path.basename(source_path)
+    inserted = 0
+    try:
+        with attach_database(conn, source_path) as alias:
+            if not _prepare_table(conn, table.table_name, alias):
+                return 0
+            exclude_columns = {table.exclude_column} if table.exclude_column else set()
+            column_names, col_name = _merge_columns(conn, table.table_name, alias, table.col_name, table.col_index,
+                                                    exclude_columns)
+            if not column_names:
+                return 0
+            columns = ', '.join(quote(name) for name in column_names)
+            name, key = quote(table.table_name), quote(col_name)
+            if not _has_rowid(conn, table.table_name, alias):
+                # WITHOUT ROWID 的表没有水位线，整表去重
+                inserted = conn.execute(_insert_sql(alias, name, columns, key)).rowcount
+                conn.commit()
+                return inserted
+            _ensure_key_index(conn, table.table_name, col_name)
+
+            watermark, watermark_key, rows = load_checkpoint(conn, source, table.table_name)
+            if watermark:
+                row = conn.execute(f'SELECT {key} FROM {alias}.{name} WHERE rowid=?', (watermark,)).fetchone()
+                if row is None or row[0] != watermark_key:
+                    # 新数据库被重建过，水位线失效，从头按去重列合并
+                    logger.info(f'{source} {table.table_name} 水位线失效，重新合并')
+                    watermark, rows = 0, 0
+            sql = _insert_sql(alias, name, columns, key, rowid_range=True)
+            while True:
+                # 下一批的上界：水位线之后第 batch_size 行的 rowid，rowid 不连续也不会空转
+                upper = conn.execute(
+                    f'SELECT rowid, {key} FROM {alias}.{name} WHERE rowid > ? ORDER BY rowid LIMIT 1 OFFSET ?',
+                    (watermark, batch_size - 1)
+                ).fetchone()
+                if upper is None:
+                    upper = conn.execute(
+                        f'SELECT rowid, {key} FROM {alias}.{name} WHERE rowid > ? ORDER BY rowid DESC LIMIT 1',
+                        (watermark,)
+                    ).fetchone()
+                    if upper is None:
+                        break
+                count = conn.execute(sql, (watermark, upper[0])).rowcount
+                watermark = upper[0]
+                inserted += count
+                rows += count
+                save_checkpoint(conn, source, table.table_name, col_name, watermark, upper[1], rows)
+                conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"{source_path} {table.table_name} 数据库操作错误: {e}")
+    if inserted > 0:
+        logger.info(f"{inserted} 行已插入到 {table.table_name} 表中")
+    return inserted
+
+
+class MergeTask:
+    def __init__(self, conn, output_path, source_path, tables: List[MergeTable]):
+        """
+        把 source_path 中的若干张表合并到一个输出数据库
+        @param conn: 输出数据库连接，为 None 时输出数据库还不存在，直接复制新数据库
+        @param output_path: 输出数据库路径，同一个输出文件的任务串行执行
+        @param source_path: 新数据库路径
+        @param tables: 按顺序合并的表
+        """
+        self.conn = conn
+        self.output_path = output_path
+        self.source_path = source_path
+        self.tables = tables
+
+    def run(self, batch_size=DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+        if self.conn is None:
+            if not os.path.exists(self.output_path):
+                os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+                # 先复制到临时文件再改名，中断时不会留下不完整的数据库
+                tmp_path = self.output_path + '.merging'
+                shutil.copy(self.source_path, tmp_path)
+                os.replace(tmp_path, self.output_path)
+            return {}
+        ensure_checkpoint_table(self.conn)
+        counts = {}
+        for table in self.tables:
+            counts[table.table_name] = merge_table(self.conn, self.source_path, table, batch_size)
+        return counts
+
+
+class CallableTask:
+    def __init__(self, output_path, func: Callable, source_path):
+        """
+        没有实现 merge_tasks 的数据库，直接调用它的 merge
+        @param output_path: 用于分组的输出标识
+        """
+        self.output_path = output_path
+        self.func = func
+        self.source_path = source_path
+
+    def run(self, batch_size=DEFAULT_BATCH_SIZE):
+        return self.func(self.source_path)
+
+
+def series_tasks(db, db_file_name, sub_dir, tables) -> List[MergeTask]:
+    """
+    为 MSG0、MSG1…… 这类分片数据库生成合并任务，每个分片写入本地对应的分片，本地没有的分片直接复制
+    @param db: is_series 的 DataBaseBase
+    @param db_file_name: 新数据库第一个分片的路径，如 xxx/Multi/MSG0.db
+    @param sub_dir: 分片在本地数据库目录中的子目录
+    @param tables: List[MergeTable]，或根据新数据库路径返回 List[MergeTable] 的函数
+    @return:
+    """
+    dir_name, base_name = os.path.split(db_file_name)
+    local_names = db.db_file_name if db.is_series and db.DB is not None else []
+    tasks = []
+    for i in range(100):
+        file_name = base_name.replace('0', f'{i}')
+        db_path = os.path.join(dir_name, file_name)
+        if not os.path.exists(db_path):
+            continue
+        output_path = os.path.join(db.db_dir, sub_dir, file_name)
+        if file_name in local_names:
+            conn = db.DB[local_names.index(file_name)]
+            tasks.append(MergeTask(conn, output_path, db_path, tables(db_path) if callable(tables) else tables))
+        else:
+            tasks.append(MergeTask(None, output_path, db_path, []))
+    return tasks
+
+
+class MergeCoordinator:
+    """
+    使用示例：
+    coordinator = MergeCoordinator()
+    coordinator.add_database(msg_db, 'xxx/Multi/MSG0.db')
+    coordinator.add_database(misc_db, 'xxx/Misc.db')
+    coordinator.run()
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, max_workers=None):
+        """
+        @param batch_size: 每次提交的行数
+        @param max_workers: 并行合并的输出文件数，默认为 cpu 核数
+        """
+        self.batch_size = batch_size
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.groups: Dict[str, list] = {}
+
+    def add_task(self, task):
+        key = os.path.normcase(os.path.abspath(task.output_path))
+        self.groups.setdefault(key, []).append(task)
+        return self
+
+    def add_tasks(self, tasks):
+        for task in tasks:
+            self.add_task(task)
+        return self
+
+    def add_database(self, db, db_path):
+        """
+        @param db: DataBaseBase，实现了 merge_tasks 时按分片和表拆分，否则整体调用 db.merge
+        @param db_path: 新数据库路径
+        """
+        tasks = db.merge_tasks(db_path)
+        if tasks is None:
+            output_path = os.path.join(db.db_dir, f'<{type(db).__name__}:{id(db)}>')
+            return self.add_task(CallableTask(output_path, db.merge, db_path))
+        return self.add_tasks(tasks)
+
+    def keep_sources(self, source_paths):
+        """
+        只保留新数据库在 source_paths 中的任务，文件监控增量同步时只合并变化了的文件
+        @param source_paths: 新数据库路径
+        """
+        keep = {os.path.normcase(os.path.abspath(path)) for path in source_paths}
+        for key in list(self.groups):
+            tasks = [task for task in self.groups[key]
+                     if os.path.normcase(os.path.abspath(task.source_path)) in keep]
+            if tasks:
+                self.groups[key] = tasks
+            else:
+                del self.groups[key]
+        return self
+
+    def _run_group(self, tasks):
+        results = {}
+        for task in tasks:
+            try:
+                results[task.source_path] = task.run(self.batch_size)
+            except Exception:
+                # 已提交的批次和水位线保留，下次从断点继续
+                logger.error(f'合并 {task.source_path} 失败\n{traceback.format_exc()}')
+                results[task.source_path] = None
+        return results
+
+    def run(self) -> Dict[str, dict]:
+        """
+        @return: {输出文件: {新数据库路径: {表名: 行数}}}，失败的新数据库对应 None
+        """
+        groups, self.groups = self.groups, {}
+        results = {}
+
+        def done(key, result):
+            results[key] = result
+            if all(value is not None for value in result.values()):
+                logger.info(f"成功合并数据库: {key}")
+            else:
+                logger.error(f"合并 {key} 失败")
+
+        if len(groups) <= 1 or self.max_workers == 1:
+            for key, tasks in groups.items():
+                done(key, self._run_group(tasks))
+            return results
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(groups))) as executor:
+            futures = {executor.submit(self._run_group, tasks): key for key, tasks in groups.items()}
+            for future in as_completed(futures):
+                done(futures[future], future.result())
+        return results
+
+
+if __name__ == '__main__':
+    pass
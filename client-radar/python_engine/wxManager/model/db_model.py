@@ -8,49 +8,333 @@
 @File        : MemoTrace-db_model.py 
 @Description : 
 """
+import atexit
 import os
 import sqlite3
+import threading
 import traceback
+import weakref
+from collections.abc import Sequence
+from urllib.request import pathname2url
+
+from wxManager.log import logger
+
+# 每个连接的内存映射上限，只占用虚拟地址空间，读取时省掉一次内核到用户态的拷贝
+MMAP_SIZE = 256 * 1024 * 1024
+# 页缓存大小，负数表示 KiB；连接数为 线程数 x 分片数，不宜太大
+CACHE_SIZE_KIB = 16 * 1024
+# 写连接遇到其他连接持有写锁时等待的秒数
+BUSY_TIMEOUT = 30
+
+
+class MemoryDatabase:
+    """
+    只存在于内存中的明文数据库，由 decrypt/memory.py 解密得到，用 register_memory_database 挂到原来的路径上
+        - 数据在内存中：sqlite3 deserialize 之后 backup 到命名的 memdb，各线程的连接共享同一份内存
+        - 数据较大时：解密到临时文件，连接通过 mmap 读取，close() 时删除（Windows 上还有连接打开着时稍后再删）
+    在内存中的修改（建索引、合并）关闭后丢失
+    """
+    _count = 0
+    _count_lock = threading.Lock()
+
+    def __init__(self, data: bytes = None, temp_path=None):
+        """
+        @param data: 明文数据库的完整内容
+        @param temp_path: 明文临时文件，data 为 None 时使用
+        """
+        self.temp_path = temp_path
+        self._anchor = None
+        if data is not None:
+            with MemoryDatabase._count_lock:
+                MemoryDatabase._count += 1
+                self.name = f'/wxmanager-{os.getpid()}-{MemoryDatabase._count}'
+            # memdb 在最后一个连接关闭时释放，_anchor 保证 close() 之前一直有一个连接
+            self._anchor = sqlite3.connect(self.uri(), uri=True, check_same_thread=False)
+            loader = sqlite3.connect(':memory:')
+            try:
+                loader.deserialize(data)
+                loader.backup(self._anchor)
+            finally:
+                loader.close()
+
+    def uri(self, readonly=False) -> str:
+        if self.temp_path is not None:
+            uri = 'file:' + pathname2url(os.path.abspath(self.temp_path))
+            return uri + '?mode=ro' if readonly else uri
+        return f'file:{self.name}?vfs=memdb'
+
+    def close(self):
+        if self._anchor is not None:
+            _close_connection(self._anchor)
+            self._anchor = None
+        if self.temp_path is not None:
+            _pending_removal.add(self.temp_path)
+        _remove_temp_files()
+
+
+# 绝对路径 -> MemoryDatabase
+_memory_databases = {}
+# 所有连接池，替换或注销内存数据库时先关闭这个路径上的连接
+_pools = weakref.WeakSet()
+# 还没删掉的明文临时文件
+_pending_removal = set()
+
+
+def _remove_temp_files():
+    """删除明文临时文件；Windows 上还有连接（例如 ATTACH）打开着时删不掉，下次释放内存数据库或进程退出时再删"""
+    for path in list(_pending_removal):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.info(f'{path} 还有连接打开着，稍后删除: {e}')
+            continue
+        _pending_removal.discard(path)
+
+
+def _close_pools(db_path):
+    db_path = os.path.abspath(db_path)
+    for pool in list(_pools):
+        if os.path.abspath(pool.db_path) == db_path:
+            pool.close()
+
+
+@atexit.register
+def _release_at_exit():
+    if not _pending_removal and not _memory_databases:
+        return
+    for pool in list(_pools):
+        pool.close()
+    for database in list(_memory_databases.values()):
+        database.close()
+    _memory_databases.clear()
+    _remove_temp_files()
+    for path in _pending_removal:
+        logger.error(f'明文临时文件 {path} 删除失败，请手动删除')
+
+
+def register_memory_database(db_path, database: MemoryDatabase):
+    """
+    之后 DataBaseBase.init_database、connect、attach 遇到 db_path 时改用内存中的数据库，磁盘上可以没有这个文件
+    @param db_path: 数据库原本的路径，例如 <db_dir>/contact/contact.db
+    @param database:
+    @return:
+    """
+    old = _memory_databases.get(os.path.abspath(db_path))
+    _memory_databases[os.path.abspath(db_path)] = database
+    if old is not None and old is not database:
+        # 连接池下次使用时打开新的数据库
+        _close_pools(db_path)
+        old.close()
+
+
+def unregister_memory_database(db_path):
+    database = _memory_databases.pop(os.path.abspath(db_path), None)
+    if database is not None:
+        _close_pools(db_path)
+        database.close()
+
+
+def memory_database(db_path) -> MemoryDatabase | None:
+    return _memory_databases.get(os.path.abspath(db_path)) if db_path else None
+
+
+def database_exists(db_path) -> bool:
+    """磁盘上存在这个文件，或者已经注册为内存数据库"""
+    return bool(db_path) and (memory_database(db_path) is not None or os.path.isfile(db_path))
+
+
+def _uri(db_path, readonly):
+    database = memory_database(db_path)
+    if database is not None:
+        return database.uri(readonly)
+    uri = 'file:' + pathname2url(os.path.abspath(db_path))
+    return uri + '?mode=ro' if readonly else uri
+
+
+def connect(db_path, readonly=False):
+    """
+    打开数据库连接并设置读取相关的 PRAGMA
+    @param db_path: 数据库路径，已经注册为内存数据库时打开内存中的数据库
+    @param readonly: 是否以 file:...?mode=ro 只读打开
+    @return:
+    """
+    uri = _uri(db_path, readonly)
+    # 连接只在一个线程中使用，但需要能在其他线程中关闭（close、线程退出后的清理）
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=BUSY_TIMEOUT)
+    conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size={-CACHE_SIZE_KIB}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    if readonly:
+        conn.execute('PRAGMA query_only=1')
+    return conn
+
+
+def attach(conn, alias, db_path, readonly=True) -> bool:
+    """
+    把另一个数据库以 alias ATTACH 到 conn 上，已经 ATTACH 过时直接返回；连接关闭后自动失效
+    @param conn: 一般为 DataBaseBase.reader() 返回的当前线程连接
+    @param alias: schema 名
+    @param db_path: 数据库路径
+    @param readonly: 是否只读打开
+    @return: 是否可用
+    """
+    if alias in {row[1] for row in conn.execute('PRAGMA database_list').fetchall()}:
+        return True
+    if not database_exists(db_path):
+        return False
+    conn.execute(f'ATTACH DATABASE ? AS {alias}', (_uri(db_path, readonly),))
+    return True
+
+
+def _close_connection(conn):
+    try:
+        conn.close()
+    except sqlite3.Error:
+        print(traceback.format_exc())
+
+
+class ConnectionPool:
+    """
+    一个数据库文件的按线程连接：每个线程第一次使用时打开自己的连接，之后一直复用
+    线程退出后它的连接在下一次打开新连接时关闭，close() 关闭全部连接
+    """
+
+    def __init__(self, db_path, readonly=False):
+        self.db_path = db_path
+        self.readonly = readonly
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}  # 线程 -> (代数, 连接, 游标)
+        self._generation = 0  # close() 之后各线程缓存的连接失效
+        _pools.add(self)
+
+    def _entry(self):
+        entry = getattr(self._local, 'entry', None)
+        if entry is not None and entry[0] == self._generation:
+            return entry
+        thread = threading.current_thread()
+        with self._lock:
+            self._prune()
+            conn = connect(self.db_path, self.readonly)
+            entry = (self._generation, conn, conn.cursor())
+            self._connections[thread] = entry
+        self._local.entry = entry
+        return entry
+
+    def _prune(self):
+        for thread in [thread for thread in self._connections if not thread.is_alive()]:
+            _close_connection(self._connections.pop(thread)[1])
+
+    def connection(self) -> sqlite3.Connection:
+        return self._entry()[1]
+
+    def cursor(self) -> sqlite3.Cursor:
+        return self._entry()[2]
+
+    def opened(self) -> bool:
+        """当前线程是否已经打开过连接"""
+        entry = getattr(self._local, 'entry', None)
+        return entry is not None and entry[0] == self._generation
+
+    def commit(self):
+        if self.opened():
+            self.connection().commit()
+
+    def release(self):
+        """关闭当前线程的连接"""
+        with self._lock:
+            entry = self._connections.pop(threading.current_thread(), None)
+        self._local.entry = None
+        if entry is not None:
+            _close_connection(entry[1])
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, {}
+            self._generation += 1
+        for _, conn, _ in connections.values():
+            _close_connection(conn)
+
+
+class LazyShards(Sequence):
+    """MSG0、MSG1…… 的连接（或游标）列表，访问某个分片时才打开当前线程的连接"""
+
+    def __init__(self, pools, attr='connection'):
+        self._pools = pools
+        self._attr = attr
+
+    def __len__(self):
+        return len(self._pools)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [getattr(pool, self._attr)() for pool in self._pools[index]]
+        return getattr(self._pools[index], self._attr)()
 
 
 class DataBaseBase:
     def __init__(self, db_file_name, is_series=False):
-        self.DB = None
-        self.cursor = None
         self.open_flag = False
         self.db_file_name = db_file_name
         self.is_series = is_series  # 是否是一系列数据库，例如MSG0、MSG1、MSG2······
         self.db_dir = ''
+        # 读写连接（self.DB、self.cursor）和只读连接（self.readers()）都按线程、按分片在第一次使用时打开
+        self.pools = None
+        self.reader_pools = None
+
+    @property
+    def DB(self):
+        """当前线程的读写连接，分片数据库为连接列表"""
+        if self.pools is None:
+            return None
+        if self.is_series:
+            return LazyShards(self.pools, 'connection')
+        return self.pools[0].connection()
+
+    @property
+    def cursor(self):
+        """当前线程的游标，分片数据库为游标列表"""
+        if self.pools is None:
+            return None
+        if self.is_series:
+            return LazyShards(self.pools, 'cursor')
+        return self.pools[0].cursor()
+
+    def readers(self):
+        """
+        当前线程的只读连接，每个分片一个；并发查询时每个线程使用自己的连接，互不影响
+        @return: List[sqlite3.Connection]
+        """
+        return [pool.connection() for pool in self.reader_pools or []]
+
+    def reader(self, index=0):
+        return self.reader_pools[index].connection()
 
     def init_database(self, db_dir=''):
         self.db_dir = db_dir
         if not os.path.exists(db_dir):
             return False
         db_path = os.path.join(db_dir, self.db_file_name)
-        if not os.path.exists(db_path) and self.db_file_name != 'Audio2Text.db':
+        if not database_exists(db_path) and self.db_file_name != 'Audio2Text.db':
             return False
+        self.close()
         db_file_name = self.db_file_name
+        db_paths = []
         if self.is_series:
             self.db_file_name = []
-            self.DB = []
-            self.cursor = []
             for i in range(100):
                 new_file_name = db_file_name.replace('0', f'{i}')
                 db_path = os.path.join(db_dir, new_file_name)
-                if os.path.exists(db_path):
+                if database_exists(db_path):
                     self.db_file_name.append(os.path.basename(new_file_name))
-                    # print('初始化数据库：', db_path)
-                    DB = sqlite3.connect(db_path, check_same_thread=False)
-                    cursor = DB.cursor()
-                    self.DB.append(DB)
-                    self.cursor.append(cursor)
-                    self.open_flag = True
+                    db_paths.append(db_path)
         else:
-            self.DB = sqlite3.connect(db_path, check_same_thread=False)
-            # '''创建游标'''
-            self.cursor = self.DB.cursor()
-            self.open_flag = True
-        # print('初始化数据库完成：', db_path)
+            db_paths.append(db_path)
+        # 只记录路径，连接在第一次使用时才打开
+        self.pools = [ConnectionPool(path) for path in db_paths]
+        self.reader_pools = [ConnectionPool(path, readonly=True) for path in db_paths]
+        self.open_flag = True
         self.self_init()
         return True
 
@@ -58,33 +342,30 @@ class DataBaseBase:
         pass
 
     def commit(self):
-        if self.is_series:
-            for db in self.DB:
-                db.commit()
-        else:
-            self.DB.commit()
+        for pool in self.pools or []:
+            pool.commit()
 
     def execute(self, sql, args):
         self.cursor.execute(sql, args)
 
     def close(self):
+        """关闭所有线程的读写连接和只读连接"""
         if self.open_flag:
-            try:
-                self.open_flag = False
-                if self.is_series:
-                    for db in self.DB:
-                        db.close()
-                else:
-                    if self.DB:
-                        self.DB.close()
-            except:
-                print(traceback.format_exc())
-            finally:
-                pass
+            self.open_flag = False
+            for pool in (self.pools or []) + (self.reader_pools or []):
+                pool.close()
 
     def merge(self, db_path):
         pass
 
+    def merge_tasks(self, db_path):
+        """
+        拆分成可断点续传的合并任务（见 merge_coordinator），返回 None 时整体调用 merge
+        @param db_path: 新数据库路径
+        @return: List[MergeTask] | None
+        """
+        return None
+
     def __del__(self):
         self.close()
 
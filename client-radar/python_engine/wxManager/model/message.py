@@ -12,8 +12,6 @@ from dataclasses import dataclass
 from typing import List
 from datetime import datetime
 
-import xmltodict
-
 
 class MessageType:
     Unknown = -1
@@ -99,6 +97,8 @@ class Message:
         return self.talker_id.endswith('@chatroom')
 
     def to_json(self) -> dict:
+        # xmltodict 会连带导入 urllib/http，放到用到时再导入
+        import xmltodict
         try:
             xml_dict = xmltodict.parse(self.xml_content)
         except:
@@ -118,6 +118,7 @@ class Message:
         return MessageType.name(self.type)
 
     def to_text(self):
+        import xmltodict
         try:
             return f'{self.type}\n{xmltodict.parse(self.xml_content)}'
         except:
@@ -128,6 +129,23 @@ class Message:
         return self.sort_seq < other.sort_seq
 
 
+def _get_str_time(self) -> str:
+    # 查询时不再逐行调用 SQLite 的 strftime，用到时才按 timestamp 格式化
+    value = self.__dict__.get('_str_time')
+    if not value and self.timestamp:
+        value = datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S')
+        self.__dict__['_str_time'] = value
+    return value
+
+
+def _set_str_time(self, value):
+    self.__dict__['_str_time'] = value
+
+
+# dataclass 生成的 __init__ 仍然接受 str_time 参数，传入空字符串时按需计算
+Message.str_time = property(_get_str_time, _set_str_time)
+
+
 @dataclass
 class TextMessage(Message):
     # 文本消息
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 23:05
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-contact_parser.py
+@Description : 联系人附加信息解析
+
+    - v3 MicroMsg.Contact.ExTraBuf：连续的 [4 字节标签][1 字节类型][值]，从头到尾扫描一遍取出所有已知字段
+    - v4 contact.extra_buffer：protobuf，只按字段号取需要的几个字段，不构造 ContactInfo 也不转成 dict
+"""
+import traceback
+from typing import Iterable, List
+
+from wxManager.log import logger
+
+# ExTraBuf 中用到的标签
+EXTRA_BUF_TAGS = {
+    b"\x46\xCF\x10\xC4": "signature",  # 个性签名
+    b"\xA4\xD9\x02\x4A": "country",  # 国家
+    b"\xE2\xEA\xA8\xD1": "province",  # 省份
+    b"\x1D\x02\x5B\xBF": "city",  # 市
+    # b"\x81\xAE\x19\xB4": "朋友圈背景url",
+    # b"\xF9\x17\xBC\xC0": "公司名称",
+    # b"\x4E\xB9\x6D\x85": "企业微信属性",
+    # b"\x0E\x71\x9F\x13": "备注图片",
+    b"\x75\x93\x78\xAD": "telephone",  # 手机号
+    b"\x74\x75\x2C\x06": "gender",  # 性别
+}
+
+# 类型 -> 定长整数的字节数
+_FIXED_SIZE = {0x04: 4, 0x05: 8}
+# 类型 -> 带 4 字节长度的字符串编码
+_STRING_ENCODING = {0x18: 'utf-16', 0x17: 'utf-8'}
+
+
+def _empty_extra_buf():
+    return {
+        "region": ('', '', ''),
+        "signature": '',
+        "telephone": '',
+        "gender": 0,
+    }
+
+
+def _read_value(buf, off, type_):
+    """
+    @return: (值, 下一个字段的偏移)，类型未知时值为 None
+    """
+    size = _FIXED_SIZE.get(type_)
+    if size:
+        return int.from_bytes(buf[off: off + size], "little"), off + size
+    encoding = _STRING_ENCODING.get(type_)
+    if encoding:
+        length = int.from_bytes(buf[off: off + 4], "little")
+        off += 4
+        return buf[off: off + length].decode(encoding, errors='ignore').rstrip("\x00"), off + length
+    return None, -1
+
+
+def _walk_extra_buf(buf: bytes) -> dict:
+    fields = {}
+    off = 0
+    end = len(buf)
+    while off + 5 <= end and len(fields) < len(EXTRA_BUF_TAGS):
+        tag = buf[off: off + 4]
+        value, next_off = _read_value(buf, off + 5, buf[off + 4])
+        if next_off < 0:
+            break
+        name = EXTRA_BUF_TAGS.get(tag)
+        if name:
+            fields[name] = value
+        off = next_off
+    if len(fields) < len(EXTRA_BUF_TAGS) and off + 5 <= end:
+        # 遇到未知类型无法继续顺序扫描，剩下的标签逐个查找；找不到就是没有，不沿用上一个字段的偏移
+        for tag, name in EXTRA_BUF_TAGS.items():
+            if name in fields:
+                continue
+            index = buf.find(tag, off)
+            if index != -1 and index + 5 <= end:
+                value, _ = _read_value(buf, index + 5, buf[index + 4])
+                if value is not None:
+                    fields[name] = value
+    return fields
+
+
+def parse_extra_buf(buf: bytes) -> dict:
+    """
+    解析 v3 联系人 ExTraBuf
+    @param buf:
+    @return: {"region": (国家, 省份, 市), "signature": 个性签名, "telephone": 手机号, "gender": 性别}
+    """
+    if not buf:
+        return _empty_extra_buf()
+    try:
+        fields = _walk_extra_buf(buf)
+    except Exception:
+        logger.error(f'联系人解析错误:\n{traceback.format_exc()}')
+        return _empty_extra_buf()
+    gender = fields.get("gender", 0)
+    return {
+        "region": (fields.get("country", ''), fields.get("province", ''), fields.get("city", '')),
+        "signature": fields.get("signature", ''),
+        "telephone": fields.get("telephone", ''),
+        "gender": gender if isinstance(gender, int) else 0,
+    }
+
+
+def parse_extra_bufs(bufs: Iterable[bytes]) -> List[dict]:
+    """批量解析整张联系人表的 ExTraBuf，结果与输入一一对应"""
+    return [parse_extra_buf(buf) for buf in bufs]
+
+
+# v4 extra_buffer 中用到的字段，字段号见 protocbuf/contact.proto，键名与 MessageToDict 的结果一致
+CONTACT_INFO_FIELDS = {
+    2: 'gender',
+    4: 'signature',
+    5: 'country',
+    6: 'province',
+    7: 'city',
+    30: 'labelList',
+}
+
+
+def _read_varint(buf, off):
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[off]
+        off += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, off
+        shift += 7
+        if shift > 63:
+            raise ValueError('varint 过长')
+
+
+def parse_contact_info(buf: bytes) -> dict:
+    """
+    解析 v4 联系人 extra_buffer，只取 CONTACT_INFO_FIELDS 中的字段
+    @param buf:
+    @return: 与 MessageToDict(ContactInfo) 相同的键，没有的字段不在结果中；数据损坏时返回空 dict
+    """
+    result = {}
+    if not buf:
+        return result
+    off = 0
+    end = len(buf)
+    try:
+        while off < end:
+            key, off = _read_varint(buf, off)
+            field, wire_type = key >> 3, key & 0x07
+            if wire_type == 0:
+                value, off = _read_varint(buf, off)
+            elif wire_type == 2:
+                length, off = _read_varint(buf, off)
+                if off + length > end:
+                    raise ValueError('长度越界')
+                value = buf[off: off + length]
+                off += length
+            elif wire_type == 1:
+                value, off = None, off + 8
+            elif wire_type == 5:
+                value, off = None, off + 4
+            else:
+                raise ValueError(f'未知的 wire type {wire_type}')
+            name = CONTACT_INFO_FIELDS.get(field)
+            if name is None:
+                continue
+            if wire_type == 2:
+                value = value.decode('utf-8')
+                if value:
+                    result[name] = value
+            elif wire_type == 0 and value:
+                result[name] = value
+        if off > end:
+            raise ValueError('数据截断')
+    except (ValueError, IndexError, UnicodeDecodeError):
+        return {}
+    return result
+
+
+def parse_contact_infos(bufs: Iterable[bytes]) -> List[dict]:
+    """批量解析整张联系人表的 extra_buffer，结果与输入一一对应"""
+    return [parse_contact_info(buf) for buf in bufs]
+
+
+if __name__ == '__main__':
+    pass
@@ -11,14 +11,34 @@
 import base64
 import re
 import traceback
+from functools import lru_cache
 
 import xmltodict
-from google.protobuf.json_format import MessageToDict
 
 from wxManager.log import logger
 from wxManager.parser.util.protocbuf import emoji_desc_pb2
 
 
+@lru_cache(maxsize=4096)
+def decode_emoji_desc(desc_bs64: str) -> str:
+    """
+    同一个表情的 @desc 都相同，解析结果缓存起来
+    @param desc_bs64: 表情 xml 中的 @desc
+    @return: 第一个非空的描述
+    """
+    if not desc_bs64:
+        return ''
+    # 逆天微信，竟然把protobuf数据用base64编码后放入xml里
+    desc_bytes_proto = base64.b64decode(desc_bs64)
+    message = emoji_desc_pb2.EmojiDescData()
+    # 解析二进制数据
+    message.ParseFromString(desc_bytes_proto)
+    for item in message.descItem:
+        if item.desc:
+            return item.desc
+    return ''
+
+
 def parser_emoji(xml_content):
     result = {
         'md5': 0,
@@ -50,19 +70,7 @@ def parser_emoji(xml_content):
         else:
             md5 = emoji_dic.get('@md5', '')
         # logger.error(xml_dict)
-        desc_bs64 = emoji_dic.get('@desc', '')
-        desc = ''
-        if desc_bs64:
-            # 逆天微信，竟然把protobuf数据用base64编码后放入xml里
-            desc_bytes_proto = base64.b64decode(desc_bs64)
-            message = emoji_desc_pb2.EmojiDescData()
-            # 解析二进制数据
-            message.ParseFromString(desc_bytes_proto)
-            dict_output = MessageToDict(message)
-            for item in dict_output.get('descItem', []):
-                desc = item.get('desc', '')
-                if desc:
-                    break
+        desc = decode_emoji_desc(emoji_dic.get('@desc', ''))
         result = {
             'md5': md5,
             'url': emoji_dic.get('@cdnurl', ''),
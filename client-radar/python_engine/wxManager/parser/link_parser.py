@@ -18,6 +18,7 @@ from typing import List
 import xmltodict
 
 from wxManager.log import logger
+from wxManager.parser.util.lz4_block import decompress as decompress_CompressContent
 from wxManager.model import *
 
 
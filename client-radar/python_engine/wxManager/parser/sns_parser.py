@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 10:12
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-sns_parser.py
+@Description : 朋友圈 TimelineObject 解析，只提取正文(contentDesc)和媒体列表(mediaList)
+"""
+import os
+import re
+import xml.etree.ElementTree as ET
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Iterable, Iterator
+
+# XML 1.0 不允许的控制字符(保留 \t \n \r)
+_CONTROL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# 只截取需要的片段，不再对整条 TimelineObject 做完整解析(不同版本大小写不一致)
+_CONTENT_DESC_TAGS = ('contentDesc', 'ContentDesc')
+_MEDIA_LIST_TAGS = ('mediaList', 'MediaList')
+
+# 媒体类型，2=图片，6=视频
+MEDIA_TYPE_VIDEO = '6'
+
+# 少于该数量时直接在当前进程解析，进程池的启动开销反而更大
+BATCH_PROCESS_THRESHOLD = 2000
+
+
+def scrub_xml(xml_str: str) -> str:
+    """
+    清洗 XML 中的非法控制字符
+    @param xml_str:
+    @return:
+    """
+    return _CONTROL_CHARS.sub('', xml_str)
+
+
+def _slice_element(xml_str: str, tags) -> str:
+    # str.find 比带 re.I 的非贪婪正则快一个数量级
+    for tag in tags:
+        start = xml_str.find(f'<{tag}>')
+        if start == -1:
+            continue
+        end_tag = f'</{tag}>'
+        end = xml_str.find(end_tag, start)
+        if end == -1:
+            return ''
+        return scrub_xml(xml_str[start:end + len(end_tag)])
+    return ''
+
+
+def _child_text(node, tag) -> str:
+    # 微信不同版本大小写不一致(url/Url)，统一按小写比较
+    for child in node:
+        if child.tag.lower() == tag:
+            return (child.text or '').strip()
+    return ''
+
+
+def _parse_content_desc(xml_str: str) -> str:
+    fragment = _slice_element(xml_str, _CONTENT_DESC_TAGS)
+    if not fragment:
+        return ''
+    try:
+        return ET.fromstring(fragment).text or ''
+    except ET.ParseError:
+        return ''
+
+
+def _parse_media_list(xml_str: str) -> list:
+    fragment = _slice_element(xml_str, _MEDIA_LIST_TAGS)
+    if not fragment:
+        return []
+    try:
+        media_list = ET.fromstring(fragment)
+    except ET.ParseError:
+        return []
+    result = []
+    for media in media_list:
+        if media.tag.lower() != 'media':
+            continue
+        url = _child_text(media, 'url')
+        thumb = _child_text(media, 'thumb')
+        if not (url or thumb):
+            continue
+        result.append({
+            "type": "video" if _child_text(media, 'type') == MEDIA_TYPE_VIDEO else "image",
+            "url": url if url else thumb,
+            "thumb": thumb
+        })
+    return result
+
+
+def parse_sns_xml(xml_str) -> dict:
+    """
+    解析朋友圈 XML，提取正文和媒体（图片/视频）
+    @param xml_str: FeedsV20.Content
+    @return: {"text": 正文, "media": [{"type": image|video, "url": 原图/视频, "thumb": 缩略图}]}
+    """
+    if not xml_str:
+        return {"text": "", "media": []}
+    if isinstance(xml_str, bytes):
+        xml_str = xml_str.decode('utf-8', errors='ignore')
+    return {
+        "text": _parse_content_desc(xml_str),
+        "media": _parse_media_list(xml_str)
+    }
+
+
+def parse_sns_xml_batch(xml_list: Iterable, max_workers=None, chunksize=500, executor: Executor = None) -> List[dict]:
+    """
+    批量解析朋友圈 XML，数量较多时使用多进程
+    @param xml_list: FeedsV20.Content 列表
+    @param max_workers: 进程数，默认为 cpu 核数
+    @param chunksize: 每个进程一次处理的条数
+    @param executor: 多次调用时复用调用方的进程池，不用每批都启动进程；None 时临时创建
+    @return: 与输入顺序一致的解析结果
+    """
+    xml_list = list(xml_list)
+    if len(xml_list) < BATCH_PROCESS_THRESHOLD:
+        return [parse_sns_xml(xml_str) for xml_str in xml_list]
+    if executor is not None:
+        return list(executor.map(parse_sns_xml, xml_list, chunksize=chunksize))
+    max_workers = min(max_workers or os.cpu_count() or 1, 16)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(parse_sns_xml, xml_list, chunksize=chunksize))
+
+
+def batch_pages(pages: Iterable[list], min_size=BATCH_PROCESS_THRESHOLD) -> Iterator[list]:
+    """
+    分页读取的结果（如 Sns.iter_feeds）合并成至少 min_size 条一批，每页较小时也能批量多进程解析
+    @param pages: 每次返回一页的可迭代对象
+    @param min_size:
+    @return: 生成器，最后一批可能不足 min_size 条
+    """
+    batch = []
+    for page in pages:
+        batch.extend(page)
+        if len(batch) >= min_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+if __name__ == '__main__':
+    pass
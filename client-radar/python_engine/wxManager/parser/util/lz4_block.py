@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 22:40
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-lz4_block.py
+@Description : v3 MSG.CompressContent 的 lz4 解压
+
+    CompressContent 是不带长度头的 lz4 block，解压时必须给出输出缓冲区大小：
+    - 原来固定给压缩数据长度的 1024 倍，每一行都会申请一块很大的内存
+    - 这里每个线程记住最近的压缩比，按它估计缓冲区大小，不够时再放大重试
+    - lz4 每个字节最多展开约 255 字节，缓冲区不会超过 255 倍
+"""
+import threading
+from typing import Iterable, List
+
+import lz4.block
+
+MIN_RATIO = 4
+MAX_RATIO = 255
+# 缓冲区不够时放大的倍数
+GROWTH = 4
+# 额外的缓冲区，避免很短的数据估计得太小
+SLACK = 64
+
+_local = threading.local()
+
+
+def _grow(data, size, limit) -> bytes:
+    """缓冲区不够时按 GROWTH 倍放大重试，直到 lz4 的上限"""
+    while size < limit:
+        size = min(size * GROWTH, limit)
+        try:
+            return lz4.block.decompress(data, uncompressed_size=size)
+        except lz4.block.LZ4BlockError:
+            continue
+    raise lz4.block.LZ4BlockError('lz4 数据损坏')
+
+
+def decompress_block(data, size_hint=0) -> bytes:
+    """
+    @param data: lz4 block
+    @param size_hint: 已知的解压后大小，为 0 时按本线程的压缩比估计
+    @return: 解压后的数据
+    @raise lz4.block.LZ4BlockError: 数据损坏
+    """
+    try:
+        ratio = _local.ratio
+    except AttributeError:
+        ratio = _local.ratio = MIN_RATIO
+    length = len(data)
+    size = size_hint or length * ratio + SLACK
+    try:
+        dst = lz4.block.decompress(data, uncompressed_size=size)
+    except lz4.block.LZ4BlockError:
+        dst = _grow(data, size, length * MAX_RATIO + SLACK)
+    if length:
+        observed = len(dst) // length + 1
+        if observed > ratio:
+            _local.ratio = min(observed, MAX_RATIO)
+        elif observed * 2 < ratio:
+            # 压缩比慢慢回落，偶尔一条压缩比很高的消息不会让后面的缓冲区一直偏大
+            _local.ratio = ratio - 1
+    return dst
+
+
+def to_text(dst: bytes) -> str:
+    """
+    去掉 \\x00 后解码，\\x00 只在末尾（最常见的情况）时直接解码前面的部分，不再复制整个字符串
+    """
+    index = dst.find(b'\x00')
+    if index == -1:
+        return dst.decode()
+    if dst.count(b'\x00', index) == len(dst) - index:
+        return str(memoryview(dst)[:index], 'utf-8')
+    return dst.replace(b'\x00', b'').decode()
+
+
+def decompress(data, size_hint=0) -> str:
+    """
+    解压缩Msg：CompressContent内容
+    @param data: CompressContent，str 原样返回
+    @param size_hint: 已知的解压后大小
+    @return: xml，失败时返回空字符串
+    """
+    if data is None:
+        return ""
+    if isinstance(data, str):
+        return data
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        return ""
+    try:
+        return to_text(decompress_block(data, size_hint))
+    except (lz4.block.LZ4BlockError, UnicodeDecodeError):
+        print(
+            "Decompression failed: potentially corrupt input or insufficient buffer size."
+        )
+        return ""
+
+
+def decompress_many(values: Iterable) -> List[str]:
+    """批量解压，同一批数据共用本线程的压缩比估计"""
+    return [decompress(value) for value in values]
+
+
+def decompress_rows(rows: Iterable, index=11) -> List[str]:
+    """
+    批量解压查询结果中的 CompressContent 列
+    @param rows: MSG 查询结果
+    @param index: CompressContent 所在列，Msg.columns 中为 11
+    @return: 与 rows 一一对应的 xml
+    """
+    return [decompress(row[index]) for row in rows]
+
+
+if __name__ == '__main__':
+    pass
@@ -11,7 +11,6 @@
 import hashlib
 import os
 from abc import ABC, abstractmethod
-import lz4.block
 import xmltodict
 
 from wxManager.model.message import BusinessCardMessage, VoipMessage, MergedMessage, WeChatVideoMessage, \
@@ -21,6 +20,7 @@ from wxManager.parser.link_parser import parser_link, parser_applet, parser_busi
     parser_file, parser_favorite_note, parser_pat, parser_music
 from wxManager.parser.util.protocbuf.msg_pb2 import MessageBytesExtra
 from wxManager.parser.wechat_v4 import LimitedDict
+from wxManager.parser.util.lz4_block import decompress
 from .audio_parser import parser_audio
 from .emoji_parser import parser_emoji
 from .file_parser import parse_video
@@ -37,29 +37,6 @@ source,message_content,compress_content"
 '''
 
 
-def decompress(data):
-    """
-    解压缩Msg：CompressContent内容
-    :param data:
-    :return:
-    """
-    if data is None:
-        return ""
-    if isinstance(data, str):
-        return data
-    if not isinstance(data, bytes):
-        return ""
-    try:
-        dst = lz4.block.decompress(data, uncompressed_size=len(data) << 10)
-        decoded_string = dst.decode().replace("\x00", "")  # Remove any null characters
-    except:
-        print(
-            "Decompression failed: potentially corrupt input or insufficient buffer size."
-        )
-        return ""
-    return decoded_string
-
-
 # 定义抽象工厂基类
 class MessageFactory(ABC):
     @abstractmethod
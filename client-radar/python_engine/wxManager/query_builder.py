@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/19 21:10
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-query_builder.py
+@Description : 聊天记录、朋友圈、收藏按时间范围查询的 SQL 拼装
+
+    - 时间范围一律用参数绑定，不把数字拼进 SQL，同一条语句可以复用 SQLite 的语句缓存
+    - ensure_index 在第一次查询某张表前补上范围查询需要的索引，已有以这些列开头的索引时不再建
+    - explain / full_scans 返回 EXPLAIN QUERY PLAN 的结果，用于检查查询是否走了索引
+"""
+import sqlite3
+from datetime import date, datetime
+from typing import List, Tuple
+
+from wxManager.log import logger
+
+
+def to_timestamp(time_input) -> int:
+    """
+    @param time_input: 时间戳、'%Y-%m-%d %H:%M:%S' 格式的字符串或 date/datetime
+    @return: 秒级时间戳，无法识别时返回 -1
+    """
+    if isinstance(time_input, (int, float)):
+        return int(time_input)
+    if isinstance(time_input, str):
+        try:
+            return int(datetime.strptime(time_input, '%Y-%m-%d %H:%M:%S').timestamp())
+        except ValueError:
+            print("Error: Unsupported date format")
+            return -1
+    if isinstance(time_input, datetime):
+        return int(time_input.timestamp())
+    if isinstance(time_input, date):
+        return int(datetime.combine(time_input, datetime.min.time()).timestamp())
+    print("Error: Unsupported input type")
+    return -1
+
+
+def convert_to_timestamp(time_range) -> Tuple[int, int]:
+    if not time_range:
+        return 0, 0
+    return to_timestamp(time_range[0]), to_timestamp(time_range[1])
+
+
+def format_time(timestamp, fmt='%Y-%m-%d %H:%M:%S') -> str:
+    """与 SQLite 的 strftime(fmt, ts, 'unixepoch', 'localtime') 结果相同"""
+    try:
+        return datetime.fromtimestamp(timestamp).strftime(fmt)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return ''
+
+
+class Query:
+    """
+    使用示例：
+    sql, params = (Query(columns, 'MSG')
+                   .where('StrTalker = ?', username)
+                   .time_range('CreateTime', time_range)
+                   .order_by('CreateTime')
+                   .build())
+    """
+
+    def __init__(self, columns, table):
+        self.columns = columns
+        self.table = table
+        self.joins = []
+        self.conditions = []
+        self.params = []
+        self._order_by = ''
+        self._limit = None
+
+    def join(self, clause):
+        self.joins.append(clause)
+        return self
+
+    def where(self, condition, *params):
+        self.conditions.append(condition)
+        self.params.extend(params)
+        return self
+
+    def time_range(self, column, time_range):
+        """
+        开区间 (start, end)，与原来的 create_time>start AND create_time<end 一致
+        @param column: 时间戳列
+        @param time_range: (start, end)，为空时不限制
+        """
+        if time_range:
+            start_time, end_time = convert_to_timestamp(time_range)
+            self.where(f'{column} > ?', start_time)
+            self.where(f'{column} < ?', end_time)
+        return self
+
+    def order_by(self, clause):
+        self._order_by = clause
+        return self
+
+    def limit(self, num):
+        self._limit = num
+        return self
+
+    def build(self) -> Tuple[str, list]:
+        parts = [f'select {self.columns}', f'from {self.table}']
+        parts.extend(self.joins)
+        if self.conditions:
+            parts.append('where ' + ' AND '.join(self.conditions))
+        if self._order_by:
+            parts.append(f'order by {self._order_by}')
+        params = list(self.params)
+        if self._limit is not None:
+            parts.append('limit ?')
+            params.append(self._limit)
+        return '\n'.join(parts), params
+
+    def fetchall(self, cursor) -> list:
+        sql, params = self.build()
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def ensure_index(conn, table_name, columns) -> bool:
+    """
+    没有以 columns 开头的索引时创建一个
+    @param conn: 可写的连接
+    @param table_name:
+    @param columns: 列名元组，如 ('StrTalker', 'CreateTime')
+    @return: 是否有可用的索引
+    """
+    columns = tuple(columns)
+    try:
+        for index in conn.execute(f'PRAGMA index_list("{table_name}")').fetchall():
+            index_columns = tuple(row[2] for row in conn.execute(f'PRAGMA index_info("{index[1]}")').fetchall())
+            if index_columns[:len(columns)] == columns:
+                return True
+        index_name = f'{table_name}_{"_".join(columns)}_idx'
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({", ".join(columns)})')
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        # 只读或损坏的数据库建不了索引，查询退化为全表扫描
+        logger.error(f'{table_name} 创建索引 {columns} 失败: {e}')
+        return False
+
+
+def explain(conn, sql, params=()) -> List[str]:
+    """
+    @return: EXPLAIN QUERY PLAN 每一步的描述，如 'SEARCH MSG USING INDEX ...'
+    """
+    return [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, list(params)).fetchall()]
+
+
+def full_scans(conn, sql, params=()) -> List[str]:
+    """
+    查询计划中全表扫描的步骤，为空表示所有表都走了索引
+    """
+    return [detail for detail in explain(conn, sql, params) if detail.startswith('SCAN ')]
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/20 0:40
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-sync_scheduler.py
+@Description : 多账号并行同步
+
+每个登录的账号一条流水线：key 校验 → 解密 → 建索引 → 导出
+    - 所有账号共用一个有界进程池，每个阶段都是池中的任务；解密按数据库文件拆分，各账号轮流提交，
+      文件多的账号不会占满队列，N 个账号的总耗时约等于最慢的那一个
+    - I/O 限流：同时在解密的源文件总大小不超过 max_inflight_bytes（v3 解密会把整个文件读进内存），
+      每个账号同时最多 per_account 个任务
+    - 每个账号的阶段、进度、耗时、错误记录在 AccountStatus 中，通过回调和 sync_status.json 查看
+"""
+import json
+import os
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List
+
+from wxManager.log import logger
+
+STAGES = ('key', 'decrypt', 'index', 'export')
+
+STATE_PENDING = 'pending'
+STATE_RUNNING = 'running'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+STATUS_FILE = 'sync_status.json'
+SESSIONS_FILE = 'sessions.json'
+
+DEFAULT_INFLIGHT_BYTES = 512 * 1024 * 1024
+DEFAULT_PER_ACCOUNT = 4
+
+
+def collect_accounts(version_list) -> List[dict]:
+    """
+    枚举所有登录的微信进程（v3 WeChat.exe 和 v4 Weixin.exe）
+    @param version_list: version_list.json
+    @return: read_info / get_info_v4 的结果，另加 db_version: 3 或 4
+    """
+    from wxManager.decrypt.get_wx_info import read_info, get_info_v4
+
+    accounts = []
+    for db_version, infos in ((3, read_info(version_list)), (4, get_info_v4())):
+        for info in infos:
+            info['db_version'] = db_version
+            accounts.append(info)
+    return accounts
+
+
+def source_dir(info) -> str:
+    """v3 的数据库在 <wx_dir>/Msg 下，v4 的 wx_dir 就是 db_storage"""
+    return os.path.join(info['wx_dir'], 'Msg') if info['db_version'] == 3 else info['wx_dir']
+
+
+def key_check_path(info) -> str:
+    if info['db_version'] == 3:
+        return os.path.join(source_dir(info), 'MicroMsg.db')
+    return os.path.join(source_dir(info), 'message', 'message_0.db')
+
+
+def check_key(db_version, key, db_path) -> bool:
+    """key 阶段：用源数据库第一页校验 key，错误的 key 不必解密整个账号才发现"""
+    from wxManager.decrypt.key_verifier import check_key_v3, check_key_v4, PAGE_SIZE
+
+    with open(db_path, 'rb') as f:
+        buf = f.read(PAGE_SIZE)
+    check = check_key_v3 if db_version == 3 else check_key_v4
+    return len(buf) == PAGE_SIZE and check(bytes.fromhex(key), buf)
+
+
+def decrypt_file(db_version, key, src_path, dest_path) -> bool:
+    """decrypt 阶段：解密一个数据库文件，有 WAL 时连同已提交的帧一起解密，有页一直在写入时返回 False"""
+    from wxManager.decrypt.snapshot import has_wal, snapshot_db_file
+    if has_wal(src_path):
+        try:
+            snapshot_db_file(db_version, key, src_path, dest_path, incremental=False)
+            return True
+        except ValueError as e:
+            logger.error(f'{src_path} 解密失败: {e}')
+            return False
+    if db_version == 3:
+        from wxManager.decrypt.decrypt_v3 import decrypt_db_file_v3
+        success, _ = decrypt_db_file_v3(key, src_path, dest_path)
+        return success
+    from wxManager.decrypt.decrypt_v4 import decrypt_db_file_v4
+    return bool(decrypt_db_file_v4(key, src_path, dest_path))
+
+
+def build_indexes(db_version, db_dir):
+    """index 阶段：提前建好按会话、按时间查询用的索引和分片目录，界面第一次打开时不用再等"""
+    if db_version == 3:
+        from wxManager.manager_v3 import DataBaseV3
+        database = DataBaseV3()
+        database.init_database(db_dir)
+        database.msg_db.prepare_indexes()
+        database.close()
+    else:
+        from wxManager.manager_v4 import DataBaseV4
+        database = DataBaseV4()
+        database.init_database(db_dir)
+        database.message_db.catalog.refresh()
+        database.biz_message_db.catalog.refresh()
+        database.message_db.close()
+        database.biz_message_db.close()
+
+
+def export_sessions(db_version, db_dir) -> int:
+    """
+    默认的 export 阶段：导出侧边栏会话列表到 <db_dir>/sessions.json
+    @return: 会话数
+    """
+    if db_version == 3:
+        from wxManager.manager_v3 import DataBaseV3 as DataBase
+    else:
+        from wxManager.manager_v4 import DataBaseV4 as DataBase
+    database = DataBase()
+    database.init_database(db_dir)
+    sessions = database.get_sessions_enriched()
+    tmp_path = os.path.join(db_dir, SESSIONS_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(sessions, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(db_dir, SESSIONS_FILE))
+    return len(sessions)
+
+
+def export_in_memory(exporter, db_version, key, src_dir, db_dir):
+    """in_memory 模式的 export 阶段：联系人、会话等数据库在本进程中解密到内存，导出后释放"""
+    from wxManager.decrypt.memory import load_databases_in_memory, release_databases
+
+    loaded = load_databases_in_memory(db_version, key, src_dir, db_dir)
+    try:
+        return exporter(db_version, db_dir)
+    finally:
+        release_databases(loaded)
+
+
+def write_account_info(info, output_dir):
+    """写入 info.json，DataBaseV3/V4.init_database 从这里加载自己的信息，已有的 xor_key 等字段保留"""
+    path = os.path.join(output_dir, 'info.json')
+    data = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+    data.update({
+        'username': info.get('wxid', ''),
+        'nickname': info.get('name', ''),
+        'wx_dir': info.get('wx_dir', ''),
+    })
+    data.setdefault('xor_key', 0)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+class AccountStatus:
+    def __init__(self, wxid, db_version):
+        self.wxid = wxid
+        self.db_version = db_version
+        self.stage = STAGES[0]
+        self.state = STATE_PENDING
+        self.files_total = 0
+        self.files_done = 0
+        self.files_failed: List[str] = []
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.stage_seconds: Dict[str, float] = {}
+        self.error = ''
+        self.result = None
+
+    def to_json(self):
+        return {
+            'wxid': self.wxid,
+            'db_version': self.db_version,
+            'stage': self.stage,
+            'state': self.state,
+            'files_total': self.files_total,
+            'files_done': self.files_done,
+            'files_failed': self.files_failed,
+            'bytes_total': self.bytes_total,
+            'bytes_done': self.bytes_done,
+            'stage_seconds': self.stage_seconds,
+            'error': self.error,
+            'result': self.result,
+        }
+
+
+class AccountPipeline:
+    """一个账号的流水线状态，只在调度线程中访问"""
+
+    def __init__(self, info, output_dir):
+        self.info = info
+        self.db_version = info['db_version']
+        self.key = info.get('key') or ''
+        self.output_dir = output_dir
+        self.status = AccountStatus(info.get('wxid', ''), self.db_version)
+        self.queue = deque()  # 待提交的解密任务 (src_path, dest_path, size)
+        self.running = 0
+        self.stage_start = 0.0
+
+    def plan_decrypt(self, in_memory=False):
+        """
+        列出需要解密的数据库文件，目录结构与源目录一致
+        @param in_memory: 为 True 时跳过 MEMORY_DATABASES，以前解密出的明文副本一并删除
+        """
+        from wxManager.decrypt.memory import is_memory_database, remove_plaintext
+
+        src_dir = source_dir(self.info)
+        tasks = []
+        for root, dirs, files in os.walk(src_dir):
+            for file in files:
+                if not file.endswith('.db'):
+                    continue
+                src_path = os.path.join(root, file)
+                if in_memory and is_memory_database(self.db_version, os.path.relpath(src_path, src_dir)):
+                    remove_plaintext(os.path.join(self.output_dir, os.path.relpath(src_path, src_dir)))
+                    continue
+                dest_sub_dir = os.path.join(self.output_dir, os.path.relpath(root, src_dir))
+                os.makedirs(dest_sub_dir, exist_ok=True)
+                try:
+                    size = os.path.getsize(src_path)
+                except OSError:
+                    continue
+                tasks.append((src_path, os.path.join(dest_sub_dir, file), size))
+        # 大文件先提交，避免最后只剩一个大文件在跑
+        tasks.sort(key=lambda task: task[2], reverse=True)
+        self.queue.extend(tasks)
+        self.status.files_total = len(tasks)
+        self.status.bytes_total = sum(task[2] for task in tasks)
+
+    def write_info(self):
+        write_account_info(self.info, self.output_dir)
+
+
+class SyncScheduler:
+    """
+    使用示例：
+    scheduler = SyncScheduler(output_root)
+    for info in collect_accounts(version_list):
+        scheduler.add_account(info)
+    statuses = scheduler.run()
+    """
+
+    def __init__(self, output_root, max_workers=None, max_inflight_bytes=DEFAULT_INFLIGHT_BYTES,
+                 per_account=DEFAULT_PER_ACCOUNT, exporter: Callable = export_sessions,
+                 on_status: Callable[[AccountStatus], None] = None, in_memory=False):
+        """
+        @param output_root: 每个账号解密到 <output_root>/<wxid>
+        @param max_workers: 进程池大小，所有账号共用，默认为 cpu 核数
+        @param max_inflight_bytes: 同时在解密的源文件总字节数上限，单个文件超过上限时独占
+        @param per_account: 每个账号同时在池中的任务数上限
+        @param exporter: export 阶段在进程池中调用 exporter(db_version, db_dir)，需要是模块级函数；None 表示跳过
+        @param on_status: 账号状态变化时在调度线程中回调
+        @param in_memory: 为 True 时联系人、会话等中小数据库（decrypt.memory.MEMORY_DATABASES）不解密到磁盘，
+                          export 阶段直接解密到内存中使用
+        """
+        self.output_root = output_root
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_inflight_bytes = max_inflight_bytes
+        self.per_account = max(1, per_account)
+        self.exporter = exporter
+        self.on_status = on_status
+        self.in_memory = in_memory
+        self.pipelines: List[AccountPipeline] = []
+        self.inflight_bytes = 0
+
+    def add_account(self, info) -> AccountStatus:
+        """
+        @param info: collect_accounts 的一项
+        @return: 该账号的状态对象，run 过程中会被更新
+        """
+        wxid = info.get('wxid') or ''
+        pipeline = AccountPipeline(info, os.path.join(self.output_root, wxid or f'unknown_{len(self.pipelines)}'))
+        self.pipelines.append(pipeline)
+        if info.get('errcode') != 200 or not wxid or not pipeline.key or pipeline.key == 'None':
+            pipeline.status.state = STATE_FAILED
+            pipeline.status.error = info.get('errmsg') or '未获取到密钥'
+        return pipeline.status
+
+    def statuses(self) -> List[dict]:
+        return [pipeline.status.to_json() for pipeline in self.pipelines]
+
+    def _report(self, pipeline: AccountPipeline):
+        if self.on_status:
+            try:
+                self.on_status(pipeline.status)
+            except Exception:
+                logger.error(traceback.format_exc())
+        os.makedirs(self.output_root, exist_ok=True)
+        path = os.path.join(self.output_root, STATUS_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.statuses(), f, ensure_ascii=False, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def _enter(self, pipeline: AccountPipeline, stage):
+        status = pipeline.status
+        if status.state == STATE_RUNNING:
+            status.stage_seconds[status.stage] = round(time.time() - pipeline.stage_start, 3)
+        status.stage = stage
+        status.state = STATE_RUNNING
+        pipeline.stage_start = time.time()
+        self._report(pipeline)
+
+    def _finish(self, pipeline: AccountPipeline, error=''):
+        status = pipeline.status
+        status.stage_seconds[status.stage] = round(time.time() - pipeline.stage_start, 3)
+        status.state = STATE_FAILED if error else STATE_DONE
+        status.error = error
+        pipeline.queue.clear()
+        self._report(pipeline)
+        if error:
+            logger.error(f'{status.wxid} 同步失败({status.stage}): {error}')
+
+    def run(self) -> List[dict]:
+        """
+        运行所有账号的流水线，阻塞到全部结束
+        @return: 每个账号的最终状态
+        """
+        active = [pipeline for pipeline in self.pipelines if pipeline.status.state == STATE_PENDING]
+        if not active:
+            return self.statuses()
+        # 账号间轮转的解密队列
+        ready = deque()
+        inflight = {}  # future -> (pipeline, stage, size, args)
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+
+            def submit(pipeline, stage, size, func, *args):
+                future = executor.submit(func, *args)
+                inflight[future] = (pipeline, stage, size, args)
+                pipeline.running += 1
+                self.inflight_bytes += size
+
+            def fill():
+                # 账号间轮流提交，直到进程池占满，或者剩下的账号都超出并发或字节预算（放回队尾等有任务完成）
+                blocked = 0
+                while ready and blocked < len(ready) and len(inflight) < self.max_workers:
+                    pipeline = ready.popleft()
+                    if not pipeline.queue:
+                        continue
+                    src_path, dest_path, size = pipeline.queue[0]
+                    over_budget = self.inflight_bytes and self.inflight_bytes + size > self.max_inflight_bytes
+                    if pipeline.running >= self.per_account or over_budget:
+                        ready.append(pipeline)
+                        blocked += 1
+                        continue
+                    blocked = 0
+                    pipeline.queue.popleft()
+                    submit(pipeline, 'decrypt', size, decrypt_file, pipeline.db_version, pipeline.key,
+                           src_path, dest_path)
+                    if pipeline.queue:
+                        ready.append(pipeline)
+
+            for pipeline in active:
+                os.makedirs(pipeline.output_dir, exist_ok=True)
+                self._enter(pipeline, 'key')
+                submit(pipeline, 'key', 0, check_key, pipeline.db_version, pipeline.key,
+                       key_check_path(pipeline.info))
+
+            while inflight:
+                done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    pipeline, stage, size, args = inflight.pop(future)
+                    pipeline.running -= 1
+                    self.inflight_bytes -= size
+                    self._on_done(pipeline, stage, size, args, future, ready, submit)
+                fill()
+        return self.statuses()
+
+    def _on_done(self, pipeline: AccountPipeline, stage, size, args, future, ready, submit):
+        status = pipeline.status
+        if status.state == STATE_FAILED:
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            if stage == 'decrypt':
+                result = False
+            else:
+                self._finish(pipeline, f'{type(e).__name__}: {e}')
+                return
+        if stage == 'key':
+            if not result:
+                self._finish(pipeline, '密钥校验失败')
+                return
+            pipeline.write_info()
+            self._enter(pipeline, 'decrypt')
+            pipeline.plan_decrypt(self.in_memory)
+            if pipeline.queue:
+                ready.append(pipeline)
+                return
+            result = True
+        elif stage == 'decrypt':
+            status.files_done += 1
+            status.bytes_done += size
+            if not result:
+                # 不是所有 .db 都是加密的，个别文件失败不影响其他数据，记录下来继续
+                status.files_failed.append(args[2])
+            if pipeline.queue or pipeline.running:
+                self._report(pipeline)
+                return
+        if stage in ('key', 'decrypt'):
+            self._enter(pipeline, 'index')
+            submit(pipeline, 'index', 0, build_indexes, pipeline.db_version, pipeline.output_dir)
+        elif stage == 'index':
+            if self.exporter is None:
+                self._finish(pipeline)
+                return
+            self._enter(pipeline, 'export')
+            if self.in_memory:
+                submit(pipeline, 'export', 0, export_in_memory, self.exporter, pipeline.db_version, pipeline.key,
+                       source_dir(pipeline.info), pipeline.output_dir)
+            else:
+                submit(pipeline, 'export', 0, self.exporter, pipeline.db_version, pipeline.output_dir)
+        elif stage == 'export':
+            status.result = result
+            self._finish(pipeline)
+
+
+def sync_accounts(accounts: List[dict], output_root, **kwargs) -> List[dict]:
+    """
+    @param accounts: collect_accounts 的结果
+    @param output_root: 每个账号解密到 <output_root>/<wxid>
+    @param kwargs: SyncScheduler 的其他参数
+    @return: 每个账号的最终状态
+    """
+    scheduler = SyncScheduler(output_root, **kwargs)
+    for info in accounts:
+        scheduler.add_account(info)
+    return scheduler.run()
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Time        : 2026/10/20 2:10
+@Author      : SiYuan
+@Email       : 863909694@qq.com
+@File        : wxManager-sync_watcher.py
+@Description : 监控微信数据库目录，有写入就增量同步
+
+    - Linux 上用 inotify（ctypes 调用 libc，不需要额外依赖），其他平台或 inotify 不可用时退化为定时比较 mtime/size
+    - 连续写入先合并：最后一次写入后安静 quiet 秒，或第一次写入后已过 max_delay 秒，才同步一次
+    - 同步一次：
+        1. 变化的文件连同 -wal 中已提交的页按页增量解密到 <output_dir>/.mirror（见 decrypt/snapshot.py）；
+           in_memory 模式下联系人、会话等中小数据库直接解密到内存（见 decrypt/memory.py），不经过镜像和合并
+        2. 用 MergeCoordinator 只把变化的文件合并进工作库 <output_dir>，按水位线只插入新行，工作库中的索引保留
+        3. 更新查询索引、分片目录，增量同步互动关系图，重新导出会话列表
+-wal、-shm 的变化算作对应 .db 的变化，每次只读取 WAL 中新追加的帧
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import shutil
+import struct
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Iterable, Set, Tuple
+
+from wxManager.decrypt.memory import MEMORY_DATABASES, decrypt_to_memory, is_memory_database, remove_plaintext
+from wxManager.decrypt.snapshot import snapshot_db_file
+from wxManager.interaction_graph import InteractionGraph
+from wxManager.log import logger
+from wxManager.model.db_model import register_memory_database
+from wxManager.sync_scheduler import source_dir, export_sessions, write_account_info
+
+MIRROR_DIR = '.mirror'
+GRAPH_FILE = 'interaction_graph.json'
+
+DEFAULT_QUIET = 1.0
+DEFAULT_MAX_DELAY = 5.0
+DEFAULT_INTERVAL = 1.0
+
+# 这些后缀的文件变化时同步对应的 .db
+DB_SUFFIXES = ('.db', '.db-wal', '.db-shm', '.db-journal')
+
+# inotify 事件，见 <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct('iIII')
+
+
+def db_path_of(path) -> str | None:
+    """xxx.db-wal -> xxx.db，不是数据库文件返回 None"""
+    for suffix in DB_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:len(path) - len(suffix)] + '.db'
+    return None
+
+
+def scan_db_files(root) -> Set[str]:
+    result = set()
+    for dir_path, dir_names, file_names in os.walk(root):
+        for file_name in file_names:
+            if file_name.endswith('.db'):
+                result.add(os.path.join(dir_path, file_name))
+    return result
+
+
+class PollingWatcher:
+    """定时比较所有数据库文件的 mtime 和大小"""
+
+    def __init__(self, root, interval=DEFAULT_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.stamps = self._scan()
+        self.next_scan = time.monotonic() + interval
+
+    def _scan(self) -> Dict[str, tuple]:
+        stamps = {}
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            for file_name in file_names:
+                if file_name.endswith(DB_SUFFIXES):
+                    path = os.path.join(dir_path, file_name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    stamps[path] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def poll(self, timeout) -> Set[str]:
+        """
+        @param timeout: 最多等待的秒数
+        @return: 变化了的文件
+        """
+        wait = self.next_scan - time.monotonic()
+        if wait > timeout:
+            time.sleep(max(timeout, 0))
+            return set()
+        if wait > 0:
+            time.sleep(wait)
+        self.next_scan = time.monotonic() + self.interval
+        stamps = self._scan()
+        changed = {path for path, stamp in stamps.items() if self.stamps.get(path) != stamp}
+        changed |= set(self.stamps) - set(stamps)
+        self.stamps = stamps
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """递归监控目录，新建的子目录自动加入监控；事件队列溢出时返回所有数据库文件"""
+
+    def __init__(self, root):
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify 只在 Linux 上可用')
+        self.root = root
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+        self.watches: Dict[int, str] = {}
+        self._add_tree(root)
+
+    def _add_tree(self, root):
+        for dir_path, dir_names, file_names in os.walk(root):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = dir_path
+            else:
+                logger.error(f'无法监控 {dir_path}: {os.strerror(ctypes.get_errno())}')
+
+    def poll(self, timeout) -> Set[str]:
+        readable, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        changed = set()
+        if not readable:
+            return changed
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size: offset + _EVENT.size + length].rstrip(b'\0')
+                offset += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed |= scan_db_files(self.root)
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                dir_path = self.watches.get(wd)
+                if dir_path is None:
+                    continue
+                path = os.path.join(dir_path, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # 新目录里可能已经有文件了
+                        self._add_tree(path)
+                        changed |= scan_db_files(path)
+                    continue
+                changed.add(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def create_watcher(root, interval=DEFAULT_INTERVAL, polling=False):
+    """
+    @param root: 监控的目录
+    @param interval: 轮询间隔
+    @param polling: 强制使用轮询
+    @return: InotifyWatcher 或 PollingWatcher
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(root, interval)
+
+
+class Debouncer:
+    """合并连续写入：最后一次变化后安静 quiet 秒，或第一次变化后已过 max_delay 秒时才触发"""
+
+    def __init__(self, quiet=DEFAULT_QUIET, max_delay=DEFAULT_MAX_DELAY):
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.paths: Set[str] = set()
+        self.first = 0.0
+        self.last = 0.0
+
+    def add(self, paths: Iterable[str], now=None):
+        paths = set(paths)
+        if not paths:
+            return
+        now = time.monotonic() if now is None else now
+        if not self.paths:
+            self.first = now
+        self.last = now
+        self.paths |= paths
+
+    def timeout(self, now=None) -> float | None:
+        """距离触发还有多少秒，没有待同步的文件时返回 None"""
+        if not self.paths:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, min(self.last + self.quiet, self.first + self.max_delay) - now)
+
+    def due(self, now=None) -> bool:
+        return self.timeout(now) == 0.0
+
+    def take(self) -> Set[str]:
+        paths, self.paths = self.paths, set()
+        return paths
+
+
+def export_graph(graph: InteractionGraph, path):
+    """与 export_full_data.py 相同的格式"""
+    data = {
+        wxid: {
+            'score': graph.engagement_score(wxid),
+            'top_interactors': graph.top_interactors(wxid, 10),
+            'mutual': graph.mutual_interactions(wxid, 10),
+        }
+        for wxid in graph.nodes
+    }
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+class SyncDaemon:
+    """
+    使用示例：
+    daemon = SyncDaemon(info, output_dir)
+    daemon.run()  # 阻塞，另一个线程中调用 daemon.stop() 结束
+    """
+
+    def __init__(self, info, output_dir, quiet=DEFAULT_QUIET, max_delay=DEFAULT_MAX_DELAY,
+                 interval=DEFAULT_INTERVAL, polling=False, exporter: Callable = export_sessions,
+                 on_sync: Callable[[dict], None] = None, in_memory=False):
+        """
+        @param info: sync_scheduler.collect_accounts 的一项
+        @param output_dir: 工作库目录，与 SyncScheduler 的 <output_root>/<wxid> 相同
+        @param quiet: 最后一次写入后等待的秒数
+        @param max_delay: 持续写入时最多等待的秒数
+        @param interval: 轮询间隔，只在不能使用 inotify 时有效
+        @param polling: 强制使用轮询
+        @param exporter: 每次同步后调用 exporter(db_version, output_dir)，None 表示不导出
+        @param on_sync: 每次同步后回调同步结果
+        @param in_memory: 为 True 时联系人、会话等中小数据库（decrypt.memory.MEMORY_DATABASES）不写镜像和工作库，
+                          有变化时直接重新解密到内存，注册在工作库中原来的路径上
+        """
+        self.info = info
+        self.db_version = info['db_version']
+        self.key = info['key']
+        self.src_dir = source_dir(info)
+        self.output_dir = output_dir
+        self.mirror_dir = os.path.join(output_dir, MIRROR_DIR)
+        self.debouncer = Debouncer(quiet, max_delay)
+        self.interval = interval
+        self.polling = polling
+        self.exporter = exporter
+        self.on_sync = on_sync
+        self.in_memory = in_memory
+        self.graph = InteractionGraph()
+        # 有校验失败页、还没有合并进工作库的镜像
+        self._unsettled: Set[str] = set()
+        self._stop = threading.Event()
+
+    def _database(self):
+        if self.db_version == 3:
+            from wxManager.manager_v3 import DataBaseV3 as DataBase
+        else:
+            from wxManager.manager_v4 import DataBaseV4 as DataBase
+        database = DataBase()
+        database.init_database(self.output_dir)
+        return database
+
+    def _relevant(self, paths: Iterable[str]) -> Set[str]:
+        result = set()
+        src_dir = os.path.abspath(self.src_dir)
+        for path in paths:
+            db_path = db_path_of(path)
+            if db_path and os.path.abspath(db_path).startswith(src_dir) and os.path.isfile(db_path):
+                result.add(db_path)
+        return result
+
+    def _load_in_memory(self, src_path) -> bool:
+        """in_memory 模式：重新解密到内存，替换工作库中原来路径上注册的数据库"""
+        name = os.path.relpath(src_path, self.src_dir)
+        try:
+            database = decrypt_to_memory(self.db_version, self.key, src_path)
+        except OSError as e:
+            logger.info(f'{src_path} 解密到内存跳过: {e}')
+            return False
+        except ValueError as e:
+            # 正在写入，下一轮再解密，这一轮继续使用上次注册的版本
+            logger.info(f'{src_path} 解密到内存跳过: {e}')
+            self.debouncer.add([src_path])
+            return False
+        register_memory_database(os.path.join(self.output_dir, name), database)
+        return True
+
+    def _decrypt(self, src_paths) -> Tuple[Dict[str, dict], Set[str], int]:
+        """
+        按页增量解密（包括 WAL）
+        @return: ({镜像路径: 解密结果}, 重新解密到内存的数据库的相对路径, 正在写入而跳过的页数)
+                 只包含有页变化、且没有校验失败页的文件；有校验失败页的镜像 B 树不完整，等下一轮全部解密成功后再合并
+        """
+        changed = {}
+        reloaded = set()
+        torn = 0
+        for src_path in sorted(src_paths):
+            name = os.path.relpath(src_path, self.src_dir)
+            if self.in_memory and is_memory_database(self.db_version, name):
+                if self._load_in_memory(src_path):
+                    reloaded.add(name)
+                continue
+            mirror_path = os.path.join(self.mirror_dir, name)
+            try:
+                result = snapshot_db_file(self.db_version, self.key, src_path, mirror_path)
+            except (OSError, ValueError) as e:
+                # 不是所有 .db 都是加密的，也可能正在被重建
+                logger.info(f'{src_path} 增量解密跳过: {e}')
+                continue
+            if result['torn']:
+                # 正在写入的页下一轮再同步，这一轮解密的其他页到时一起合并
+                self.debouncer.add([src_path])
+                self._unsettled.add(mirror_path)
+                torn += result['torn']
+                continue
+            if result['changed'] or mirror_path in self._unsettled:
+                self._unsettled.discard(mirror_path)
+                changed[mirror_path] = result
+        return changed, reloaded, torn
+
+    def _output_path(self, mirror_path):
+        return os.path.join(self.output_dir, os.path.relpath(mirror_path, self.mirror_dir))
+
+    def _copy(self, mirror_path):
+        output_path = self._output_path(mirror_path)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        shutil.copy(mirror_path, output_path + '.syncing')
+        os.replace(output_path + '.syncing', output_path)
+
+    def _merge(self, mirror_paths):
+        """
+        变化的镜像合并进工作库
+        工作库中还没有的数据库直接复制；没有合并任务的数据库（如 Sns.db）整库替换
+        """
+        to_merge = []
+        for mirror_path in mirror_paths:
+            if os.path.exists(self._output_path(mirror_path)):
+                to_merge.append(mirror_path)
+            else:
+                self._copy(mirror_path)
+        if not to_merge:
+            return
+        results = self._database().merge(self.mirror_dir, changed=to_merge) or {}
+        merged = {os.path.normcase(os.path.abspath(source))
+                  for result in results.values() if result for source in result}
+        for mirror_path in to_merge:
+            if os.path.normcase(os.path.abspath(mirror_path)) not in merged:
+                self._copy(mirror_path)
+
+    def _sync_sns_graph(self):
+        from wxManager.db_v3.sns import Sns
+        sns = Sns()
+        sns.init_database(self.output_dir)
+        if sns.open_flag:
+            self.graph.sync_sns(sns)
+            sns.close()
+
+    def _load_graph(self):
+        """
+        启动时从工作库加载已有的互动关系图
+        之后只同步有变化的数据库，不加载的话重启后第一次只有朋友圈、联系人等变化时，导出的关系图中没有消息的边
+        """
+        database = self._database()
+        message_db = database.msg_db if self.db_version == 3 else database.message_db
+        if message_db.open_flag:
+            self.graph.sync_messages(message_db)
+        if self.db_version == 3:
+            self._sync_sns_graph()
+
+    def _update_indexes(self, names: Set[str]):
+        """
+        合并后重新打开工作库，更新查询索引、分片目录和互动关系图
+        @param names: 变化的数据库相对于源目录的路径
+        """
+        names = {name.replace('\\', '/') for name in names}
+        database = self._database()
+        # 第一个分片被暂缓合并时工作库中还没有它，整个分片组打不开
+        if self.db_version == 3:
+            if any(name.startswith('Multi/MSG') for name in names) and database.msg_db.open_flag:
+                database.msg_db.prepare_indexes()
+                self.graph.sync_messages(database.msg_db)
+            if 'Sns.db' in names:
+                self._sync_sns_graph()
+        else:
+            if any(name.startswith('message/message_') for name in names) and database.message_db.open_flag:
+                database.message_db.catalog.refresh()
+                self.graph.sync_messages(database.message_db)
+            if any(name.startswith('message/biz_message_') for name in names) and database.biz_message_db.open_flag:
+                database.biz_message_db.catalog.refresh()
+        export_graph(self.graph, os.path.join(self.output_dir, GRAPH_FILE))
+        if self.exporter is not None:
+            self.exporter(self.db_version, self.output_dir)
+
+    def sync(self, paths: Iterable[str] = None) -> dict:
+        """
+        同步一次
+        @param paths: 变化的文件，None 表示源目录下所有数据库
+        @return: {'files': 有变化的文件数, 'pages': 解密的页数, 'torn': 正在写入而跳过的页数, 'seconds': 耗时}
+        """
+        start = time.time()
+        src_paths = scan_db_files(self.src_dir) if paths is None else self._relevant(paths)
+        changed, reloaded, torn = self._decrypt(src_paths)
+        if changed:
+            self._merge(changed)
+        names = {os.path.relpath(path, self.mirror_dir) for path in changed} | reloaded
+        if names:
+            self._update_indexes(names)
+        report = {
+            'wxid': self.info.get('wxid', ''),
+            'time': int(start),
+            'files': len(names),
+            'pages': sum(result['changed'] for result in changed.values()),
+            'torn': torn,
+            'seconds': round(time.time() - start, 3),
+        }
+        if names and self.on_sync:
+            self.on_sync(report)
+        return report
+
+    def run(self):
+        """先整体同步一次追上进度，之后等待文件变化"""
+        os.makedirs(self.mirror_dir, exist_ok=True)
+        write_account_info(self.info, self.output_dir)
+        if self.in_memory:
+            # 以前同步留下的明文副本
+            for name in MEMORY_DATABASES[self.db_version]:
+                remove_plaintext(os.path.join(self.output_dir, name))
+                remove_plaintext(os.path.join(self.mirror_dir, name))
+        try:
+            self._load_graph()
+        except Exception:
+            logger.error(f'加载互动关系图失败\n{traceback.format_exc()}')
+        self._safe_sync(None)
+        watcher = create_watcher(self.src_dir, self.interval, self.polling)
+        logger.info(f'开始监控 {self.src_dir} ({type(watcher).__name__})')
+        try:
+            while not self._stop.is_set():
+                timeout = self.debouncer.timeout()
+                self.debouncer.add(watcher.poll(self.interval if timeout is None else min(timeout, self.interval)))
+                if self.debouncer.due():
+                    self._safe_sync(self.debouncer.take())
+        finally:
+            watcher.close()
+
+    def _safe_sync(self, paths):
+        try:
+            return self.sync(paths)
+        except Exception:
+            logger.error(f'同步失败\n{traceback.format_exc()}')
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == '__main__':
+    pass
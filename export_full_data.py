@@ -1,7 +1,7 @@
 import os
 import json
 import traceback
-import xmltodict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 # 引用核心模块
@@ -10,47 +10,13 @@ try:
     from wxManager.decrypt.decrypt_v3 import decrypt_db_file_v3
     import wxManager.db_v3.sns as sns_module 
     from wxManager.db_v3.sns import Sns
+    from wxManager.parser.sns_parser import batch_pages, parse_sns_xml_batch
+    from wxManager.interaction_graph import InteractionGraph
+    from wxManager.chunked_export import ChunkedJsonlWriter
 except ImportError:
     print("❌ 依赖缺失：请确保 wxManager 文件夹在当前目录下，且已安装 requirements.txt")
     exit(1)
 
-def parse_sns_xml(xml_str):
-    """
-    解析朋友圈 XML，提取正文和媒体（图片/视频）
-    """
-    if not xml_str:
-        return {"text": "", "media": []}
-    
-    try:
-        data = xmltodict.parse(xml_str)
-        timeline = data.get('TimelineObject', {})
-        
-        # 1. 提取文字
-        text = timeline.get('contentDesc', '')
-        
-        # 2. 提取媒体
-        media_list = []
-        content_obj = timeline.get('ContentObject', {})
-        if content_obj and 'MediaList' in content_obj:
-            medias = content_obj['MediaList'].get('Media', [])
-            if isinstance(medias, dict):
-                medias = [medias]
-                
-            for m in medias:
-                url = m.get('Url', {}).get('#text', '')
-                thumb = m.get('Thumb', {}).get('#text', '')
-                type_code = m.get('Type', '0') # 2=图片, 6=视频
-                
-                if url or thumb:
-                    media_list.append({
-                        "type": "video" if type_code == '6' else "image",
-                        "url": url if url else thumb,
-                        "thumb": thumb
-                    })
-        return {"text": text, "media": media_list}
-    except:
-        return {"text": "XML解析异常", "media": []}
-
 def process_interactions(sns_driver, feed_id):
     """
     【新增】专门处理每条朋友圈的互动数据（点赞 & 评论）
@@ -150,66 +116,79 @@ def main():
     if not sns.open_flag:
         sns.init_database(output_dir)
 
-    feeds = sns.get_feeds()
-    
-    if not feeds:
-        print("⚠️ 数据库为空。建议在电脑上多刷一刷朋友圈再运行。")
-        return
-
-    export_list = []
-    
     # 使用 tqdm 显示进度条（如果没装 tqdm 就简单 print）
     try:
         from tqdm import tqdm
-        iterator = tqdm(feeds, desc="解析中", unit="条")
+        progress = tqdm(desc="解析中", unit="条")
     except ImportError:
-        iterator = feeds
-        print(f"共发现 {len(feeds)} 条数据，开始解析...")
-
-    for item in iterator:
-        # item: [FeedId, CreateTime, StrTime, Type, UserName, Status, StringId, Content]
-        feed_id = item[0]
-        feed_xml = item[7]
-        
-        # 1. 解析内容
-        content_data = parse_sns_xml(feed_xml)
-        
-        # 2. 【关键】获取互动数据（点赞和评论）
-        # 需要传入 feed_id (可能是 int 或 stringId，sns.py 里通常用 stringId 查询)
-        # item[6] 是 StringId (如 "138402..."), item[0] 是 FeedId (int)
-        # 根据 sns.py 的 get_comment 实现: where FeedId=? 
-        # 通常这里要传 FeedId (item[0])。如果不行再试 StringId。
-        likes, comments = process_interactions(sns, feed_id)
-        
-        # 3. 组装数据
-        feed_obj = {
-            "id": str(item[6]), # 使用 StringId 作为唯一标识更通用
-            "timestamp": item[1],
-            "date": item[2],
-            "author_wxid": item[4], # 发帖人的 wxid
-            "content": {
-                "text": content_data['text'],
-                "media": content_data['media']
-            },
-            "stats": {
-                "likes_count": len(likes),
-                "comments_count": len(comments)
-            },
-            "interactions": {
-                "likes": likes,       # 包含点赞人的 wxid
-                "comments": comments  # 包含评论人的 wxid 和内容
-            }
-        }
-        export_list.append(feed_obj)
+        progress = None
+        print("开始解析...")
 
     # --- 4. 保存 ---
-    json_path = os.path.join(output_dir, "moments_full.json")
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(export_list, f, ensure_ascii=False, indent=2)
+    # 按页读取、逐条写入分块压缩的 JSONL，内存中只保留一批数据
+    json_dir = os.path.join(output_dir, "moments_full")
+    # 进程池在第一次提交任务时才启动，朋友圈少于一批时不会用到
+    with ChunkedJsonlWriter(json_dir, time_field="timestamp") as writer, ProcessPoolExecutor() as executor:
+        for feeds in batch_pages(sns.iter_feeds()):
+            # 正文解析与数据库无关，几页合成一批后批量解析（够一批时走多进程）
+            contents = parse_sns_xml_batch((item[7] for item in feeds), executor=executor)
+            for item, content_data in zip(feeds, contents):
+                # item: [FeedId, CreateTime, StrTime, Type, UserName, Status, StringId, Content]
+                feed_id = item[0]
+
+                # 1. 【关键】获取互动数据（点赞和评论）
+                # 根据 sns.py 的 get_comment 实现: where FeedId=?，传 FeedId (item[0])
+                likes, comments = process_interactions(sns, feed_id)
+
+                # 2. 组装数据
+                feed_obj = {
+                    "id": str(item[6]), # 使用 StringId 作为唯一标识更通用
+                    "timestamp": item[1],
+                    "date": item[2],
+                    "author_wxid": item[4], # 发帖人的 wxid
+                    "content": {
+                        "text": content_data['text'],
+                        "media": content_data['media']
+                    },
+                    "stats": {
+                        "likes_count": len(likes),
+                        "comments_count": len(comments)
+                    },
+                    "interactions": {
+                        "likes": likes,       # 包含点赞人的 wxid
+                        "comments": comments  # 包含评论人的 wxid 和内容
+                    }
+                }
+                writer.write(feed_obj)
+            if progress is not None:
+                progress.update(len(feeds))
+    if progress is not None:
+        progress.close()
+
+    if not writer.count:
+        print("⚠️ 数据库为空。建议在电脑上多刷一刷朋友圈再运行。")
+        sns.close()
+        return
+
+    # --- 5. 互动关系图 (谁和谁互动最多) ---
+    graph = InteractionGraph()
+    graph.sync_sns(sns)
+    graph_export = {
+        wxid: {
+            "score": graph.engagement_score(wxid),
+            "top_interactors": graph.top_interactors(wxid, 10),
+            "mutual": graph.mutual_interactions(wxid, 10)
+        }
+        for wxid in graph.nodes
+    }
+    graph_path = os.path.join(output_dir, "interaction_graph.json")
+    with open(graph_path, "w", encoding="utf-8") as f:
+        json.dump(graph_export, f, ensure_ascii=False)
 
     print(f"\n✅ 第一阶段完成！")
-    print(f"📊 成功采集: {len(export_list)} 条朋友圈")
-    print(f"📁 数据已保存: {json_path}")
+    print(f"📊 成功采集: {writer.count} 条朋友圈")
+    print(f"📁 数据已保存: {json_dir} ({len(writer.chunks)} 个分块)")
+    print(f"🕸️ 互动关系图: {graph_path} ({len(graph)} 个联系人)")
     print("💡 提示：目前的 author_wxid 和 interactions 里的 wxid 都是微信号ID（如 wxid_xxxx）。")
     print("   后续阶段我们可以利用 Contact 表把它们替换成真实的‘微信昵称’。")
 
@@ -1,7 +1,6 @@
 import os
 import json
 import traceback
-import xmltodict
 from datetime import datetime
 
 # 引用核心模块
@@ -10,53 +9,11 @@ try:
     from wxManager.decrypt.decrypt_v3 import decrypt_db_file_v3
     import wxManager.db_v3.sns as sns_module 
     from wxManager.db_v3.sns import Sns
+    from wxManager.parser.sns_parser import parse_sns_xml
 except ImportError:
     print("❌ 请确保在项目根目录下运行，且依赖已安装。")
     exit(1)
 
-def parse_sns_xml(xml_str):
-    """
-    简单的 XML 清洗函数：提取文字和图片链接
-    """
-    if not xml_str:
-        return {"text": "", "images": []}
-    
-    try:
-        # 将 XML 转为字典
-        data = xmltodict.parse(xml_str)
-        timeline = data.get('TimelineObject', {})
-        
-        # 1. 提取文字内容
-        text = timeline.get('contentDesc', '')
-        
-        # 2. 提取媒体列表 (图片/视频)
-        media_list = []
-        content_obj = timeline.get('ContentObject', {})
-        if content_obj and 'MediaList' in content_obj:
-            medias = content_obj['MediaList'].get('Media', [])
-            # xmltodict 在只有一个子节点时返回 dict，多个时返回 list，需要兼容
-            if isinstance(medias, dict):
-                medias = [medias]
-                
-            for m in medias:
-                # 尝试获取 URL，优先取高清图(Url)，没有则取缩略图(Thumb)
-                url = m.get('Url', {}).get('#text', '')
-                thumb = m.get('Thumb', {}).get('#text', '')
-                type_code = m.get('Type', '0') # 2=图片, 6=视频
-                
-                if url or thumb:
-                    media_list.append({
-                        "type": "video" if type_code == '6' else "image",
-                        "url": url if url else thumb,
-                        "thumb": thumb
-                    })
-                    
-        return {"text": text, "media": media_list}
-        
-    except Exception as e:
-        # 解析失败这行可能不是标准朋友圈，忽略错误
-        return {"text": "解析错误或非标准格式", "images": []}
-
 def main():
     print("🚀 正在启动数据导出服务...")
 